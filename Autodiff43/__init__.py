@@ -1,4 +1,35 @@
 #!/usr/bin/env python3
 
-from .logic import *
-from .test import *
+"""
+Autodiff43 loads its modules on first use, so `import Autodiff43` does not import NumPy or any of
+the logic modules until one of the names below is accessed (PEP 562). Test code is never imported.
+"""
+import importlib
+
+# public name -> (module, attribute), None for the module itself
+_LAZY = {
+    'FMExpression': ('.logic.forward_mode', 'FMExpression'),
+    'RMExpression': ('.logic.reverse_mode', 'RMExpression'),
+    'core': ('.logic.core', None),
+    'ADMode': ('.logic.core', 'ADMode'),
+    'exp': ('.logic.core', 'exp'),
+    'grad': ('.logic.core', 'grad'),
+    'set_diff_mode': ('.logic.core', 'set_diff_mode'),
+    'agrad': ('.logic.service', 'agrad'),
+    'set_precision': ('.logic.precision', 'set_precision'),
+    'precision': ('.logic.precision', 'precision'),
+}
+
+__all__ = list(_LAZY)
+
+def __getattr__(name):
+    if (name not in _LAZY):
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module_name, attribute = _LAZY[name]
+    module = importlib.import_module(module_name, __name__)
+    value = module if attribute is None else getattr(module, attribute)
+    globals()[name] = value # later lookups skip __getattr__
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
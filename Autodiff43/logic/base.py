@@ -2,17 +2,27 @@
 
 import numpy as np
 
+from .ops import logsumexp_value, softplus_value
+from .precision import get_dtype
+
 class Expression:
     """Base class for forward-mode and reverse-mode implementions."""
     valid_scalar_types = (int, float, np.int64) # TODO: Include numpy types
     _node_count = 0 # Track the number of nodes created, used in identifier
     leafs = {}
+    __array_ufunc__ = None # Make numpy defer to our reflected operators, e.g. ndarray @ Expression
 
-    def __init__(self, value):
+    def __init__(self, value, copy = True):
         # Unpack value, which can be scalars or Expressions, into numpy array, e.g. [1, x, x+1]
         # TODO: Better handling of scalar vs. iterable types
         if (self.is_valid_scalar(value)):
             self.value = np.array([value]) # Lazy way of ensuring that input is a list
+        elif (isinstance(value, np.ndarray) and value.dtype != object):
+            # Numeric arrays keep their shape, so nodes can hold matrices and tensors. Arrays from the caller are
+            # copied, so that changing them later does not change the node, the results of operations (copy=False) are not
+            self.value = np.array(value, dtype=get_dtype()) if copy else np.asarray(value, dtype=get_dtype())
+            if (self.value.ndim == 0):
+                self.value = self.value.reshape(1)
         else:
             new_vals = []
             for f in value:
@@ -29,6 +39,9 @@ class Expression:
 
             self.value = np.array(new_vals)
 
+        # Values are always stored in the dtype of the precision policy, integer inputs included
+        self.value = self.value.astype(get_dtype(), copy=False)
+
         # Create unique identifier for object
         self.id = 'v' + str(Expression._node_count)
         
@@ -56,17 +69,17 @@ class Expression:
             new_val = self.value + var2
         # If var2 is an Expression
         elif (isinstance(var2, Expression)):
-            if (len(self.value) == len(var2.value)):
+            if (self.broadcastable(var2)):
                 new_val = self.value + var2.value
             else:
-                raise ValueError("Expressions must be vectors of the same length.")
+                raise ValueError("Expressions must have broadcast-compatible shapes.")
         else:
                 raise ValueError("Needs to be type int, float, or Expression")
         
-        return Expression(new_val)
+        return Expression(new_val, copy=False)
 
     def __radd__(self, var2):
-        return self._add__(var2)
+        return self.__add__(var2)
 
     def __sub__(self, var2):
         """
@@ -81,14 +94,14 @@ class Expression:
             new_val = self.value - var2
         # If var2 is an Expression
         elif (isinstance(var2, Expression)):
-            if (len(self.value) == len(var2.value)):
+            if (self.broadcastable(var2)):
                 new_val = self.value - var2.value
             else:
-                raise ValueError("Expressions must be vectors of the same length.")
+                raise ValueError("Expressions must have broadcast-compatible shapes.")
         else:
                 raise ValueError("Needs to be type int, float, or Expression")
         
-        return Expression(new_val)
+        return Expression(new_val, copy=False)
 
     def __rsub__(self, var2):
         """
@@ -104,7 +117,7 @@ class Expression:
         else:
             raise ValueError("Needs to be type int, float, or Expression")
         
-        return Expression(new_val)
+        return Expression(new_val, copy=False)
 
     def __mul__(self, var2):
         """
@@ -119,17 +132,17 @@ class Expression:
             new_val = self.value * var2
         # If var2 is an Expression
         elif (isinstance(var2, Expression)):
-            if (len(self.value) == len(var2.value)):
+            if (self.broadcastable(var2)):
                 new_val = self.value * var2.value
             else:
-                raise ValueError("Expressions must be vectors of the same length.")
+                raise ValueError("Expressions must have broadcast-compatible shapes.")
         else:
                 raise ValueError("Needs to be type int, float, or Expression")
         
-        return Expression(new_val)
+        return Expression(new_val, copy=False)
 
     def __rmul__(self, var2):
-        return self._mul__(var2)
+        return self.__mul__(var2)
 
     def __truediv__(self, var2):
         """
@@ -146,17 +159,17 @@ class Expression:
             new_val = self.value / var2
         # If var2 is an Expression
         elif (isinstance(var2, Expression)):
-            if (len(self.value) == len(var2.value)):
-                if (var2.value == 0):
+            if (self.broadcastable(var2)):
+                if (np.any(var2.value == 0)):
                     raise ZeroDivisionError
 
                 new_val = self.value / var2.value
             else:
-                raise ValueError("Expressions must be vectors of the same length.")
+                raise ValueError("Expressions must have broadcast-compatible shapes.")
         else:
                 raise ValueError("Needs to be type int, float, or Expression")
         
-        return Expression(new_val)
+        return Expression(new_val, copy=False)
 
     def __rtruediv__(self, var2):
         """
@@ -167,7 +180,7 @@ class Expression:
             a new Expression with the divided value
         """
 
-        if (self.value == 0):
+        if (np.any(self.value == 0)):
             raise ZeroDivisionError
         # If var2 is a scalar
         if (self.is_valid_scalar(var2)):
@@ -175,7 +188,7 @@ class Expression:
         else:
             raise ValueError("Needs to be type int, float, or Expression")
         
-        return Expression(new_val)
+        return Expression(new_val, copy=False)
 
     def __pow__(self, var2):
         """
@@ -190,14 +203,46 @@ class Expression:
             new_val = self.value ** var2
         # If var2 is an Expression
         elif (isinstance(var2, Expression)):
-            if (len(self.value) == len(var2.value)):
+            if (self.broadcastable(var2)):
                 new_val = self.value ** var2.value
             else:
-                raise ValueError("Expressions must be vectors of the same length.")
+                raise ValueError("Expressions must have broadcast-compatible shapes.")
         else:
                 raise ValueError("Needs to be type int, float, or Expression")
         
-        return Expression(new_val)
+        return Expression(new_val, copy=False)
+
+    def __matmul__(self, var2):
+        """
+        Base matrix multiplication function for Expression, represents self @ var2 with NumPy matmul rules
+        Args:
+            var2: another variable either of type Expression or a constant numpy array
+        Returns:
+            a new Expression with the matrix product
+        """
+        if (isinstance(var2, Expression)):
+            new_val = np.matmul(self.value, var2.value)
+        elif (isinstance(var2, np.ndarray)):
+            new_val = np.matmul(self.value, var2)
+        else:
+            raise ValueError("Needs to be type numpy array or Expression")
+
+        return Expression(np.atleast_1d(new_val), copy=False)
+
+    def __rmatmul__(self, var2):
+        """
+        Base reverse matrix multiplication function for Expression, in case of constant array @ Expression object
+        Args:
+            var2: a constant numpy array
+        Returns:
+            a new Expression with the matrix product
+        """
+        if (isinstance(var2, np.ndarray)):
+            new_val = np.matmul(var2, self.value)
+        else:
+            raise ValueError("Needs to be type numpy array or Expression")
+
+        return Expression(np.atleast_1d(new_val), copy=False)
 
     def __neg__(self):
         """
@@ -208,7 +253,17 @@ class Expression:
             a new Expression with the negated value
         """
         new_val = self.value * -1
-        return Expression(new_val)
+        return Expression(new_val, copy=False)
+
+    def __getitem__(self, index):
+        """
+        Base indexing function for Expression, selects elements of the value with any NumPy index
+        Args:
+            index: an integer, slice, array of indices or boolean mask, or a tuple of those
+        Returns:
+            a new Expression with the selected values
+        """
+        return Expression(np.atleast_1d(self.value[index]), copy=False)
 
     def exp(self, var2 = None):
         """
@@ -224,14 +279,14 @@ class Expression:
         elif (self.is_valid_scalar(var2)):
             new_val = var2 ** self.value
         elif (isinstance(var2, Expression)):
-            if (len(self.value) == len(var2.value)):
+            if (self.broadcastable(var2)):
                 new_val = var2.value ** self.value
             else:
-                raise ValueError("Expressions must be vectors of the same length.")
+                raise ValueError("Expressions must have broadcast-compatible shapes.")
         else:
                 raise ValueError("Needs to be type int, float, or Expression")
 
-        return Expression(new_val)
+        return Expression(new_val, copy=False)
 
     def sin(self):
         """
@@ -242,7 +297,7 @@ class Expression:
             a new Expression with the sin value
         """
         new_val = np.sin(self.value)
-        return Expression(new_val)
+        return Expression(new_val, copy=False)
 
     def cos(self):
         """
@@ -253,7 +308,7 @@ class Expression:
             a new Expression with the cos value
         """
         new_val = np.cos(self.value)
-        return Expression(new_val)
+        return Expression(new_val, copy=False)
 
     def tan(self):
         """
@@ -264,7 +319,7 @@ class Expression:
             a new Expression with the tan value
         """
         new_val = np.tan(self.value)
-        return Expression(new_val)
+        return Expression(new_val, copy=False)
 
     def arcsin(self):
         """
@@ -275,7 +330,7 @@ class Expression:
             a new Expression with the arcsin value
         """
         new_val = np.arcsin(self.value)
-        return Expression(new_val)
+        return Expression(new_val, copy=False)
 
     def arccos(self):
         """
@@ -286,7 +341,7 @@ class Expression:
             a new Expression with the arccos value
         """
         new_val = np.arccos(self.value)
-        return Expression(new_val)
+        return Expression(new_val, copy=False)
 
     def arctan(self):
         """
@@ -297,7 +352,7 @@ class Expression:
             a new Expression with the arctan value
         """
         new_val = np.arctan(self.value)
-        return Expression(new_val)
+        return Expression(new_val, copy=False)
 
     def sinh(self):
         """
@@ -308,7 +363,7 @@ class Expression:
             a new Expression with the sinh value
         """
         new_val = np.sinh(self.value)
-        return Expression(new_val)
+        return Expression(new_val, copy=False)
 
     def cosh(self):
         """
@@ -319,7 +374,7 @@ class Expression:
             a new Expression with the cosh value
         """
         new_val = np.cosh(self.value)
-        return Expression(new_val)
+        return Expression(new_val, copy=False)
 
     def tanh(self):
         """
@@ -330,7 +385,7 @@ class Expression:
             a new Expression with the tanh value
         """
         new_val = np.tanh(self.value)
-        return Expression(new_val)
+        return Expression(new_val, copy=False)
 
     def sigmoid(self):
         """
@@ -341,7 +396,7 @@ class Expression:
             a new Expression with the sigmoid value
         """
         new_val = 1 / (1 + np.exp(-self.value))
-        return Expression(new_val)
+        return Expression(new_val, copy=False)
 
     def log(self, var2 = None):
         """
@@ -357,14 +412,14 @@ class Expression:
         elif (self.is_valid_scalar(var2)):
             new_val = np.log(self.value) / np.log(var2)
         elif (isinstance(var2, Expression)):
-            if (len(self.value) == len(var2.value)):
+            if (self.broadcastable(var2)):
                 new_val = np.log(self.value) / np.log(var2.value)
             else:
-                raise ValueError("Expressions must be vectors of the same length.")
+                raise ValueError("Expressions must have broadcast-compatible shapes.")
         else:
                 raise ValueError("Needs to be type int, float, or Expression")
 
-        return Expression(new_val)
+        return Expression(new_val, copy=False)
 
     def sqrt(self):
         """
@@ -376,6 +431,143 @@ class Expression:
         """
         return self.__pow__(0.5)
 
+    def sum(self):
+        """
+        Base sum function for Expression, sums all the values into a single node
+        Args:
+            None
+        Returns:
+            a new Expression with the sum as a one element vector
+        """
+        return Expression(np.array([np.sum(self.value)]), copy=False)
+
+    def mean(self):
+        """
+        Base mean function for Expression, averages all the values into a single node
+        Args:
+            None
+        Returns:
+            a new Expression with the mean as a one element vector
+        """
+        return Expression(np.array([np.mean(self.value)]), copy=False)
+
+    def prod(self):
+        """
+        Base product function for Expression, multiplies all the values into a single node
+        Args:
+            None
+        Returns:
+            a new Expression with the product as a one element vector
+        """
+        return Expression(np.array([np.prod(self.value)]), copy=False)
+
+    def norm(self):
+        """
+        Base norm function for Expression, the Euclidean (Frobenius for matrices) norm of all the values
+        Args:
+            None
+        Returns:
+            a new Expression with the norm as a one element vector
+        """
+        return Expression(np.array([np.sqrt(np.sum(self.value * self.value))]), copy=False)
+
+    def dot(self, var2):
+        """
+        Base dot product function for Expression, sums the elementwise product of the values
+        Args:
+            var2: another variable either of type Expression or a constant numpy array
+        Returns:
+            a new Expression with the dot product as a one element vector
+        """
+        if (isinstance(var2, Expression)):
+            if (not self.broadcastable(var2)):
+                raise ValueError("Expressions must have broadcast-compatible shapes.")
+            new_val = np.sum(self.value * var2.value)
+        elif (isinstance(var2, np.ndarray)):
+            new_val = np.sum(self.value * var2)
+        else:
+            raise ValueError("Needs to be type numpy array or Expression")
+
+        return Expression(np.array([new_val]), copy=False)
+
+    def logsumexp(self):
+        """
+        Base logsumexp function for Expression, log(sum(exp(values))) computed without overflow
+        Args:
+            None
+        Returns:
+            a new Expression with the logsumexp as a one element vector
+        """
+        return Expression(logsumexp_value(self.value), copy=False)
+
+    def softmax(self):
+        """
+        Base softmax function for Expression, exp(values) normalized over all the values, computed without overflow
+        Args:
+            None
+        Returns:
+            a new Expression with the softmax value
+        """
+        return Expression(np.exp(self.value - logsumexp_value(self.value)), copy=False)
+
+    def log_softmax(self):
+        """
+        Base log-softmax function for Expression, values - logsumexp(values)
+        Args:
+            None
+        Returns:
+            a new Expression with the log-softmax value
+        """
+        return Expression(self.value - logsumexp_value(self.value), copy=False)
+
+    def softplus(self):
+        """
+        Base softplus function for Expression, log(1 + exp(value)) computed without overflow
+        Args:
+            None
+        Returns:
+            a new Expression with the softplus value
+        """
+        return Expression(softplus_value(self.value), copy=False)
+
+    def logistic_loss(self, labels):
+        """
+        Base logistic loss function for Expression, the binary cross entropy softplus(value) - labels * value of logits
+        Args:
+            labels: int, float or numpy array of targets in [0, 1], broadcastable to the shape of self
+        Returns:
+            a new Expression with the elementwise loss
+        """
+        if (not isinstance(labels, (int, float, np.ndarray)) or isinstance(labels, bool)):
+            raise TypeError("Needs to be type int, float, or numpy array")
+        if (np.broadcast_shapes(np.shape(labels), self.value.shape) != self.value.shape):
+            raise ValueError("The labels must broadcast to the shape of the Expression.")
+        return Expression(softplus_value(self.value) - labels * self.value, copy=False)
+
+    def squared_norm(self):
+        """
+        Base squared norm function for Expression, the sum of the squares of all the values
+        Args:
+            None
+        Returns:
+            a new Expression with the squared norm as a one element vector
+        """
+        return Expression(np.array([np.sum(self.value * self.value)]), copy=False)
+
     @classmethod
     def is_valid_scalar(cls, value):
         return isinstance(value, cls.valid_scalar_types)
+
+    def broadcastable(self, var2):
+        """
+        Checks whether the values of two Expressions can be combined elementwise under NumPy broadcasting rules
+        Args:
+            var2: another Expression
+        Returns:
+            True if the shapes are broadcast-compatible
+        """
+        try:
+            np.broadcast_shapes(self.value.shape, var2.value.shape)
+        except ValueError:
+            return False
+        return True
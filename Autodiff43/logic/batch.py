@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+"""
+This module contains BatchEvaluator, the values and Jacobians of a function at many points.
+
+The function is recorded once into a Tape at the first chunk of points and every chunk is then
+evaluated with one replay. It is shared by the autodiff43-eval command (cli.py) and out-of-core
+evaluation (outofcore.py).
+"""
+import hashlib
+
+import numpy as np
+
+from .tape import trace
+
+MODES = ('forward', 'reverse')
+
+class BatchEvaluator:
+    """Values and Jacobians of a function at many points, recorded once at the first chunk."""
+
+    def __init__(self, function, mode = 'forward'):
+        """
+        Args:
+            function: a function of n Expressions returning an Expression or a list of Expressions, elementwise
+            mode: 'forward' (one tangent sweep per input) or 'reverse' (one reverse sweep per output)
+        """
+        if (mode not in MODES):
+            raise NotImplementedError(f"Unknown mode '{mode}', expected one of {MODES}.")
+        self.function = function
+        self.mode = mode
+        self.tape = None
+
+    def __call__(self, points):
+        """
+        Args:
+            points: array of shape (k, n), one point per row
+        Returns:
+            a tuple (values, jac) of shapes (k, m) and (k, m, n)
+        """
+        k, n = points.shape
+        if (self.tape is None):
+            self.tape = trace(self.function, list(points.T), [f'x{j}' for j in range(n)])
+        outputs, jac = self.tape.jacobian(list(points.T), self.mode)
+
+        values = np.stack([np.broadcast_to(out, (k,)) for out in outputs], axis=1).astype(float)
+        J = np.empty((k, len(outputs), n))
+        for i, row in enumerate(jac):
+            for j, entry in enumerate(row):
+                J[:, i, j] = np.broadcast_to(entry, (k,))
+        return values, J
+
+    def identity(self):
+        """
+        Identifies the function, by its qualified name and a hash of its recorded Tape, so that results of another
+        function (or of the same function after its code changed) are not mistaken for its own
+        Returns:
+            a string, or None before the first chunk is evaluated
+        """
+        if (self.tape is None):
+            return None
+        digest = hashlib.sha256(repr((self.tape.ops, self.tape.parents, self.tape.args, self.tape.input_index, self.tape.output_index)).encode())
+        for i in sorted(self.tape.constants):
+            digest.update(np.ascontiguousarray(self.tape.constants[i]).tobytes())
+        name = getattr(self.function, '__qualname__', type(self.function).__qualname__)
+        return f"{getattr(self.function, '__module__', None)}.{name}:{digest.hexdigest()[:16]}"
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+
+"""
+This module contains the autodiff43-eval command, a batch evaluator for values and Jacobians.
+
+The function is given as module:function and must take one Expression per input column and
+return an Expression or a list of Expressions, using elementwise operations only. It is recorded
+once into a Tape, then every chunk of input points is evaluated with one replay (see
+optimize.BatchObjective), so only one chunk of points and results is in memory at a time.
+Points are read from a CSV file (an optional header names the inputs) or a .npy file (memory
+mapped), and results are appended to a CSV file or written into a memory mapped .npy file as
+each chunk completes. Throughput is reported on stderr while the job runs.
+
+Usage:
+    autodiff43-eval mymodule:f points.csv -o results.csv --mode reverse --chunk-size 4096
+"""
+import argparse
+import importlib
+import itertools
+import os
+import sys
+import time
+
+import numpy as np
+
+from .batch import MODES, BatchEvaluator
+
+def load_function(spec):
+    """
+    Args:
+        spec: 'module:function', the module is imported with the working directory on the path
+    Returns:
+        the function
+    """
+    module_name, sep, function_name = spec.partition(':')
+    if (not sep or not module_name or not function_name):
+        raise ValueError(f"Expected module:function, got {spec!r}.")
+    if (os.getcwd() not in sys.path):
+        sys.path.insert(0, os.getcwd())
+    return getattr(importlib.import_module(module_name), function_name)
+
+def _is_number(field):
+    try:
+        float(field)
+        return True
+    except ValueError:
+        return False
+
+def read_points(path, chunk_size):
+    """
+    Opens a file of points for streaming
+    Args:
+        path: a .npy file with one point per row, or a CSV file with one point per line and an optional header
+        chunk_size: the number of points per chunk
+    Returns:
+        a tuple (names, rows, chunks): the input names (from the CSV header, or None), the number of points if it is known
+        without reading the whole file (None otherwise), and an iterator over arrays of shape (k, n) with k <= chunk_size
+    """
+    if (path.endswith('.npy')):
+        points = np.load(path, mmap_mode='r')
+        if (points.ndim == 1):
+            points = points[:, None]
+        chunks = (np.array(points[i:i + chunk_size], dtype=float) for i in range(0, len(points), chunk_size))
+        return None, len(points), chunks
+
+    # Only the first line is read here, the file is opened again by the iterator, which closes it
+    with open(path) as handle:
+        first = next((line for line in handle if line.strip()), None)
+    names = None
+    if (first is not None and not all(_is_number(field) for field in first.split(','))):
+        names = [field.strip() for field in first.split(',')]
+
+    def chunks():
+        with open(path) as handle:
+            lines = (line for line in handle if line.strip())
+            if (names is not None):
+                next(lines)
+            while True:
+                block = list(itertools.islice(lines, chunk_size))
+                if (len(block) == 0):
+                    return
+                yield np.loadtxt(block, delimiter=',', ndmin=2)
+
+    return names, None, chunks()
+
+def count_points(path):
+    """The number of points in a CSV file, read line by line."""
+    with open(path) as handle:
+        lines = [line for line in itertools.islice(handle, 1)]
+        rows = sum(1 for line in handle if line.strip())
+    if (len(lines) and lines[0].strip()):
+        rows += all(_is_number(field) for field in lines[0].split(','))
+    return rows
+
+class CSVWriter:
+    """Appends result rows to a CSV file (or stdout for '-')."""
+
+    def __init__(self, path, header):
+        self.handle = sys.stdout if path == '-' else open(path, 'w')
+        self.handle.write(','.join(header) + '\n')
+
+    def write(self, block):
+        np.savetxt(self.handle, block, delimiter=',', fmt='%.17g')
+        self.handle.flush()
+
+    def close(self):
+        if (self.handle is not sys.stdout):
+            self.handle.close()
+
+class NpyWriter:
+    """Writes result rows into a memory mapped .npy file of known size."""
+
+    def __init__(self, path, rows, columns):
+        self.array = np.lib.format.open_memmap(path, mode='w+', dtype=float, shape=(rows, columns))
+        self.row = 0
+
+    def write(self, block):
+        self.array[self.row:self.row + len(block)] = block
+        self.row += len(block)
+
+    def close(self):
+        self.array.flush()
+        del self.array
+
+def run(function, input_path, output_path, mode = 'forward', chunk_size = 1024, report_every = 1.0, log = None):
+    """
+    Evaluates function and its Jacobian at every point of input_path, writing one row per point to output_path
+    Args:
+        function: a function of n Expressions returning m Expressions (or one), elementwise
+        input_path: a .npy or CSV file of points
+        output_path: a .npy or CSV file ('-' for stdout), each row holds the m values then the m x n Jacobian row by row
+        mode: 'forward' or 'reverse'
+        chunk_size: the number of points evaluated at a time, which bounds memory use
+        report_every: seconds between throughput reports
+        log: stream for the throughput reports, None to stay silent
+    Returns:
+        a dictionary with the number of points, chunks, seconds taken and points per second
+    """
+    names, rows, chunks = read_points(input_path, chunk_size)
+    if (output_path.endswith('.npy') and rows is None):
+        rows = count_points(input_path)
+
+    evaluator = BatchEvaluator(function, mode)
+    writer = None
+    start = last_report = time.perf_counter()
+    stats = {'points': 0, 'chunks': 0}
+    try:
+        for points in chunks:
+            values, J = evaluator(points)
+            k, m, n = J.shape
+            if (writer is None):
+                labels = names if names is not None and len(names) == n else [f'x{j}' for j in range(n)]
+                if (output_path.endswith('.npy')):
+                    writer = NpyWriter(output_path, rows, m + m * n)
+                else:
+                    header = [f'f{i}' for i in range(m)] + [f'df{i}/d{label}' for i in range(m) for label in labels]
+                    writer = CSVWriter(output_path, header)
+            writer.write(np.concatenate([values, J.reshape(k, m * n)], axis=1))
+
+            stats['points'] += k
+            stats['chunks'] += 1
+            now = time.perf_counter()
+            if (log is not None and now - last_report >= report_every):
+                total = f'/{rows}' if rows is not None else ''
+                print(f'{stats["points"]}{total} points, {stats["points"] / (now - start):.0f} points/s', file=log)
+                last_report = now
+    finally:
+        if (writer is not None):
+            writer.close()
+
+    stats['seconds'] = time.perf_counter() - start
+    stats['points_per_second'] = stats['points'] / stats['seconds'] if stats['seconds'] > 0 else float('inf')
+    if (log is not None):
+        print(f'done: {stats["points"]} points in {stats["seconds"]:.3f}s, {stats["points_per_second"]:.0f} points/s', file=log)
+    return stats
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog='autodiff43-eval', description='Evaluates a function and its Jacobian at every point of a CSV or .npy file.')
+    parser.add_argument('function', help='the function, as module:function')
+    parser.add_argument('input', help='a .npy or CSV file with one point per row')
+    parser.add_argument('-o', '--output', default='-', help='a .npy or CSV file for the results, stdout (CSV) by default')
+    parser.add_argument('--mode', choices=MODES, default='forward', help='the AD mode of the Jacobian sweeps')
+    parser.add_argument('--chunk-size', type=int, default=1024, help='the number of points evaluated at a time')
+    parser.add_argument('--report-every', type=float, default=1.0, help='seconds between throughput reports')
+    parser.add_argument('--quiet', action='store_true', help='do not report throughput')
+    args = parser.parse_args(argv)
+
+    if (args.chunk_size < 1):
+        parser.error('--chunk-size must be at least 1')
+    try:
+        function = load_function(args.function)
+    except (ValueError, ImportError, AttributeError) as e:
+        parser.error(f'cannot load {args.function}: {e}')
+
+    run(function, args.input, args.output, args.mode, args.chunk_size, args.report_every, None if args.quiet else sys.stderr)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+
+"""
+This module contains a compiler from recorded graphs to straight-line NumPy source.
+
+A Tape (or an RMExpression graph, or a function traced into one) is turned into the source of
+a Python function that computes the value of the output and its gradient with respect to every
+input with one NumPy statement per operation, then built with compile() and exec. No Expression
+objects are created when the compiled function runs, and the source stays available for
+inspection. The code is specialized to the input shapes it was compiled for.
+
+Operations with a template below are emitted inline; any other registered operation calls its
+rules from ops.py.
+"""
+import numpy as np
+
+from .ops import get_op, prod_partials, norm_partials
+from .tape import Tape, trace
+from .utils import topological_order, unbroadcast, push_adjoint
+
+# op code -> value template, {0} is the first operand and {1} the second (a parent or a constant)
+FORWARD = {
+    'add': '{0} + {1}',
+    'sub': '{0} - {1}',
+    'rsub': '{1} - {0}',
+    'mul': '{0} * {1}',
+    'truediv': '{0} / {1}',
+    'rtruediv': '{1} / {0}',
+    'pow': '{0} ** {1}',
+    'neg': '-{0}',
+    'exp': '{1} ** {0}',
+    'log': 'np.log({0}) / np.log({1})',
+    'sin': 'np.sin({0})',
+    'cos': 'np.cos({0})',
+    'tan': 'np.tan({0})',
+    'arcsin': 'np.arcsin({0})',
+    'arccos': 'np.arccos({0})',
+    'arctan': 'np.arctan({0})',
+    'sinh': 'np.sinh({0})',
+    'cosh': 'np.cosh({0})',
+    'tanh': 'np.tanh({0})',
+    'sigmoid': '1 / (1 + np.exp(-{0}))',
+    'sum': 'np.atleast_1d(np.sum({0}))',
+    'mean': 'np.atleast_1d(np.mean({0}))',
+    'prod': 'np.atleast_1d(np.prod({0}))',
+    'norm': 'np.atleast_1d(np.sqrt(np.sum({0} * {0})))',
+    'dot': 'np.atleast_1d(np.sum({0} * {1}))',
+}
+# op code -> one adjoint template per operand, {g} is the adjoint of the result and {out} its value
+BACKWARD = {
+    'add': ['{g}', '{g}'],
+    'sub': ['{g}', '-{g}'],
+    'rsub': ['-{g}'],
+    'mul': ['{g} * {1}', '{g} * {0}'],
+    'truediv': ['{g} / {1}', '-{g} * {0} / {1} ** 2'],
+    'rtruediv': ['-{g} * {1} / {0} ** 2'],
+    'pow': ['{g} * {1} * {0} ** ({1} - 1)', '{g} * {out} * np.log({0})'],
+    'neg': ['-{g}'],
+    'exp': ['{g} * {out} * np.log({1})', '{g} * {0} * {1} ** ({0} - 1)'],
+    'log': ['{g} / ({0} * np.log({1}))', '-{g} * np.log({0}) / ({1} * np.log({1}) ** 2)'],
+    'sin': ['{g} * np.cos({0})'],
+    'cos': ['-{g} * np.sin({0})'],
+    'tan': ['{g} / np.cos({0}) ** 2'],
+    'arcsin': ['{g} / np.sqrt(1 - {0} ** 2)'],
+    'arccos': ['-{g} / np.sqrt(1 - {0} ** 2)'],
+    'arctan': ['{g} / (1 + {0} ** 2)'],
+    'sinh': ['{g} * np.cosh({0})'],
+    'cosh': ['{g} * np.sinh({0})'],
+    'tanh': ['{g} / np.cosh({0}) ** 2'],
+    'sigmoid': ['{g} * {out} * (1 - {out})'],
+    'sum': ['{g}'],
+    'mean': ['{g} / np.size({0})'],
+    'prod': ['{g} * _prod_partials({0})'],
+    'norm': ['{g} * _norm_partials({0}, {out})'],
+    'dot': ['{g} * {1}', '{g} * {0}'],
+}
+# exp and log with a single operand are e ** x and ln(x), the entries above have a base
+FORWARD_UNARY = {'exp': 'np.exp({0})', 'log': 'np.log({0})'}
+BACKWARD_UNARY = {'exp': ['{g} * {out}'], 'log': ['{g} / {0}']}
+
+class CompiledGraph:
+    """A graph compiled to a NumPy function, callable as f(*inputs) -> (value, {name: gradient})."""
+
+    def __init__(self, source, namespace, names):
+        """
+        Args:
+            source: the generated Python source
+            namespace: the globals the source is executed with (NumPy, helpers and constants)
+            names: the input names, in argument order
+        """
+        self.source = source
+        self.names = list(names)
+        exec(compile(source, '<Autodiff43.codegen>', 'exec'), namespace)
+        self.value = namespace['value']
+        self.value_and_grad = namespace['value_and_grad']
+
+    def __call__(self, *inputs):
+        value, grads = self.value_and_grad(*inputs)
+        return value, dict(zip(self.names, grads))
+
+    def __repr__(self):
+        return f'CompiledGraph({", ".join(self.names)})'
+
+def _literal(arg, namespace):
+    """Source for a constant operand, a literal for Python numbers and a global name otherwise."""
+    if (isinstance(arg, (int, float)) and not isinstance(arg, bool) and np.isfinite(arg)):
+        return f'({arg!r})'
+    name = f'c{len(namespace)}'
+    namespace[name] = arg
+    return name
+
+def _rule_call(op, operands, nparents, rule, *extra):
+    """Source calling a rule of an op from ops.py, for ops without a template."""
+    args = operands[nparents:]
+    args = f'({", ".join(args)},)' if args else '()'
+    return f'_get_op({op!r}).{rule}([{", ".join(operands[:nparents])}], {args}{"".join(", " + e for e in extra)})'
+
+def compile_tape(tape, input_values, names = None):
+    """
+    Generates and compiles the value and gradient code of the first output of a Tape
+    Args:
+        tape: a Tape with one output
+        input_values: example input values, the code is specialized to their shapes
+        names: the input names used as keys of the gradients, defaults to x0, x1, ...
+    Returns:
+        a CompiledGraph
+    """
+    if (names is None):
+        names = [f'x{j}' for j in range(len(tape.input_index))]
+
+    shapes = [np.shape(v) for v in tape.forward(input_values)]
+    namespace = {'np': np, '_get_op': get_op, '_unbroadcast': unbroadcast, '_push_adjoint': push_adjoint,
+                 '_prod_partials': prod_partials, '_norm_partials': norm_partials}
+    namespace_size = len(namespace)
+
+    root = tape.output_index[0]
+    inputs = {i: j for j, i in enumerate(tape.input_index) if i >= 0}
+    params = ', '.join(f'a{j}' for j in range(len(tape.input_index)))
+
+    # Nodes that depend on an input, the only ones that need an adjoint
+    active = [False] * tape.size
+    for i in range(tape.size):
+        active[i] = i in inputs or any(active[p] for p in tape.parents[i])
+
+    forward = []
+    operands = []
+    for i in range(tape.size):
+        if (i in inputs):
+            forward.append(f'v{i} = a{inputs[i]}')
+            operands.append(None)
+            continue
+        if (i in tape.constants):
+            forward.append(f'v{i} = {_literal(tape.constants[i], namespace)}')
+            operands.append(None)
+            continue
+
+        ops = [f'v{p}' for p in tape.parents[i]] + [_literal(a, namespace) for a in tape.args[i]]
+        operands.append(ops)
+        op = tape.ops[i]
+        if (len(ops) == 1 and op in FORWARD_UNARY):
+            forward.append(f'v{i} = ' + FORWARD_UNARY[op].format(*ops))
+        elif (op in FORWARD):
+            forward.append(f'v{i} = ' + FORWARD[op].format(*ops))
+        else:
+            forward.append(f'v{i} = ' + _rule_call(op, ops, len(tape.parents[i]), 'forward'))
+
+    backward = [f'g{root} = np.ones({shapes[root]!r})']
+    seen = set([root])
+    for i in reversed(range(tape.size)):
+        if (i not in seen or len(tape.parents[i]) == 0):
+            continue
+        op = tape.ops[i]
+        ops = operands[i]
+        nparents = len(tape.parents[i])
+        if (len(ops) == 1 and op in BACKWARD_UNARY):
+            templates = BACKWARD_UNARY[op]
+        else:
+            templates = BACKWARD.get(op)
+        if (templates is None):
+            backward.append(f'w{i} = ' + _rule_call(op, ops, nparents, 'partials', f'v{i}'))
+
+        for k, p in enumerate(tape.parents[i]):
+            if (not active[p]):
+                continue
+            if (templates is None):
+                contribution = f'_push_adjoint(w{i}[{k}], g{i}, {shapes[p]!r})'
+            else:
+                contribution = templates[k].format(*ops, g=f'g{i}', out=f'v{i}')
+                if (shapes[p] != shapes[i] or op in ('sum', 'mean')):
+                    contribution = f'_unbroadcast({contribution}, {shapes[p]!r})'
+            backward.append(f'g{p} = {contribution}' if p not in seen else f'g{p} = g{p} + {contribution}')
+            seen.add(p)
+
+    grads = []
+    for j, i in enumerate(tape.input_index):
+        grads.append(f'g{i}' if i in seen else f'np.zeros(np.shape(a{j}))')
+
+    lines = [f'# Inputs: {", ".join(f"a{j} = {name}" for j, name in enumerate(names))}']
+    lines.append(f'# {tape.size} nodes, {len(namespace) - namespace_size} constants')
+    lines.append(f'def value({params}):')
+    lines.extend('    ' + line for line in forward)
+    lines.append(f'    return v{root}')
+    lines.append('')
+    lines.append(f'def value_and_grad({params}):')
+    lines.extend('    ' + line for line in forward)
+    lines.extend('    ' + line for line in backward)
+    lines.append(f'    return v{root}, ({", ".join(grads)}{"," if len(grads) == 1 else ""})')
+
+    return CompiledGraph('\n'.join(lines) + '\n', namespace, names)
+
+def compile_graph(root, inputs):
+    """
+    Compiles a recorded RMExpression graph
+    Args:
+        root: the RMExpression output
+        inputs: the leaf RMExpressions that become the arguments, or their names
+    Returns:
+        a CompiledGraph specialized to the shapes of the recorded values
+    """
+    if (all(isinstance(x, str) for x in inputs)):
+        leaves = {}
+        for node in topological_order([root]):
+            if (len(node.node_edges) == 0 and node.name in inputs):
+                leaves.setdefault(node.name, node)
+        missing = [name for name in inputs if name not in leaves]
+        if (missing):
+            raise ValueError(f"No leaf named {missing[0]!r} in the graph.")
+        inputs = [leaves[name] for name in inputs]
+
+    tape = Tape([root], inputs)
+    return compile_tape(tape, [x.value for x in inputs], [x.name for x in inputs])
+
+def compile_function(function, args, names = None):
+    """
+    Traces function at args and compiles it, whichever AD mode it is written for
+    Args:
+        function: a function of len(args) Expressions returning an Expression
+        args: example values, the code is specialized to their shapes
+        names: one input name per argument, defaults to x0, x1, ...
+    Returns:
+        a CompiledGraph
+    """
+    if (names is None):
+        names = [f'x{j}' for j in range(len(args))]
+    return compile_tape(trace(function, args, names), args, names)
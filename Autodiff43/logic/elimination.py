@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+
+"""
+This module contains cross-country Jacobian accumulation by vertex elimination.
+
+The recorded graph of a Tape is turned into its linearized computational graph: one vertex per
+node on a path from an input to an output, and one edge per local partial derivative, from the
+ops.py rules. Eliminating an intermediate vertex v connects each of its predecessors p to each
+of its successors s with the weight c_sv * c_vp (added to an existing edge p -> s), which costs
+|pred(v)| * |succ(v)| multiplications. Once every intermediate vertex is gone, the remaining
+bipartite graph holds the Jacobian. Eliminating in topological order is forward mode and in
+reverse topological order is reverse mode; the Markowitz (fewest multiplications next) and
+min-fill (fewest new edges next) orders are greedy heuristics that cost much less than either
+on graphs with bottlenecks.
+
+Only elementwise graphs are supported (every node has the broadcast shape of its operands), so
+that local partials are diagonal and multiply elementwise; the Jacobian entries then follow the
+elementwise convention of backward_scalar. A graph of scalar nodes gives the full Jacobian.
+"""
+import heapq
+
+import numpy as np
+
+from .ops import get_op
+from .tape import trace
+
+ORDERS = ('markowitz', 'min_fill', 'forward', 'reverse')
+
+class LinearizedGraph:
+    """The local partial derivatives of a Tape at given input values, as a DAG with weighted edges."""
+
+    def __init__(self, tape, input_values):
+        """
+        Args:
+            tape: a Tape
+            input_values: list with one value per input
+        """
+        values = tape.forward(input_values)
+        self.outputs = [values[i] for i in tape.output_index]
+        self.input_index = list(tape.input_index)
+        self.output_index = list(tape.output_index)
+        inputs = set(self.input_index)
+
+        # Keep the nodes on a path from an input to an output
+        active = [False] * tape.size
+        for i in range(tape.size):
+            active[i] = i in inputs or any(active[p] for p in tape.parents[i])
+        useful = [False] * tape.size
+        for i in self.output_index:
+            useful[i] = True
+        for i in reversed(range(tape.size)):
+            if (useful[i]):
+                for p in tape.parents[i]:
+                    useful[p] = True
+
+        self.pred = {}
+        self.succ = {}
+        for i in range(tape.size):
+            if (active[i] and useful[i]):
+                self.pred[i] = {}
+                self.succ[i] = {}
+        for i in self.pred:
+            if (len(tape.parents[i]) == 0 or i in inputs):
+                continue
+            parent_values = [values[p] for p in tape.parents[i]]
+            weights = get_op(tape.ops[i]).partials(parent_values, tape.args[i], values[i])
+            for p, weight in zip(tape.parents[i], weights):
+                if (p not in self.pred):
+                    continue
+                if (callable(weight) or np.shape(values[p]) not in ((), (1,), np.shape(values[i]))
+                        or np.broadcast_shapes(np.shape(weight), np.shape(values[i])) != np.shape(values[i])):
+                    raise NotImplementedError(f"Vertex elimination needs elementwise operations, not '{tape.ops[i]}'.")
+                self._add_edge(p, i, weight)
+
+        self.multiplications = 0
+
+    def _add_edge(self, p, s, weight):
+        """Adds weight to the edge p -> s, creating it if needed. Returns True if the edge is new."""
+        if (p in self.pred[s]):
+            self.pred[s][p] = self.pred[s][p] + weight
+            self.succ[p][s] = self.pred[s][p]
+            return False
+        self.pred[s][p] = weight
+        self.succ[p][s] = weight
+        return True
+
+    def intermediates(self):
+        """The vertices that are neither inputs nor outputs."""
+        kept = set(self.input_index) | set(self.output_index)
+        return [v for v in self.pred if v not in kept]
+
+    def markowitz(self, v):
+        """The number of multiplications (edge products) eliminating v takes."""
+        return len(self.pred[v]) * len(self.succ[v])
+
+    def fill(self, v):
+        """The number of new edges eliminating v creates."""
+        return sum(1 for p in self.pred[v] for s in self.succ[v] if s not in self.succ[p])
+
+    def eliminate(self, v):
+        """
+        Removes an intermediate vertex, connecting its predecessors to its successors
+        Returns:
+            the vertices whose edges changed
+        """
+        preds = self.pred.pop(v)
+        succs = self.succ.pop(v)
+        for p in preds:
+            del self.succ[p][v]
+        for s in succs:
+            del self.pred[s][v]
+
+        for p, c_vp in preds.items():
+            for s, c_sv in succs.items():
+                product = c_sv * c_vp
+                self.multiplications += np.size(product)
+                self._add_edge(p, s, product)
+        return set(preds) | set(succs)
+
+    def jacobian(self):
+        """
+        Reads the Jacobian off the graph once every intermediate vertex is eliminated
+        Returns:
+            a list jac where jac[i][j] is the derivative of output i with respect to input j (0 without a path)
+        """
+        # An output can still feed another output, so outputs are resolved in topological order
+        rows = {}
+        for o in sorted(set(self.output_index)):
+            row = {}
+            if (o in self.input_index):
+                row[o] = 1
+            for p, weight in self.pred.get(o, {}).items():
+                if (p in rows):
+                    for j, entry in rows[p].items():
+                        row[j] = row.get(j, 0) + weight * entry
+                        self.multiplications += np.size(weight)
+                else:
+                    row[p] = row.get(p, 0) + weight
+            rows[o] = row
+        return [[rows[o].get(j, 0) if j >= 0 else 0 for j in self.input_index] for o in self.output_index]
+
+def elimination_order(graph, order = 'markowitz'):
+    """
+    Eliminates every intermediate vertex of a LinearizedGraph
+    Args:
+        graph: the LinearizedGraph, modified in place
+        order: 'markowitz', 'min_fill', 'forward' (topological order) or 'reverse'
+    Returns:
+        the vertices in the order they were eliminated
+    """
+    if (order not in ORDERS):
+        raise NotImplementedError(f"Unknown elimination order '{order}', expected one of {ORDERS}.")
+
+    vertices = graph.intermediates()
+    if (order in ('forward', 'reverse')):
+        vertices = sorted(vertices, reverse = order == 'reverse')
+        for v in vertices:
+            graph.eliminate(v)
+        return vertices
+
+    # Greedy: a heap of (score, vertex) with stale entries skipped, scores change only around eliminated vertices
+    score = graph.markowitz if order == 'markowitz' else graph.fill
+    remaining = set(vertices)
+    current = {v: score(v) for v in vertices}
+    heap = [(s, v) for v, s in current.items()]
+    heapq.heapify(heap)
+    eliminated = []
+    while heap:
+        s, v = heapq.heappop(heap)
+        if (v not in remaining or current[v] != s):
+            continue
+        remaining.discard(v)
+        eliminated.append(v)
+        touched = graph.eliminate(v)
+        # Min-fill scores also depend on the neighbours of the neighbours
+        if (order == 'min_fill'):
+            touched = touched | set(u for t in touched for u in list(graph.pred[t]) + list(graph.succ[t]))
+        for u in touched:
+            if (u in remaining):
+                current[u] = score(u)
+                heapq.heappush(heap, (current[u], u))
+    return eliminated
+
+def jacobian(tape, input_values, order = 'markowitz', info = None):
+    """
+    Evaluates the outputs of a Tape and their Jacobian by vertex elimination
+    Args:
+        tape: a Tape of elementwise operations
+        input_values: list with one value per input
+        order: 'markowitz', 'min_fill', 'forward' (topological order) or 'reverse'
+        info: optional dictionary that receives the number of multiplications and the elimination order
+    Returns:
+        a tuple (outputs, jac) where jac[i][j] is the derivative of output i with respect to input j, as Tape.jacobian
+    """
+    graph = LinearizedGraph(tape, input_values)
+    eliminated = elimination_order(graph, order)
+    jac = graph.jacobian()
+    if (info is not None):
+        info['multiplications'] = graph.multiplications
+        info['order'] = eliminated
+    return graph.outputs, jac
+
+def jacobian_function(function, args, order = 'markowitz', info = None):
+    """
+    Traces function at args and computes its Jacobian by vertex elimination
+    Args:
+        function: a function of len(args) Expressions returning an Expression or a list of Expressions, elementwise
+        args: the input values
+        order, info: see jacobian
+    Returns:
+        the Jacobian as an array of shape (m, n) when every input and output is a scalar, otherwise as jacobian
+    """
+    tape = trace(function, args, [f'x{j}' for j in range(len(args))])
+    outputs, jac = jacobian(tape, args, order, info)
+    if (all(np.size(out) == 1 for out in outputs) and all(np.size(x) == 1 for x in args)):
+        return np.array([[float(np.ravel(entry)[0]) for entry in row] for row in jac])
+    return jac
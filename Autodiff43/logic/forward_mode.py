@@ -6,21 +6,32 @@ This module contains our FMExpression class, which supports fowrard-mode automat
 import numpy as np
 
 from .base import Expression
+from .ops import prod_partials, norm_partials
+from .precision import get_dtype
 
 class FMExpression(Expression):
-    def __init__(self, value, grad = None):
+    def __init__(self, value, grad = None, copy = True):
         """
-        Takes in the value of the Expression and optional gradient argument to create a FMExpression object
+        Takes in the value of the Expression and optional gradient argument to create a FMExpression object,
+        copy=False stores a numeric array without copying it
         """
-        super().__init__(value)
+        super().__init__(value, copy)
 
         if (isinstance(grad, str)):
-            self.grad = {grad: np.array(np.ones(len(self.value)))}
+            self.grad = {grad: np.ones(self.value.shape, dtype=get_dtype())}
         else:
             self.grad = grad
 
         self._valid = [int, float, FMExpression]
 
+    def __setattr__(self, name, value):
+        # Gradient dictionaries hold tangents in the dtype of the precision policy
+        if (name == 'grad' and isinstance(value, dict)):
+            dtype = get_dtype()
+            if (not all(getattr(v, 'dtype', None) == dtype for v in value.values())):
+                value = {k: np.asarray(v, dtype=dtype) for k, v in value.items()}
+        object.__setattr__(self, name, value)
+
     def __str__(self):
         return f'The real value is {self.value} and the grad values are {self.grad}'
 
@@ -46,13 +57,14 @@ class FMExpression(Expression):
 
         new_var.grad = {}
         for key in set(list(self.grad.keys())+list(var2.grad.keys())):
+            # Tangents take the shape of the result when the operands broadcast
             if key in self.grad and key in var2.grad:
-                new_var.grad[key] = np.add(self.grad[key],var2.grad[key])
+                new_var.grad[key] = np.broadcast_to(np.add(self.grad[key],var2.grad[key]), new_var.value.shape).copy()
 
             elif key in self.grad:
-                new_var.grad[key] = self.grad[key]
+                new_var.grad[key] = np.broadcast_to(self.grad[key], new_var.value.shape).copy()
             else:
-                new_var.grad[key] = var2.grad[key]
+                new_var.grad[key] = np.broadcast_to(var2.grad[key], new_var.value.shape).copy()
 
         return new_var
 
@@ -78,13 +90,14 @@ class FMExpression(Expression):
 
         new_var.grad = {}
         for key in set(list(self.grad.keys())+list(var2.grad.keys())):
+            # Tangents take the shape of the result when the operands broadcast
             if key in self.grad and key in var2.grad:
-                new_var.grad[key] = np.subtract(self.grad[key],var2.grad[key])
+                new_var.grad[key] = np.broadcast_to(np.subtract(self.grad[key],var2.grad[key]), new_var.value.shape).copy()
 
             elif key in self.grad:
-                new_var.grad[key] = self.grad[key]
+                new_var.grad[key] = np.broadcast_to(self.grad[key], new_var.value.shape).copy()
             else:
-                new_var.grad[key] = -var2.grad[key]
+                new_var.grad[key] = np.broadcast_to(-var2.grad[key], new_var.value.shape).copy()
 
         return new_var
 
@@ -202,7 +215,7 @@ class FMExpression(Expression):
 
         for key in set(list(self.grad.keys())+list(var2.grad.keys())):
             if key in self.grad and key in var2.grad:
-                new_var.grad[key] = np.multiply(np.multiply(var2.value, np.power(self.value, (var2.value - 1))), self.grad[key]) + multiply(np.multiply(np.power(self.value,var2. value), np.log(self.value)), var2.grad[key])
+                new_var.grad[key] = np.multiply(np.multiply(var2.value, np.power(self.value, (var2.value - 1))), self.grad[key]) + np.multiply(np.multiply(np.power(self.value, var2.value), np.log(self.value)), var2.grad[key])
             elif key in self.grad:
                 new_var.grad[key] = np.multiply(np.multiply(var2.value, np.power(self.value, (var2.value - 1))), self.grad[key])
             else:
@@ -210,6 +223,49 @@ class FMExpression(Expression):
 
         return new_var
 
+    def __matmul__(self, var2):
+        """
+        Matrix multiplication function for FMExpression, represents self @ var2 and combines the gradient dictionaries
+        Args:
+            var2: another variable either of type FMExpression or a constant numpy array
+        Returns:
+            a new FMExpression that represents the matrix product
+        """
+        if (not isinstance(var2, (FMExpression, np.ndarray))):
+            raise TypeError("Needs to be type numpy array or FMExpression")
+
+        new_var = self.from_expression(super().__matmul__(var2))
+
+        if (isinstance(var2, np.ndarray)):
+            new_var.grad = {k: np.atleast_1d(np.matmul(v, var2)) for k, v in self.grad.items()}
+            return new_var
+
+        new_var.grad = {}
+        for key in set(list(self.grad.keys()) + list(var2.grad.keys())):
+            if key in self.grad and key in var2.grad:
+                new_var.grad[key] = np.atleast_1d(np.matmul(self.grad[key], var2.value) + np.matmul(self.value, var2.grad[key]))
+            elif key in self.grad:
+                new_var.grad[key] = np.atleast_1d(np.matmul(self.grad[key], var2.value))
+            else:
+                new_var.grad[key] = np.atleast_1d(np.matmul(self.value, var2.grad[key]))
+
+        return new_var
+
+    def __rmatmul__(self, var2):
+        """
+        Reverse matrix multiplication function for FMExpression, in case of constant array @ FMExpression
+        Args:
+            var2: a constant numpy array
+        Returns:
+            a new FMExpression that represents the matrix product
+        """
+        if (not isinstance(var2, np.ndarray)):
+            raise TypeError("Needs to be type numpy array or FMExpression")
+
+        new_var = self.from_expression(super().__rmatmul__(var2))
+        new_var.grad = {k: np.atleast_1d(np.matmul(var2, v)) for k, v in self.grad.items()}
+        return new_var
+
     def __neg__(self):
         """
         Negation function for FMExpression
@@ -220,6 +276,18 @@ class FMExpression(Expression):
         """
         return self.__mul__(-1)
 
+    def __getitem__(self, index):
+        """
+        Indexing function for FMExpression, selects the same elements of the value and of each gradient
+        Args:
+            index: an integer, slice, array of indices or boolean mask, or a tuple of those
+        Returns:
+            a new FMExpression that represents the selection
+        """
+        new_var = self.from_expression(super().__getitem__(index))
+        new_var.grad = {k: np.atleast_1d(np.broadcast_to(v, self.value.shape)[index]) for k, v in self.grad.items()}
+        return new_var
+
     def exp(self, var2 = None):
         """
         Exponentiation function for FMExpression, exponents the values and combines the gradient dictionaries, represents var2 ** self, reverse of __pow__
@@ -367,7 +435,7 @@ class FMExpression(Expression):
         """
         if (not var2): # we are doing ln(self)
             new_var = self.from_expression(super().log())
-            new_var.grad = {k: np.multiplynp.divide(v, self.value) for k, v in self.grad.items()}
+            new_var.grad = {k: np.divide(v, self.value) for k, v in self.grad.items()}
             return new_var
 
         new_var = self.from_expression(super().log(var2))
@@ -384,6 +452,161 @@ class FMExpression(Expression):
         """
         return self.__pow__(0.5)
 
+    def sum(self):
+        """
+        Sum function for FMExpression, sums the values and each gradient
+        Args:
+            None
+        Returns:
+            a new FMExpression that represents the sum
+        """
+        new_var = self.from_expression(super().sum())
+        new_var.grad = {k: np.atleast_1d(np.sum(v)) for k, v in self.grad.items()}
+        return new_var
+
+    def mean(self):
+        """
+        Mean function for FMExpression, averages the values and each gradient
+        Args:
+            None
+        Returns:
+            a new FMExpression that represents the mean
+        """
+        new_var = self.from_expression(super().mean())
+        new_var.grad = {k: np.atleast_1d(np.sum(v) / self.value.size) for k, v in self.grad.items()}
+        return new_var
+
+    def prod(self):
+        """
+        Product function for FMExpression, each gradient is weighted by the product of the other elements
+        Args:
+            None
+        Returns:
+            a new FMExpression that represents the product
+        """
+        new_var = self.from_expression(super().prod())
+        weight = prod_partials(self.value)
+        new_var.grad = {k: np.atleast_1d(np.sum(np.multiply(v, weight))) for k, v in self.grad.items()}
+        return new_var
+
+    def norm(self):
+        """
+        Euclidean norm function for FMExpression, each gradient is weighted by self / norm
+        Args:
+            None
+        Returns:
+            a new FMExpression that represents the norm
+        """
+        new_var = self.from_expression(super().norm())
+        weight = norm_partials(self.value, new_var.value)
+        new_var.grad = {k: np.atleast_1d(np.sum(np.multiply(v, weight))) for k, v in self.grad.items()}
+        return new_var
+
+    def dot(self, var2):
+        """
+        Dot product function for FMExpression, sums the elementwise products and combines the gradient dictionaries
+        Args:
+            var2: another variable either of type FMExpression or a constant numpy array
+        Returns:
+            a new FMExpression that represents the dot product
+        """
+        if (not isinstance(var2, (FMExpression, np.ndarray))):
+            raise TypeError("Needs to be type numpy array or FMExpression")
+
+        new_var = self.from_expression(super().dot(var2))
+
+        if (isinstance(var2, np.ndarray)):
+            new_var.grad = {k: np.atleast_1d(np.sum(np.multiply(v, var2))) for k, v in self.grad.items()}
+            return new_var
+
+        new_var.grad = {}
+        for key in set(list(self.grad.keys()) + list(var2.grad.keys())):
+            if key in self.grad and key in var2.grad:
+                new_var.grad[key] = np.atleast_1d(np.sum(np.multiply(self.grad[key], var2.value) + np.multiply(self.value, var2.grad[key])))
+            elif key in self.grad:
+                new_var.grad[key] = np.atleast_1d(np.sum(np.multiply(self.grad[key], var2.value)))
+            else:
+                new_var.grad[key] = np.atleast_1d(np.sum(np.multiply(self.value, var2.grad[key])))
+
+        return new_var
+
+    def logsumexp(self):
+        """
+        Logsumexp function for FMExpression, each gradient is weighted by the softmax of self
+        Args:
+            None
+        Returns:
+            a new FMExpression that represents the logsumexp
+        """
+        new_var = self.from_expression(super().logsumexp())
+        weight = np.exp(self.value - new_var.value)
+        new_var.grad = {k: np.atleast_1d(np.sum(np.multiply(v, weight))) for k, v in self.grad.items()}
+        return new_var
+
+    def softmax(self):
+        """
+        Softmax function for FMExpression, each gradient v becomes s * (v - sum(s * v)) where s is the softmax
+        Args:
+            None
+        Returns:
+            a new FMExpression that represents the softmax
+        """
+        new_var = self.from_expression(super().softmax())
+        s = new_var.value
+        new_var.grad = {k: s * (v - np.sum(s * v)) for k, v in self.grad.items()}
+        return new_var
+
+    def log_softmax(self):
+        """
+        Log-softmax function for FMExpression, each gradient v becomes v - sum(s * v) where s is the softmax
+        Args:
+            None
+        Returns:
+            a new FMExpression that represents the log-softmax
+        """
+        new_var = self.from_expression(super().log_softmax())
+        s = np.exp(new_var.value)
+        new_var.grad = {k: np.broadcast_to(v - np.sum(s * v), s.shape) for k, v in self.grad.items()}
+        return new_var
+
+    def softplus(self):
+        """
+        Softplus function for FMExpression, each gradient is weighted by sigmoid(self) = exp(self - softplus(self))
+        Args:
+            None
+        Returns:
+            a new FMExpression that represents the softplus
+        """
+        new_var = self.from_expression(super().softplus())
+        weight = np.exp(self.value - new_var.value)
+        new_var.grad = {k: np.multiply(v, weight) for k, v in self.grad.items()}
+        return new_var
+
+    def logistic_loss(self, labels):
+        """
+        Logistic loss function for FMExpression, each gradient is weighted by sigmoid(self) - labels
+        Args:
+            labels: int, float or numpy array of targets in [0, 1], broadcastable to the shape of self
+        Returns:
+            a new FMExpression that represents the elementwise loss
+        """
+        new_var = self.from_expression(super().logistic_loss(labels))
+        weight = np.exp(self.value - new_var.value - labels * self.value) - labels
+        new_var.grad = {k: np.multiply(v, weight) for k, v in self.grad.items()}
+        return new_var
+
+    def squared_norm(self):
+        """
+        Squared norm function for FMExpression, each gradient is weighted by 2 * self
+        Args:
+            None
+        Returns:
+            a new FMExpression that represents the squared norm
+        """
+        new_var = self.from_expression(super().squared_norm())
+        new_var.grad = {k: np.atleast_1d(2 * np.sum(np.multiply(v, self.value))) for k, v in self.grad.items()}
+        return new_var
+
     def value(self, *args):
         """
         Gets the value of a FMExpression object
@@ -413,6 +636,17 @@ class FMExpression(Expression):
         if (len(args) == 2 and isinstance(args[0], int) and isinstance(args[1], str)):
             return self.grad[args[1]][args[0]]
 
+    def graph_stats(self):
+        """
+        Describes the size and estimated cost of the graph ending at this FMExpression
+        Args:
+            None
+        Returns:
+            a dictionary of graph statistics, see introspection.graph_stats
+        """
+        from .introspection import graph_stats
+        return graph_stats(self)
+
     @staticmethod
     def vec(*args):
         """
@@ -444,4 +678,4 @@ class FMExpression(Expression):
         Returns:
             FMExpression variable of Expression object
         """
-        return FMExpression(expr.value)
\ No newline at end of file
+        return FMExpression(expr.value, copy=False)
\ No newline at end of file
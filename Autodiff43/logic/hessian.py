@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+
+"""
+This module contains sparse Hessians of scalar RMExpression graphs by edge-pushing.
+
+Edge-pushing (Gower and Mello, 2012) is a second order reverse sweep. Going from the root
+towards the leaves, every node i carries its adjoint and the nonlinear interactions recorded
+so far, a symmetric sparse map W of the pairs of nodes {j, k} with a nonzero second derivative.
+When i is processed, its entries in W are pushed onto its parents through the partials
+(edge weights) of i, the second partials of its own op (Op.second in ops.py) scaled by its
+adjoint are added between its parents, and its adjoint is passed on as in a first order sweep.
+Only pairs that actually interact are ever stored, so the cost follows the number of
+nonzeros of the Hessian and the graph size rather than n^2.
+
+Every node except the inputs must be a scalar. A vector input can be used through indexing
+of single elements, each element being one variable.
+"""
+import numpy as np
+
+from .ops import get_op
+from .utils import topological_order
+
+class SparseHessian:
+    """The lower triangle of a symmetric Hessian in COO form, and the gradient from the same sweep."""
+
+    def __init__(self, rows, cols, data, grad):
+        """
+        Args:
+            rows, cols, data: the coordinates (rows >= cols) and values of the entries of the lower triangle
+            grad: the gradient, shape (n,)
+        """
+        self.rows = rows
+        self.cols = cols
+        self.data = data
+        self.grad = grad
+        self.shape = (len(grad), len(grad))
+
+    @property
+    def nnz(self):
+        """The number of stored entries of the lower triangle."""
+        return len(self.data)
+
+    def toarray(self):
+        """The full symmetric Hessian as a dense array."""
+        H = np.zeros(self.shape)
+        H[self.rows, self.cols] = self.data
+        H[self.cols, self.rows] = self.data
+        return H
+
+    def __repr__(self):
+        return f'SparseHessian(shape={self.shape}, nnz={self.nnz})'
+
+def _add(W, j, k, value):
+    row = W.setdefault(j, {})
+    row[k] = row.get(k, 0.0) + value
+    if (j != k):
+        row = W.setdefault(k, {})
+        row[j] = row.get(j, 0.0) + value
+
+def _scalar(weight, op):
+    if (callable(weight) or np.size(weight) != 1):
+        raise NotImplementedError(f"The sparse Hessian needs scalar partials, not those of '{op}'.")
+    return float(np.ravel(weight)[0])
+
+def _variables(order, inputs):
+    """The offset of the first variable of every input leaf, and the number of variables."""
+    if (all(isinstance(x, str) for x in inputs)):
+        leaves = {}
+        for node in order:
+            if (len(node.node_edges) == 0 and node.name in inputs):
+                leaves.setdefault(node.name, node)
+        missing = [name for name in inputs if name not in leaves]
+        if (missing):
+            raise ValueError(f"No leaf named {missing[0]!r} in the graph.")
+        inputs = [leaves[name] for name in inputs]
+
+    offsets = {}
+    n = 0
+    for leaf in inputs:
+        offsets[leaf] = n
+        n += leaf.value.size
+    return offsets, n
+
+def hessian(root, inputs):
+    """
+    Computes the Hessian of a scalar RMExpression with respect to its inputs by edge-pushing
+    Args:
+        root: a scalar RMExpression
+        inputs: the leaf RMExpressions (or their names) whose elements are the variables, in order
+    Returns:
+        a SparseHessian
+    """
+    if (root.value.size != 1):
+        raise ValueError("The Hessian needs a scalar RMExpression.")
+
+    order = topological_order([root])
+    offsets, n = _variables(order, inputs)
+
+    # Vertices: variables are 0..n-1, other scalar nodes n + their position, constants have none
+    vertex = {}
+    for i, node in enumerate(order):
+        if (node in offsets):
+            if (node.value.size == 1):
+                vertex[node] = offsets[node]
+            continue
+        if (len(node.node_edges) == 0):
+            continue
+        child = node.node_edges[0][0]
+        if (node.op == 'getitem' and child in offsets and node.value.size == 1):
+            position = np.arange(child.value.size).reshape(child.value.shape)[node.op_args[0]]
+            vertex[node] = offsets[child] + int(np.ravel(position)[0])
+            continue
+        if (node.value.size != 1):
+            raise NotImplementedError(f"The sparse Hessian needs scalar nodes, a '{node.op}' node has shape {node.value.shape}.")
+        vertex[node] = n + i
+
+    adjoints = {vertex[root]: 1.0} if root in vertex else {}
+    W = {}
+    for node in reversed(order):
+        v = vertex.get(node)
+        if (v is None or v < n):
+            continue
+        adjoint = adjoints.pop(v, 0.0)
+
+        # Partials of node with respect to each parent vertex, merged when a parent appears twice (e.g. x * x)
+        parents = []
+        phi = {}
+        for (child, weight) in node.node_edges:
+            if (child in offsets and child not in vertex):
+                raise NotImplementedError("A vector input can only be used through indexing of single elements.")
+            j = vertex.get(child)
+            parents.append(j)
+            if (j is not None):
+                phi[j] = phi.get(j, 0.0) + _scalar(weight, node.op)
+
+        # Pushing: the interactions of v become interactions of its parents
+        row = W.pop(v, {})
+        for p in row:
+            if (p != v):
+                del W[p][v]
+        for p, w in row.items():
+            if (p == v):
+                for j, phi_j in phi.items():
+                    for k, phi_k in phi.items():
+                        if (j <= k):
+                            _add(W, j, k, phi_j * phi_k * w)
+            else:
+                for j, phi_j in phi.items():
+                    _add(W, j, p, (2 if j == p else 1) * phi_j * w)
+
+        # Creating: the nonlinearity of the op itself
+        if (adjoint != 0):
+            values = [child.value for (child, _) in node.node_edges]
+            for (a, b, second) in get_op(node.op).second(values, node.op_args, node.value):
+                j, k = parents[a], parents[b]
+                if (j is None or k is None):
+                    continue
+                value = adjoint * _scalar(second, node.op)
+                _add(W, j, k, 2 * value if (a != b and j == k) else value)
+
+        # Adjoints, as in a first order sweep
+        for j, phi_j in phi.items():
+            adjoints[j] = adjoints.get(j, 0.0) + phi_j * adjoint
+
+    rows, cols, data = [], [], []
+    for j in sorted(W):
+        for k in sorted(W[j]):
+            if (j >= k):
+                rows.append(j)
+                cols.append(k)
+                data.append(W[j][k])
+
+    grad = np.zeros(n)
+    for j, value in adjoints.items():
+        if (j < n):
+            grad[j] = value
+
+    return SparseHessian(np.array(rows, dtype=np.intp), np.array(cols, dtype=np.intp), np.array(data, dtype=float), grad)
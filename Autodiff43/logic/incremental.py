@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+
+"""
+This module contains incremental recomputation of a recorded RMExpression graph after leaf edits.
+
+An IncrementalGraph indexes the graph below a root once, including the consumers of every
+node, which RMExpression does not keep. Setting the value of a leaf marks everything downstream
+of it dirty. The next evaluation recomputes the values and edge weights of the dirty nodes only,
+with the rules in ops.py, and writes them back to the nodes. The reverse sweep keeps the
+contribution of every edge to its child's adjoint. After an edit it only recomputes the edges
+whose weight changed or whose consumer's adjoint changed, and only re-sums the adjoints of their
+children. Ops whose edge weights depend only on shapes and constants (add, sum, concat, ...)
+never invalidate their edges, so the work after a single leaf edit is proportional to the part
+of the graph the edit actually affects.
+"""
+import heapq
+
+import numpy as np
+
+from .ops import get_op
+from .precision import cast
+from .utils import topological_order, push_adjoint
+
+# Ops whose edge weights depend only on shapes and constant operands, so they never change when values do
+CONSTANT_WEIGHTS = {'add', 'sub', 'rsub', 'neg', 'sum', 'mean', 'getitem', 'take', 'concat'}
+# Ops whose edge weights are constant when they have a single parent, the other operand being a constant
+CONSTANT_WEIGHTS_UNARY = {'mul', 'truediv', 'matmul', 'rmatmul', 'dot'}
+
+def _same_weight(a, b):
+    """True if two edge weights are known to be equal, callables only when they are the same object."""
+    if (a is b):
+        return True
+    if (callable(a) or callable(b) or np.shape(a) != np.shape(b)):
+        return False
+    return bool(np.array_equal(a, b))
+
+class IncrementalGraph:
+    """The graph below an RMExpression root, re-evaluated and re-differentiated incrementally after leaf edits."""
+
+    def __init__(self, root):
+        """
+        Args:
+            root: the RMExpression output, its graph must not be extended with new operations below it afterwards
+        """
+        self.root = root
+        self.order = topological_order([root]) # leaves first, the root last
+        self.index = {node: i for i, node in enumerate(self.order)}
+
+        self.consumers = [[] for _ in self.order] # for each node, the (consumer position, edge number) of its incoming adjoints
+        for i, node in enumerate(self.order):
+            for k, (child, _) in enumerate(node.node_edges):
+                self.consumers[self.index[child]].append((i, k))
+
+        self.leaves = {}
+        for node in self.order:
+            if (len(node.node_edges) == 0 and node.name is not None):
+                self.leaves.setdefault(node.name, []).append(node)
+
+        self.dirty = set()     # positions whose value and edge weights are out of date
+        self.old_edges = {}    # position -> node_edges as of the last sweep, for nodes whose edge weights were recomputed since
+        self.adjoints = None
+        self.contributions = None
+        self.info = {}
+
+    def set_value(self, leaf, value):
+        """
+        Changes the value of a leaf and marks everything downstream of it dirty
+        Args:
+            leaf: the leaf RMExpression or its name (every leaf with that name is changed)
+            value: the new value, of the same shape
+        Returns:
+            None
+        """
+        leaves = self.leaves.get(leaf, []) if isinstance(leaf, str) else [leaf]
+        if (len(leaves) == 0 or any(node not in self.index or len(node.node_edges) for node in leaves)):
+            raise KeyError(f"{leaf!r} is not a leaf of the graph.")
+
+        for node in leaves:
+            new_value = cast(value).reshape(node.value.shape) if np.size(value) == node.value.size else None
+            if (new_value is None):
+                raise ValueError(f"The new value must have the shape {node.value.shape}.")
+            node.value = new_value.copy()
+            self._mark(self.index[node])
+
+    def _mark(self, i):
+        stack = [i]
+        while stack:
+            j = stack.pop()
+            for (consumer, _) in self.consumers[j]:
+                if (consumer not in self.dirty):
+                    self.dirty.add(consumer)
+                    stack.append(consumer)
+
+    def evaluate(self):
+        """
+        Recomputes the values and edge weights of the dirty nodes, in topological order
+        Args:
+            None
+        Returns:
+            the value of the root
+        """
+        recomputed = 0
+        for i in sorted(self.dirty):
+            node = self.order[i]
+            children = [child for (child, _) in node.node_edges]
+            op = get_op(node.op)
+            values = [child.value for child in children]
+            value = cast(op.forward(values, node.op_args))
+            if (value.shape != node.value.shape):
+                raise ValueError(f"The value of a '{node.op}' node changed shape from {node.value.shape} to {value.shape}.")
+            node.value = value
+
+            if (not (node.op in CONSTANT_WEIGHTS or (node.op in CONSTANT_WEIGHTS_UNARY and len(children) == 1))):
+                weights = op.partials(values, node.op_args, value)
+                self.old_edges.setdefault(i, node.node_edges)
+                node.node_edges = [(child, weight) for child, weight in zip(children, weights)]
+            recomputed += 1
+
+        if (self.dirty):
+            self.root.jacobian = None
+        self.dirty = set()
+        self.info['recomputed'] = recomputed
+        return self.root.value
+
+    def gradients(self):
+        """
+        Derivative of the root (the sum of its elements) with respect to every named leaf, updating only what changed
+        Args:
+            None
+        Returns:
+            a dictionary mapping the name of each leaf to its gradient
+        """
+        self.evaluate()
+        root = len(self.order) - 1
+
+        if (self.adjoints is None):
+            # The first sweep computes every edge
+            self.adjoints = [None] * len(self.order)
+            self.contributions = [[None] * len(node.node_edges) for node in self.order]
+            self.adjoints[root] = np.ones(self.root.value.shape, dtype=self.root.value.dtype)
+            changed = set(range(len(self.order)))
+            pending = [-root]
+        else:
+            # Only the edges of nodes whose weights were recomputed, and then of the nodes whose adjoint changed
+            changed = set()
+            pending = [-i for i in self.old_edges]
+        heapq.heapify(pending)
+        queued = set(-i for i in pending)
+
+        pushed = 0
+        while pending:
+            i = -heapq.heappop(pending) # consumers have larger positions, so they are all done before their children
+            node = self.order[i]
+            if (i in changed and i != root):
+                contributions = [self.contributions[c][k] for (c, k) in self.consumers[i]]
+                self.adjoints[i] = contributions[0] if len(contributions) == 1 else np.sum(contributions, axis=0)
+
+            old = self.old_edges.get(i)
+            for k, (child, weight) in enumerate(node.node_edges):
+                if (i not in changed and _same_weight(old[k][1], weight)):
+                    continue
+                self.contributions[i][k] = push_adjoint(weight, self.adjoints[i], child.value.shape)
+                pushed += 1
+                j = self.index[child]
+                changed.add(j)
+                if (j not in queued):
+                    queued.add(j)
+                    heapq.heappush(pending, -j)
+
+        self.old_edges = {}
+        self.info['pushed'] = pushed
+
+        ret = {}
+        for name, leaves in self.leaves.items():
+            for leaf in leaves:
+                grad = self.adjoints[self.index[leaf]]
+                ret[name] = grad.copy() if name not in ret else ret[name] + grad
+        return ret
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+
+"""
+This module contains functions that describe the size and estimated cost of an Expression graph
+without running a backward pass.
+"""
+import numpy as np
+
+from .precision import get_dtype
+from .utils import topological_order
+
+# Rough floating point operation counts per element for each op, used for cost estimates
+FLOP_COSTS = {
+    'add': 1, 'sub': 1, 'rsub': 1, 'mul': 1, 'neg': 1,
+    'truediv': 4, 'rtruediv': 4,
+    'pow': 40, 'exp': 20, 'log': 20,
+    'sin': 15, 'cos': 15, 'tan': 20,
+    'arcsin': 25, 'arccos': 25, 'arctan': 25,
+    'sinh': 25, 'cosh': 25, 'tanh': 25, 'sigmoid': 25,
+    'sum': 1, 'mean': 1, 'prod': 1, 'norm': 2, 'dot': 2,
+    'getitem': 1, 'take': 1, 'concat': 1,
+}
+# Reductions cost per element of their operand rather than of their (single element) value
+REDUCTIONS = {'sum', 'mean', 'prod', 'norm', 'dot'}
+DEFAULT_FLOP_COST = 10
+
+def _nbytes(value):
+    """Bytes held by a value, edge weight or gradient (0 for non-array objects such as callables)."""
+    if (isinstance(value, np.ndarray)):
+        return value.nbytes
+    if (isinstance(value, (int, float, np.number))):
+        return np.asarray(value).nbytes
+    return 0
+
+def _op_flops(node):
+    """Estimated floating point operations to compute the value of node."""
+    if (node.op in ('matmul', 'rmatmul')):
+        # Two flops per multiply-add, one multiply-add per output element per inner dimension
+        parent = node.node_edges[0][0].value
+        if (node.op == 'matmul'):
+            inner = parent.shape[-1]
+        else:
+            inner = parent.shape[0] if parent.ndim == 1 else parent.shape[-2]
+        return 2 * node.value.size * inner
+    if (node.op in REDUCTIONS):
+        return FLOP_COSTS[node.op] * max(child.value.size for child, _ in node.node_edges)
+    return FLOP_COSTS.get(node.op, DEFAULT_FLOP_COST) * node.value.size
+
+def graph_stats(root):
+    """
+    Describes the graph below an RMExpression root, or the data held by an FMExpression
+    Args:
+        root: an RMExpression or FMExpression
+    Returns:
+        a dictionary with node and edge counts, depth, maximum fan-in and fan-out, bytes held in
+        values, gradients and edge weights, and estimated FLOP counts for a forward and a backward pass
+    """
+    if (not hasattr(root, 'node_edges')):
+        return _forward_mode_stats(root)
+
+    nodes = topological_order([root])
+    fan_out = {}
+    depth = {}
+    stats = {
+        'node_count': len(nodes),
+        'edge_count': 0,
+        'leaf_count': 0,
+        'depth': 0,
+        'max_fan_in': 0,
+        'max_fan_out': 0,
+        'value_bytes': 0,
+        'grad_bytes': 0,
+        'edge_weight_bytes': 0,
+        'forward_flops': 0,
+        'backward_flops': 0,
+    }
+
+    for node in nodes:
+        size = node.value.size
+        stats['value_bytes'] += node.value.nbytes
+        # A backward pass leaves a float gradient of the node's shape on every node
+        stats['grad_bytes'] += max(_nbytes(node.grad), size * get_dtype().itemsize)
+        stats['edge_count'] += len(node.node_edges)
+        stats['max_fan_in'] = max(stats['max_fan_in'], len(node.node_edges))
+
+        if (len(node.node_edges) == 0):
+            stats['leaf_count'] += 1
+            depth[node] = 0
+            continue
+
+        depth[node] = 1 + max(depth[child] for (child, _) in node.node_edges)
+
+        # Construction computes the value and one edge weight per input
+        cost = _op_flops(node)
+        stats['forward_flops'] += cost * (1 + len(node.node_edges))
+
+        for (child, edge_weight) in node.node_edges:
+            fan_out[child] = fan_out.get(child, 0) + 1
+            stats['edge_weight_bytes'] += _nbytes(edge_weight)
+            if (callable(edge_weight)):
+                # A matrix product per input
+                stats['backward_flops'] += cost
+            else:
+                # One multiply and one add per element when the adjoint is pushed to the child
+                stats['backward_flops'] += 2 * max(size, child.value.size)
+
+    stats['depth'] = depth[root]
+    stats['max_fan_out'] = max(fan_out.values(), default = 0)
+    return stats
+
+def _forward_mode_stats(root):
+    """
+    FMExpression objects evaluate eagerly and keep no graph, so only the data held by the node
+    itself can be reported. The forward pass that produced it is not known, and forward mode has no
+    backward pass. flops_per_op estimates the cost of one more elementwise op on this node, about
+    one multiply-add per element per tangent direction.
+    """
+    grads = root.grad if isinstance(root.grad, dict) else {}
+    size = root.value.size
+
+    return {
+        'node_count': 1,
+        'edge_count': 0,
+        'leaf_count': 1,
+        'depth': 0,
+        'max_fan_in': 0,
+        'max_fan_out': 0,
+        'value_bytes': root.value.nbytes,
+        'grad_bytes': sum(_nbytes(v) for v in grads.values()),
+        'edge_weight_bytes': 0,
+        'forward_flops': None,
+        'backward_flops': 0,
+        'tangent_directions': len(grads),
+        'flops_per_op': size * (1 + 2 * len(grads)),
+    }
@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+
+"""
+This module contains our LazyExpression class, which records operations without computing them.
+
+Operators on a LazyExpression only add a node to the DAG, using the same op codes and constant
+operands as RMExpression (see ops.py). Values are materialized on demand by evaluate(), which
+sees the whole graph first: repeated subexpressions are computed once, only the ancestors of
+the requested nodes are computed, and every intermediate is released after its last use.
+Elementwise operations write into a dying input or a pooled buffer of the right shape instead
+of allocating, so a chain of elementwise operations runs in a single temporary. Derivatives
+are computed on demand by grad() with a reverse sweep over the same schedule.
+"""
+import numpy as np
+
+from .base import Expression
+from .ops import get_op
+from .precision import get_dtype
+from .utils import topological_order, push_adjoint
+
+class LazyExpression:
+    def __init__(self, value = None, name = None, op = None, parents = (), args = ()):
+        """
+        Takes in the value of a leaf and an optional name, or the op code, parent nodes and constant operands of an operation
+        """
+        self.name = name
+        self.op = op
+        self.op_args = tuple(args)
+        self.node_edges = [(parent, None) for parent in parents] # Edge weights are only known once evaluated
+        self._value = None if op is not None else Expression(value).value
+
+    def __repr__(self):
+        if (self.op is None):
+            return f'LazyExpression({self._value}, {self.name})'
+        return f'LazyExpression(<{self.op}>)'
+
+    @property
+    def value(self):
+        """The value of the expression, evaluated on first access."""
+        return self.evaluate()
+
+    def _record(self, op, var2 = None, args = (), valid = (int, float)):
+        if (var2 is None):
+            return LazyExpression(op = op, parents = (self,), args = args)
+        if (isinstance(var2, LazyExpression)):
+            return LazyExpression(op = op, parents = (self, var2), args = args)
+        if (isinstance(var2, valid) and not isinstance(var2, bool)):
+            return LazyExpression(op = op, parents = (self,), args = (var2,) + tuple(args))
+        raise TypeError("Needs to be type int, float, or LazyExpression")
+
+    def __add__(self, var2):
+        return self._record('add', var2)
+
+    def __radd__(self, var2):
+        return self._record('add', var2)
+
+    def __sub__(self, var2):
+        return self._record('sub', var2)
+
+    def __rsub__(self, var2):
+        return self._record('rsub', var2)
+
+    def __mul__(self, var2):
+        return self._record('mul', var2)
+
+    def __rmul__(self, var2):
+        return self._record('mul', var2)
+
+    def __truediv__(self, var2):
+        return self._record('truediv', var2)
+
+    def __rtruediv__(self, var2):
+        return self._record('rtruediv', var2)
+
+    def __pow__(self, var2):
+        return self._record('pow', var2)
+
+    def __neg__(self):
+        return self._record('neg')
+
+    def __matmul__(self, var2):
+        return self._record('matmul', var2, valid = np.ndarray)
+
+    def __rmatmul__(self, var2):
+        return self._record('rmatmul', var2, valid = np.ndarray)
+
+    def __getitem__(self, index):
+        return LazyExpression(op = 'getitem', parents = (self,), args = (index,))
+
+    def exp(self, var2 = None):
+        """Represents e ** self, or var2 ** self when var2 is given."""
+        return self._record('exp', var2)
+
+    def log(self, var2 = None):
+        """Represents ln(self), or the logarithm of self in base var2 when var2 is given."""
+        return self._record('log', var2)
+
+    def sqrt(self):
+        return self.__pow__(0.5)
+
+    def sin(self):
+        return self._record('sin')
+
+    def cos(self):
+        return self._record('cos')
+
+    def tan(self):
+        return self._record('tan')
+
+    def arcsin(self):
+        return self._record('arcsin')
+
+    def arccos(self):
+        return self._record('arccos')
+
+    def arctan(self):
+        return self._record('arctan')
+
+    def sinh(self):
+        return self._record('sinh')
+
+    def cosh(self):
+        return self._record('cosh')
+
+    def tanh(self):
+        return self._record('tanh')
+
+    def sigmoid(self):
+        return self._record('sigmoid')
+
+    def sum(self):
+        return self._record('sum')
+
+    def mean(self):
+        return self._record('mean')
+
+    def prod(self):
+        return self._record('prod')
+
+    def norm(self):
+        return self._record('norm')
+
+    def dot(self, var2):
+        return self._record('dot', var2, valid = np.ndarray)
+
+    def logsumexp(self):
+        return self._record('logsumexp')
+
+    def softmax(self):
+        return self._record('softmax')
+
+    def log_softmax(self):
+        return self._record('log_softmax')
+
+    def softplus(self):
+        return self._record('softplus')
+
+    def logistic_loss(self, labels):
+        if (isinstance(labels, LazyExpression)):
+            raise TypeError("Needs to be type int, float, or numpy array")
+        return self._record('logistic_loss', labels, valid = (int, float, np.ndarray))
+
+    def squared_norm(self):
+        return self._record('squared_norm')
+
+    def evaluate(self):
+        """
+        Computes the value of the expression, and nothing it does not depend on
+        Args:
+            None
+        Returns:
+            the value, which is kept on the node so later calls are free
+        """
+        return evaluate(self)[0]
+
+    def grad(self, name):
+        """
+        Computes the derivative of the expression (the sum of its elements, for a vector expression) with respect to a leaf
+        Args:
+            name: the name of the leaf
+        Returns:
+            the gradient, with the shape of the leaf (0 if the expression does not depend on it)
+        """
+        return gradients(self).get(name, 0)
+
+    @staticmethod
+    def vec(*args):
+        """
+        Combines different LazyExpressions into a vector to represent vector functions
+        Args:
+            a list of LazyExpressions (or int, float) to be combined into a vector
+        Returns:
+            A new LazyExpression concatenating the flattened values
+        """
+        parts = [x if isinstance(x, LazyExpression) else LazyExpression(x) for x in args]
+        return LazyExpression(op = 'concat', parents = parts)
+
+# Operations that can write their result into a given buffer: op code -> function (values, args, out)
+def _binary_kernel(ufunc):
+    return lambda v, a, out: ufunc(v[0], v[1] if len(v) == 2 else a[0], out = out)
+
+def _unary_kernel(ufunc):
+    return lambda v, a, out: ufunc(v[0], out = out)
+
+KERNELS = {
+    'add': _binary_kernel(np.add),
+    'sub': _binary_kernel(np.subtract),
+    'mul': _binary_kernel(np.multiply),
+    'truediv': _binary_kernel(np.divide),
+    'pow': _binary_kernel(np.power),
+    'rsub': lambda v, a, out: np.subtract(a[0], v[0], out = out),
+    'rtruediv': lambda v, a, out: np.divide(a[0], v[0], out = out),
+    'neg': _unary_kernel(np.negative),
+    'sin': _unary_kernel(np.sin),
+    'cos': _unary_kernel(np.cos),
+    'tan': _unary_kernel(np.tan),
+    'arcsin': _unary_kernel(np.arcsin),
+    'arccos': _unary_kernel(np.arccos),
+    'arctan': _unary_kernel(np.arctan),
+    'sinh': _unary_kernel(np.sinh),
+    'cosh': _unary_kernel(np.cosh),
+    'tanh': _unary_kernel(np.tanh),
+}
+# exp and log are only single ufuncs without a base
+KERNELS_NO_ARGS = {'exp': _unary_kernel(np.exp), 'log': _unary_kernel(np.log)}
+
+def _kernel(node, nparents):
+    if (node.op in KERNELS):
+        return KERNELS[node.op]
+    if (node.op in KERNELS_NO_ARGS and nparents == 1 and len(node.op_args) == 0):
+        return KERNELS_NO_ARGS[node.op]
+    return None
+
+def _cse_key(node, index):
+    """Key identifying nodes that compute the same thing, None if the constant operands cannot be compared cheaply."""
+    if (node.op is None or not all(isinstance(a, (int, float)) for a in node.op_args)):
+        return None
+    return (node.op, tuple(index[parent] for (parent, _) in node.node_edges), node.op_args)
+
+def schedule(roots, prune = True):
+    """
+    Orders the graph below roots for evaluation, merging repeated subexpressions
+    Args:
+        roots: list of LazyExpressions
+        prune: leave out everything below nodes that already hold a value
+    Returns:
+        a tuple (order, parents, last_use, root_index): the nodes in evaluation order, the positions of the parents of
+        each node, for each position the last position that reads it (None for nodes nothing reads), and the
+        positions of the roots
+    """
+    # Nodes that already hold a value are not expanded, so nothing below them is recomputed
+    nodes = topological_order(roots, stop = (lambda node: node._value is not None) if prune else None)
+    expanded = set(node for node in nodes if not (prune and node._value is not None))
+    index = {}
+    order = []
+    seen = {}
+    for node in nodes:
+        key = _cse_key(node, index) if node in expanded else None
+        if (key is not None and key in seen):
+            index[node] = seen[key]
+            continue
+        index[node] = len(order)
+        order.append(node)
+        if (key is not None):
+            seen[key] = index[node]
+
+    parents = [tuple(index[parent] for (parent, _) in node.node_edges) if node in expanded else () for node in order]
+    last_use = [None] * len(order)
+    for i, ps in enumerate(parents):
+        for p in ps:
+            last_use[p] = i
+
+    return order, parents, last_use, [index[root] for root in roots]
+
+def evaluate(*roots, info = None):
+    """
+    Materializes the values of several LazyExpressions, sharing the work they have in common
+    Args:
+        roots: the LazyExpressions to evaluate
+        info: optional dictionary that receives the number of nodes computed, buffers allocated and reused, and
+        the peak number of bytes held by intermediates (including released buffers kept for reuse)
+    Returns:
+        list with the value of every root
+    """
+    values, _, _, root_index = _run(list(roots), False, info)
+    return [values[r] for r in root_index]
+
+def _run(roots, keep_all, info):
+    """
+    Runs the forward schedule, see evaluate
+    Args:
+        keep_all: keep the value of every node (as needed by a reverse sweep) instead of releasing intermediates
+    Returns:
+        a tuple (values, order, parents, root_index) with the value of every scheduled node (None once released)
+    """
+    order, parents, last_use, root_index = schedule(roots, prune = not keep_all)
+    keep = set(root_index)
+
+    values = [None] * len(order)
+    owned = set() # positions whose array was allocated here and may be reused once dead
+    pool = {}     # (shape, dtype) -> released arrays
+    stats = {'computed': 0, 'allocated': 0, 'reused': 0, 'peak_bytes': 0}
+    live_bytes = 0
+
+    for i, node in enumerate(order):
+        if (node._value is not None):
+            values[i] = node._value
+            continue
+
+        parent_values = [values[p] for p in parents[i]]
+        kernel = _kernel(node, len(parent_values))
+        out = None
+        if (kernel is not None):
+            operands = parent_values + list(node.op_args)
+            shape = np.broadcast_shapes(*[np.shape(x) for x in operands])
+            dtype = np.result_type(*operands)
+            # Buffers are reused for results in the dtype of the precision policy, e.g. float32 for memory-bound jobs
+            if (dtype == get_dtype()):
+                # A dying input of the right shape, then a pooled buffer
+                for p in parents[i]:
+                    if (p in owned and last_use[p] == i and p not in keep and not keep_all and values[p].shape == shape and values[p].dtype == dtype):
+                        out = values[p]
+                        owned.discard(p)
+                        live_bytes -= out.nbytes
+                        stats['reused'] += 1
+                        break
+                if (out is None and not keep_all and pool.get((shape, dtype))):
+                    out = pool[(shape, dtype)].pop()
+                    live_bytes -= out.nbytes
+                    stats['reused'] += 1
+
+        if (out is not None):
+            values[i] = kernel(parent_values, node.op_args, out)
+        else:
+            values[i] = np.asarray(get_op(node.op).forward(parent_values, node.op_args))
+            stats['allocated'] += 1
+            # Results that are views of an input (e.g. slices) pin that input's buffer
+            for p in parents[i]:
+                if (values[i].base is not None and np.may_share_memory(values[i], values[p])):
+                    owned.discard(p)
+
+        stats['computed'] += 1
+        if (values[i].base is None):
+            owned.add(i)
+        live_bytes += values[i].nbytes
+        stats['peak_bytes'] = max(stats['peak_bytes'], live_bytes)
+
+        if (not keep_all):
+            for p in set(parents[i]):
+                if (last_use[p] == i and p not in keep and order[p]._value is None):
+                    if (p in owned):
+                        pool.setdefault((values[p].shape, values[p].dtype), []).append(values[p])
+                    else:
+                        live_bytes -= values[p].nbytes
+                    values[p] = None
+
+    for r in root_index:
+        order[r]._value = values[r]
+
+    if (info is not None):
+        info.update(stats)
+
+    return values, order, parents, root_index
+
+def gradients(root):
+    """
+    Computes the derivative of root (the sum of its elements) with respect to every leaf in one reverse sweep
+    Args:
+        root: a LazyExpression
+    Returns:
+        a dictionary mapping the name of each named leaf to its gradient
+    """
+    values, order, parents, root_index = _run([root], True, None)
+
+    adjoints = [None] * len(order)
+    adjoints[root_index[0]] = np.ones(np.shape(values[root_index[0]]))
+    for i in reversed(range(len(order))):
+        if (adjoints[i] is None or len(parents[i]) == 0):
+            continue
+        parent_values = [values[p] for p in parents[i]]
+        edge_weights = get_op(order[i].op).partials(parent_values, order[i].op_args, values[i])
+        for p, edge_weight in zip(parents[i], edge_weights):
+            contribution = push_adjoint(edge_weight, adjoints[i], np.shape(values[p]))
+            adjoints[p] = contribution if adjoints[p] is None else adjoints[p] + contribution
+
+    ret = {}
+    for i, node in enumerate(order):
+        if (node.op is None and node.name is not None and adjoints[i] is not None):
+            ret[node.name] = adjoints[i] if node.name not in ret else ret[node.name] + adjoints[i]
+    return ret
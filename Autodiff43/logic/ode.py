@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+
+"""
+This module contains ODE integrators that evolve parameter sensitivities with the state.
+
+For dy/dt = f(t, y, p), the sensitivity matrix S = dy/dp (n x m) follows dS/dt = J_y S + J_p,
+where J_y and J_p are the Jacobians of f. Every stage of a Runge-Kutta step evaluates f once
+with FMExpressions whose gradient dictionaries hold one tangent per parameter: the state
+carries column k of S under key 'p<k>' and the parameters carry the unit vector e_k. The
+tangent of f under that key is then exactly J_y S[:, k] + J_p e_k, so the sensitivities to all
+parameters come out of the same evaluations as the state, without forming J_y or recording a
+graph. This is the derivative of the discrete scheme itself, and memory stays at O(n x m)
+however many steps are taken.
+
+The integrators are the classical fixed step RK4 and the adaptive Dormand-Prince RK45, whose
+error control uses the state (and the sensitivities on request). Steps are shortened to land on
+the requested output times, so no interpolation is needed.
+"""
+import numpy as np
+
+from .forward_mode import FMExpression
+
+# Dormand-Prince 5(4) tableau, the last stage is the first stage of the next step (FSAL)
+DOPRI_C = np.array([0, 1 / 5, 3 / 10, 4 / 5, 8 / 9, 1, 1])
+DOPRI_A = [
+    [],
+    [1 / 5],
+    [3 / 40, 9 / 40],
+    [44 / 45, -56 / 15, 32 / 9],
+    [19372 / 6561, -25360 / 2187, 64448 / 6561, -212 / 729],
+    [9017 / 3168, -355 / 33, 46732 / 5247, 49 / 176, -5103 / 18656],
+    [35 / 384, 0, 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84],
+]
+# Fifth order weights (the last row of DOPRI_A) minus the embedded fourth order weights
+DOPRI_E = np.array([71 / 57600, 0, -71 / 16695, 71 / 1920, -17253 / 339200, 22 / 525, -1 / 40])
+
+METHODS = ('rk4', 'rk45')
+
+class ODEResult:
+    """The states and sensitivities of an integration at the output times."""
+
+    def __init__(self, t, y, sensitivities, success, nfev, nsteps, nrejected):
+        """
+        Args:
+            t: the output times, shape (k,)
+            y: the states, shape (k, n)
+            sensitivities: the sensitivities dy/dp, shape (k, n, m)
+            success: False if the integration stopped before the last output time
+            nfev: the number of evaluations of the right-hand side
+            nsteps, nrejected: the number of accepted and rejected steps
+        """
+        self.t = t
+        self.y = y
+        self.sensitivities = sensitivities
+        self.success = success
+        self.nfev = nfev
+        self.nsteps = nsteps
+        self.nrejected = nrejected
+
+    def __repr__(self):
+        return f'ODEResult(success={self.success}, {len(self.t)} output times, nsteps={self.nsteps}, nfev={self.nfev})'
+
+class SensitivityRHS:
+    """The right-hand side f(t, y, p), evaluated together with its directional derivatives along the sensitivities."""
+
+    def __init__(self, rhs, params):
+        """
+        Args:
+            rhs: function (t, y, p) -> dy/dt, with y and p FMExpression vectors, returning an FMExpression or a list of them
+            params: the parameter values, shape (m,)
+        """
+        self.rhs = rhs
+        self.params = params
+        self.keys = [f'p{k}' for k in range(len(params))]
+        eye = np.eye(len(params))
+        self.p = FMExpression(params, {key: eye[k] for k, key in enumerate(self.keys)})
+        self.nfev = 0
+
+    def __call__(self, t, y, S):
+        """
+        Args:
+            t: the time
+            y: the state, shape (n,)
+            S: the sensitivities, shape (n, m)
+        Returns:
+            a tuple (dy/dt, dS/dt) of shapes (n,) and (n, m)
+        """
+        self.nfev += 1
+        out = self.rhs(t, FMExpression(y, {key: S[:, k] for k, key in enumerate(self.keys)}), self.p)
+        if (isinstance(out, (list, tuple))):
+            out = FMExpression.vec(*out)
+        if (not isinstance(out, FMExpression)):
+            return np.broadcast_to(np.asarray(out, dtype=float), y.shape), np.zeros(S.shape)
+        if (out.value.shape != y.shape):
+            raise ValueError(f"The right-hand side has shape {out.value.shape}, the state has shape {y.shape}.")
+
+        grad = out.grad or {}
+        dS = np.zeros(S.shape)
+        for k, key in enumerate(self.keys):
+            if (key in grad):
+                dS[:, k] = np.broadcast_to(grad[key], y.shape)
+        return out.value, dS
+
+def rk4_step(f, t, y, S, h):
+    """
+    One classical Runge-Kutta step of the state and the sensitivities
+    Args:
+        f: a SensitivityRHS
+        t, y, S: the time, state and sensitivities
+        h: the step size
+    Returns:
+        a tuple (y, S) after the step
+    """
+    k1, K1 = f(t, y, S)
+    k2, K2 = f(t + h / 2, y + h / 2 * k1, S + h / 2 * K1)
+    k3, K3 = f(t + h / 2, y + h / 2 * k2, S + h / 2 * K2)
+    k4, K4 = f(t + h, y + h * k3, S + h * K3)
+    return y + h / 6 * (k1 + 2 * k2 + 2 * k3 + k4), S + h / 6 * (K1 + 2 * K2 + 2 * K3 + K4)
+
+def rk45_step(f, t, y, S, h, first):
+    """
+    One Dormand-Prince step of the state and the sensitivities
+    Args:
+        f: a SensitivityRHS
+        t, y, S: the time, state and sensitivities
+        h: the step size
+        first: the derivatives (dy/dt, dS/dt) at (t, y, S), the last stage of the previous step
+    Returns:
+        a tuple (y, S, last, error_y, error_S) with the fifth order solution after the step, the derivatives there,
+        and the difference to the embedded fourth order solution
+    """
+    stages = [first]
+    for i in range(1, 7):
+        y_i = y + h * sum(a * stages[j][0] for j, a in enumerate(DOPRI_A[i]) if a != 0)
+        S_i = S + h * sum(a * stages[j][1] for j, a in enumerate(DOPRI_A[i]) if a != 0)
+        stages.append(f(t + DOPRI_C[i] * h, y_i, S_i))
+    # The last row of DOPRI_A holds the fifth order weights, so the last stage is at the solution
+    error_y = h * sum(e * stages[j][0] for j, e in enumerate(DOPRI_E) if e != 0)
+    error_S = h * sum(e * stages[j][1] for j, e in enumerate(DOPRI_E) if e != 0)
+    return y_i, S_i, stages[6], error_y, error_S
+
+def _error_norm(error, old, new, rtol, atol):
+    """The root mean square of the error scaled by atol + rtol * |solution|."""
+    scale = atol + rtol * np.maximum(np.abs(old), np.abs(new))
+    return np.sqrt(np.mean((error / scale) ** 2))
+
+def integrate(rhs, y0, t_span, params, method = 'rk45', t_eval = None, h = None, rtol = 1e-6, atol = 1e-9, S0 = None, error_sensitivities = False, max_steps = 100000):
+    """
+    Integrates dy/dt = rhs(t, y, p) together with the sensitivities dy/dp to every parameter
+    Args:
+        rhs: function (t, y, p) -> dy/dt, with t a float and y, p FMExpression vectors, returning an FMExpression
+            (or a list of FMExpressions) of the shape of y
+        y0: the initial state, shape (n,)
+        t_span: (t0, t1), t1 may be smaller than t0
+        params: the parameter values, shape (m,)
+        method: 'rk4' (fixed steps of size h) or 'rk45' (adaptive, h is the initial step)
+        t_eval: the output times between t0 and t1, defaults to t1 alone so that memory does not grow with the number of steps
+        h: the step size for 'rk4', required, and the initial step size for 'rk45', estimated when None
+        rtol, atol: the relative and absolute tolerances of 'rk45'
+        S0: the initial sensitivities dy0/dp, shape (n, m), defaults to zeros
+        error_sensitivities: include the sensitivities in the error control of 'rk45'
+        max_steps: maximum number of steps, accepted or rejected
+    Returns:
+        an ODEResult
+    """
+    if (method not in METHODS):
+        raise NotImplementedError(f"Unknown method '{method}', expected one of {METHODS}.")
+    t0, t1 = float(t_span[0]), float(t_span[1])
+    direction = 1.0 if t1 >= t0 else -1.0
+    t_eval = np.array([t1] if t_eval is None else t_eval, dtype=float).ravel()
+    if (np.any(direction * np.diff(t_eval) < 0) or np.any(direction * (t_eval - t0) < 0) or np.any(direction * (t_eval - t1) > 0)):
+        raise ValueError("The output times must be sorted and lie within t_span.")
+
+    y = np.array(y0, dtype=float).ravel()
+    params = np.array(params, dtype=float).ravel()
+    S = np.zeros((y.size, params.size)) if S0 is None else np.array(S0, dtype=float).reshape(y.size, params.size)
+    f = SensitivityRHS(rhs, params)
+
+    if (method == 'rk4' and h is None):
+        raise ValueError("The 'rk4' method needs a step size h.")
+    last = f(t0, y, S) if method == 'rk45' else None
+    if (h is None):
+        # A step that changes the state by about 1% of its scale
+        scale = atol + rtol * np.abs(y)
+        d0, d1 = np.sqrt(np.mean((y / scale) ** 2)), np.sqrt(np.mean((last[0] / scale) ** 2))
+        h = 0.01 * d0 / d1 if (d0 > 1e-5 and d1 > 1e-5) else 1e-6
+    h = min(abs(h), abs(t1 - t0)) if t1 != t0 else 0.0
+
+    ts, ys, Ss = [], [], []
+    t = t0
+    nsteps = nrejected = 0
+    for target in t_eval:
+        while (direction * (target - t) > 0 and nsteps + nrejected < max_steps):
+            # The last step before an output time is shortened to land on it
+            step = direction * min(h, abs(target - t))
+            if (method == 'rk4'):
+                y, S = rk4_step(f, t, y, S, step)
+                t = target if abs(target - t - step) <= 1e-12 * max(1.0, abs(target)) else t + step
+                nsteps += 1
+                continue
+
+            y_new, S_new, stage, error_y, error_S = rk45_step(f, t, y, S, step, last)
+            error = _error_norm(error_y, y, y_new, rtol, atol)
+            if (error_sensitivities):
+                error = max(error, _error_norm(error_S, S, S_new, rtol, atol))
+            # Standard controller, the new step is at most 5 times larger and 5 times smaller
+            factor = 5.0 if error == 0 else min(5.0, max(0.2, 0.9 * error ** -0.2))
+            if (not np.isfinite(error) or error > 1):
+                h = abs(step) * min(1.0, factor)
+                nrejected += 1
+                continue
+
+            t = target if abs(target - t - step) <= 1e-12 * max(1.0, abs(target)) else t + step
+            y, S, last = y_new, S_new, stage
+            # A step shortened for an output time does not shrink the next one
+            h = max(h, abs(step) * factor) if abs(step) < h else abs(step) * factor
+            nsteps += 1
+
+        if (direction * (target - t) > 0):
+            break
+        ts.append(t)
+        ys.append(y.copy())
+        Ss.append(S.copy())
+
+    success = len(ts) == len(t_eval)
+    return ODEResult(np.array(ts), np.array(ys).reshape(len(ts), y.size), np.array(Ss).reshape(len(ts), y.size, params.size), success, f.nfev, nsteps, nrejected)
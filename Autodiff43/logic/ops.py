@@ -0,0 +1,485 @@
+#!/usr/bin/env python3
+
+"""
+This module contains the table of elementary operations recorded on RMExpression nodes.
+
+Each operation knows how to recompute its value and its local partial derivatives (the
+edge weights RMExpression stores in node_edges) from the values of its parent nodes and
+its constant operands. This is what lets a recorded graph be replayed with new inputs.
+Elementwise operations also have second derivative rules, used by the sparse Hessian.
+"""
+import numpy as np
+
+class Op:
+    """An elementary operation with its value and derivative rules."""
+
+    def __init__(self, name, forward, partials, jvp = None):
+        """
+        Args:
+            name: the op code stored in RMExpression.op
+            forward: function (values, args) -> value, where values are the parent values and args the constant operands
+            partials: function (values, args, out) -> list with one edge weight per parent
+            jvp: optional function (values, args, out, tangents) -> output tangent, defaults to the sum of edge weight * tangent
+        """
+        self.name = name
+        self.forward = forward
+        self.partials = partials
+        self._jvp = jvp
+        self._second = None
+
+    def jvp(self, values, args, out, tangents):
+        """
+        Propagates tangents through the operation
+        Args:
+            values: the parent values
+            args: the constant operands
+            out: the value of the operation
+            tangents: list with one tangent per parent, None for parents that do not depend on the seed
+        Returns:
+            the tangent of the output, or None if no parent has a tangent
+        """
+        if (self._jvp is not None):
+            return self._jvp(values, args, out, tangents)
+
+        ret = None
+        for edge_weight, tangent in zip(self.partials(values, args, out), tangents):
+            if (tangent is None):
+                continue
+            ret = edge_weight * tangent if ret is None else ret + edge_weight * tangent
+        return ret
+
+    def second(self, values, args, out):
+        """
+        Second partial derivatives of the operation, elementwise
+        Args:
+            values: the parent values
+            args: the constant operands
+            out: the value of the operation
+        Returns:
+            list of (i, j, value) with i <= j parent positions, for the second partials that are not identically zero
+        """
+        if (self._second is None):
+            raise NotImplementedError(f"No second derivative rule is registered for op '{self.name}'.")
+        return self._second(values, args, out)
+
+OPS = {}
+
+def register_op(name, forward, partials, jvp = None):
+    """
+    Adds an operation to the op table
+    Args:
+        see Op
+    Returns:
+        the registered Op
+    """
+    OPS[name] = Op(name, forward, partials, jvp)
+    return OPS[name]
+
+def register_second(name, second):
+    """
+    Adds the second derivative rule of a registered operation
+    Args:
+        name: the op code
+        second: function (values, args, out) -> list of (i, j, value), see Op.second
+    Returns:
+        the Op
+    """
+    op = get_op(name)
+    op._second = second
+    return op
+
+def get_op(name):
+    """
+    Looks up an operation by op code
+    Args:
+        name: the op code stored in RMExpression.op
+    Returns:
+        the Op
+    """
+    if (name not in OPS):
+        raise NotImplementedError(f"No rule is registered for op '{name}'.")
+    return OPS[name]
+
+def _other(values, args):
+    """Returns the second operand of a binary op, either a parent value or a constant."""
+    return values[1] if len(values) == 2 else args[0]
+
+register_op('add',
+    lambda v, a: v[0] + _other(v, a),
+    lambda v, a, out: [1, 1][:len(v)])
+
+register_op('sub',
+    lambda v, a: v[0] - _other(v, a),
+    lambda v, a, out: [1, -1][:len(v)])
+
+register_op('rsub',
+    lambda v, a: a[0] - v[0],
+    lambda v, a, out: [-1])
+
+register_op('mul',
+    lambda v, a: v[0] * _other(v, a),
+    lambda v, a, out: [_other(v, a), v[0]][:len(v)])
+
+register_op('truediv',
+    lambda v, a: v[0] / _other(v, a),
+    lambda v, a, out: [1 / _other(v, a), -v[0] / _other(v, a) ** 2][:len(v)])
+
+register_op('rtruediv',
+    lambda v, a: a[0] / v[0],
+    lambda v, a, out: [-a[0] / v[0] ** 2])
+
+def _pow_partials(values, args, out):
+    exponent = _other(values, args)
+    ret = [exponent * values[0] ** (exponent - 1)]
+    if (len(values) == 2): # the exponent is only differentiated when it is a node
+        ret.append(out * np.log(values[0]))
+    return ret
+
+register_op('pow', lambda v, a: v[0] ** _other(v, a), _pow_partials)
+
+register_op('neg',
+    lambda v, a: -v[0],
+    lambda v, a, out: [-1])
+
+def _exp_forward(values, args):
+    if (len(values) == 1 and len(args) == 0): # e ** self
+        return np.exp(values[0])
+    return _other(values, args) ** values[0]
+
+def _exp_partials(values, args, out):
+    if (len(values) == 1 and len(args) == 0):
+        return [np.exp(values[0])]
+    base = _other(values, args)
+    return [base ** values[0] * np.log(base), values[0] * base ** (values[0] - 1)][:len(values)]
+
+register_op('exp', _exp_forward, _exp_partials)
+
+def _log_forward(values, args):
+    if (len(values) == 1 and len(args) == 0): # ln(self)
+        return np.log(values[0])
+    return np.log(values[0]) / np.log(_other(values, args))
+
+def _log_partials(values, args, out):
+    if (len(values) == 1 and len(args) == 0):
+        return [1 / values[0]]
+    base = _other(values, args)
+    return [1 / (values[0] * np.log(base)), -np.log(values[0]) / (base * np.log(base) ** 2)][:len(values)]
+
+register_op('log', _log_forward, _log_partials)
+
+register_op('sin', lambda v, a: np.sin(v[0]), lambda v, a, out: [np.cos(v[0])])
+register_op('cos', lambda v, a: np.cos(v[0]), lambda v, a, out: [-np.sin(v[0])])
+register_op('tan', lambda v, a: np.tan(v[0]), lambda v, a, out: [1 / np.cos(v[0]) ** 2])
+register_op('arcsin', lambda v, a: np.arcsin(v[0]), lambda v, a, out: [1 / np.sqrt(1 - v[0] ** 2)])
+register_op('arccos', lambda v, a: np.arccos(v[0]), lambda v, a, out: [-1 / np.sqrt(1 - v[0] ** 2)])
+register_op('arctan', lambda v, a: np.arctan(v[0]), lambda v, a, out: [1 / (1 + v[0] ** 2)])
+register_op('sinh', lambda v, a: np.sinh(v[0]), lambda v, a, out: [np.cosh(v[0])])
+register_op('cosh', lambda v, a: np.cosh(v[0]), lambda v, a, out: [np.sinh(v[0])])
+register_op('tanh', lambda v, a: np.tanh(v[0]), lambda v, a, out: [1 / np.cosh(v[0]) ** 2])
+register_op('sigmoid', lambda v, a: 1 / (1 + np.exp(-v[0])), lambda v, a, out: [np.exp(-v[0]) / (np.exp(-v[0]) + 1) ** 2])
+
+def matmul_vjps(a, b):
+    """
+    Edge weights of a @ b, as functions mapping the gradient of the product to the gradient of each operand
+    Args:
+        a, b: the operand values, following NumPy matmul rules for 1-D operands
+    Returns:
+        a tuple (vjp_a, vjp_b)
+    """
+    def vjp_a(g):
+        if (b.ndim == 1):
+            return g * b if a.ndim == 1 else g[..., None] * b
+        if (a.ndim == 1):
+            return np.matmul(b, g[..., None])[..., 0]
+        return np.matmul(g, np.swapaxes(b, -1, -2))
+
+    def vjp_b(g):
+        if (a.ndim == 1):
+            return g * a if b.ndim == 1 else a[:, None] * g[..., None, :]
+        if (b.ndim == 1):
+            return np.matmul(g[..., None, :], a)[..., 0, :]
+        return np.matmul(np.swapaxes(a, -1, -2), g)
+
+    return vjp_a, vjp_b
+
+def _matmul(a, b):
+    return np.atleast_1d(np.matmul(a, b))
+
+def _matmul_jvp(values, args, out, tangents):
+    a, b = values[0], _other(values, args)
+    ret = 0
+    if (tangents[0] is not None):
+        ret = ret + _matmul(tangents[0], b)
+    if (len(tangents) == 2 and tangents[1] is not None):
+        ret = ret + _matmul(a, tangents[1])
+    return ret
+
+register_op('matmul',
+    lambda v, a: _matmul(v[0], _other(v, a)),
+    lambda v, a, out: list(matmul_vjps(v[0], _other(v, a)))[:len(v)],
+    _matmul_jvp)
+
+register_op('rmatmul',
+    lambda v, a: _matmul(a[0], v[0]),
+    lambda v, a, out: [matmul_vjps(a[0], v[0])[1]],
+    lambda v, a, out, t: _matmul(a[0], t[0]))
+
+def prod_partials(x):
+    """
+    Partial derivatives of prod(x), the product of all the other elements, computed with
+    exclusive running products from both ends so that zeros in x are handled exactly
+    Args:
+        x: the operand value
+    Returns:
+        an array of the same shape as x
+    """
+    flat = np.asarray(x, dtype=float).ravel()
+    left = np.ones_like(flat)
+    right = np.ones_like(flat)
+    np.cumprod(flat[:-1], out=left[1:])
+    np.cumprod(flat[:0:-1], out=right[-2::-1])
+    return (left * right).reshape(np.shape(x))
+
+def norm_partials(x, out):
+    """Partial derivatives of the Euclidean norm out of x, taken as 0 where the norm is 0."""
+    if (np.all(out == 0)):
+        return np.zeros(np.shape(x))
+    return x / out
+
+def _reduce(x):
+    return np.atleast_1d(np.sum(x))
+
+def _dot_jvp(values, args, out, tangents):
+    a, b = values[0], _other(values, args)
+    ret = 0
+    if (tangents[0] is not None):
+        ret = ret + _reduce(tangents[0] * b)
+    if (len(tangents) == 2 and tangents[1] is not None):
+        ret = ret + _reduce(a * tangents[1])
+    return ret
+
+register_op('sum',
+    lambda v, a: _reduce(v[0]),
+    lambda v, a, out: [1],
+    lambda v, a, out, t: _reduce(t[0]))
+
+register_op('mean',
+    lambda v, a: np.atleast_1d(np.mean(v[0])),
+    lambda v, a, out: [1 / np.size(v[0])],
+    lambda v, a, out, t: np.atleast_1d(np.mean(t[0])))
+
+register_op('prod',
+    lambda v, a: np.atleast_1d(np.prod(v[0])),
+    lambda v, a, out: [prod_partials(v[0])],
+    lambda v, a, out, t: _reduce(prod_partials(v[0]) * t[0]))
+
+register_op('norm',
+    lambda v, a: np.atleast_1d(np.sqrt(np.sum(v[0] * v[0]))),
+    lambda v, a, out: [norm_partials(v[0], out)],
+    lambda v, a, out, t: _reduce(norm_partials(v[0], out) * t[0]))
+
+register_op('dot',
+    lambda v, a: _reduce(v[0] * _other(v, a)),
+    lambda v, a, out: [_other(v, a), v[0]][:len(v)],
+    _dot_jvp)
+
+def logsumexp_value(x):
+    """log(sum(exp(x))) over all the elements of x, shifted by the largest element so that exp cannot overflow."""
+    shift = np.max(x)
+    if (not np.isfinite(shift)):
+        shift = 0
+    return np.atleast_1d(shift + np.log(np.sum(np.exp(x - shift))))
+
+def softplus_value(x):
+    """log(1 + exp(x)) without overflow, as log(exp(0) + exp(x))."""
+    return np.logaddexp(0, x)
+
+def _whole(g, x):
+    """The axes of g holding one value of x, after any leading seed axes."""
+    return tuple(range(np.ndim(g) - np.ndim(x), np.ndim(g)))
+
+def softmax_vjp(s):
+    """Edge weight of softmax(x), with s the value: the gradient g maps to s * (g - sum(g * s))."""
+    return lambda g: s * (g - np.sum(g * s, axis=_whole(g, s), keepdims=True))
+
+def log_softmax_vjp(out):
+    """Edge weight of log_softmax(x), with out the value: the gradient g maps to g - softmax(x) * sum(g)."""
+    s = np.exp(out)
+    return lambda g: g - s * np.sum(g, axis=_whole(g, s), keepdims=True)
+
+# Fused kernels. The partials reuse the value of the node, so each derivative costs one pass and at most one exp
+register_op('logsumexp',
+    lambda v, a: logsumexp_value(v[0]),
+    lambda v, a, out: [np.exp(v[0] - out)],
+    lambda v, a, out, t: _reduce(np.exp(v[0] - out) * t[0]))
+
+register_op('softmax',
+    lambda v, a: np.exp(v[0] - logsumexp_value(v[0])),
+    lambda v, a, out: [softmax_vjp(out)],
+    lambda v, a, out, t: out * (t[0] - np.sum(out * t[0])))
+
+register_op('log_softmax',
+    lambda v, a: v[0] - logsumexp_value(v[0]),
+    lambda v, a, out: [log_softmax_vjp(out)],
+    lambda v, a, out, t: t[0] - np.sum(np.exp(out) * t[0]))
+
+# sigmoid(x) = exp(x - softplus(x))
+register_op('softplus',
+    lambda v, a: softplus_value(v[0]),
+    lambda v, a, out: [np.exp(v[0] - out)])
+
+# Binary cross entropy with logits x and constant labels y: softplus(x) - y * x, whose derivative is sigmoid(x) - y
+register_op('logistic_loss',
+    lambda v, a: softplus_value(v[0]) - a[0] * v[0],
+    lambda v, a, out: [np.exp(v[0] - out - a[0] * v[0]) - a[0]])
+
+register_op('squared_norm',
+    lambda v, a: _reduce(v[0] * v[0]),
+    lambda v, a, out: [2 * v[0]],
+    lambda v, a, out, t: _reduce(2 * v[0] * t[0]))
+
+def _is_basic_index(index):
+    """Whether index only uses integers, slices, Ellipsis and None, so it selects every element at most once."""
+    parts = index if isinstance(index, tuple) else (index,)
+    return all(p is None or p is Ellipsis or isinstance(p, (int, np.integer, slice)) for p in parts)
+
+def index_vjp(shape, index, out_shape):
+    """
+    Edge weight of x[index], as a function scattering the gradient of the selection back into the shape of x
+    Args:
+        shape: the shape of x
+        index: any NumPy index
+        out_shape: the shape of the selection, as stored on the node
+    Returns:
+        a function mapping a gradient of shape batch + out_shape to one of shape batch + shape, repeated
+        elements accumulate
+    """
+    parts = index if isinstance(index, tuple) else (index,)
+    sub_shape = np.empty(shape, dtype=np.bool_)[index].shape
+
+    def vjp(g):
+        batch = g.shape[:g.ndim - len(out_shape)]
+        g = g.reshape((-1,) + sub_shape)
+        ret = np.zeros((g.shape[0],) + tuple(shape))
+        if (_is_basic_index(index)):
+            ret[(slice(None),) + parts] = g
+        else:
+            # Flat positions keep the layout of the selection whatever mix of indices was used
+            positions = np.arange(int(np.prod(shape))).reshape(shape)[index]
+            flat = ret.reshape(g.shape[0], -1)
+            np.add.at(flat, (slice(None), positions.ravel()), g.reshape(g.shape[0], -1))
+        return ret.reshape(batch + tuple(shape))
+
+    return vjp
+
+def take_vjp(shape, positions, out_shape):
+    """Edge weight of the flat selection x.ravel()[positions], see index_vjp."""
+    positions = np.asarray(positions, dtype=np.intp)
+
+    def vjp(g):
+        batch = g.shape[:g.ndim - len(out_shape)]
+        g = g.reshape(-1, positions.size)
+        ret = np.zeros((g.shape[0], int(np.prod(shape))))
+        np.add.at(ret, (slice(None), positions.ravel()), g)
+        return ret.reshape(batch + tuple(shape))
+
+    return vjp
+
+def concat_vjps(shapes):
+    """
+    Edge weights of the concatenation of the flattened operands
+    Args:
+        shapes: the shapes of the operands
+    Returns:
+        a list with one function per operand selecting its part of the gradient
+    """
+    def vjp(start, shape):
+        stop = start + int(np.prod(shape))
+        return lambda g: g[..., start:stop].reshape(g.shape[:-1] + tuple(shape))
+
+    vjps = []
+    start = 0
+    for shape in shapes:
+        vjps.append(vjp(start, shape))
+        start += int(np.prod(shape))
+    return vjps
+
+register_op('getitem',
+    lambda v, a: np.atleast_1d(v[0][a[0]]),
+    lambda v, a, out: [index_vjp(v[0].shape, a[0], out.shape)],
+    lambda v, a, out, t: np.atleast_1d(np.broadcast_to(t[0], v[0].shape)[a[0]]))
+
+register_op('take',
+    lambda v, a: np.atleast_1d(v[0].ravel()[np.asarray(a[0], dtype=np.intp)]),
+    lambda v, a, out: [take_vjp(v[0].shape, a[0], out.shape)],
+    lambda v, a, out, t: np.atleast_1d(np.broadcast_to(t[0], v[0].shape).ravel()[np.asarray(a[0], dtype=np.intp)]))
+
+register_op('concat',
+    lambda v, a: np.concatenate([np.ravel(x) for x in v]),
+    lambda v, a, out: concat_vjps([np.shape(x) for x in v]),
+    lambda v, a, out, t: np.concatenate([np.zeros(np.size(x)) if tx is None else np.ravel(np.broadcast_to(tx, np.shape(x))) for x, tx in zip(v, t)]))
+
+# Second derivative rules, elementwise. Linear operations have none
+for name in ('add', 'sub', 'rsub', 'neg', 'sum', 'mean', 'getitem', 'take', 'concat'):
+    register_second(name, lambda v, a, out: [])
+
+register_second('mul', lambda v, a, out: [(0, 1, 1)] if len(v) == 2 else [])
+register_second('dot', lambda v, a, out: [(0, 1, 1)] if len(v) == 2 else [])
+
+def _truediv_second(values, args, out):
+    if (len(values) == 1):
+        return []
+    a, b = values
+    return [(0, 1, -1 / b ** 2), (1, 1, 2 * a / b ** 3)]
+
+register_second('truediv', _truediv_second)
+register_second('rtruediv', lambda v, a, out: [(0, 0, 2 * a[0] / v[0] ** 3)])
+
+def _pow_second(values, args, out):
+    x, y = values[0], _other(values, args)
+    ret = [(0, 0, y * (y - 1) * x ** (y - 2))]
+    if (len(values) == 2):
+        ret.append((0, 1, x ** (y - 1) * (1 + y * np.log(x))))
+        ret.append((1, 1, out * np.log(x) ** 2))
+    return ret
+
+register_second('pow', _pow_second)
+
+def _exp_second(values, args, out):
+    if (len(values) == 1 and len(args) == 0):
+        return [(0, 0, out)]
+    x, base = values[0], _other(values, args)
+    ret = [(0, 0, out * np.log(base) ** 2)]
+    if (len(values) == 2):
+        ret.append((0, 1, base ** (x - 1) * (1 + x * np.log(base))))
+        ret.append((1, 1, x * (x - 1) * base ** (x - 2)))
+    return ret
+
+register_second('exp', _exp_second)
+
+def _log_second(values, args, out):
+    x = values[0]
+    if (len(values) == 1 and len(args) == 0):
+        return [(0, 0, -1 / x ** 2)]
+    base = _other(values, args)
+    log_base = np.log(base)
+    ret = [(0, 0, -1 / (x ** 2 * log_base))]
+    if (len(values) == 2):
+        ret.append((0, 1, -1 / (x * base * log_base ** 2)))
+        ret.append((1, 1, np.log(x) * (log_base + 2) / (base ** 2 * log_base ** 3)))
+    return ret
+
+register_second('log', _log_second)
+
+register_second('sin', lambda v, a, out: [(0, 0, -out)])
+register_second('cos', lambda v, a, out: [(0, 0, -out)])
+register_second('tan', lambda v, a, out: [(0, 0, 2 * out / np.cos(v[0]) ** 2)])
+register_second('arcsin', lambda v, a, out: [(0, 0, v[0] / (1 - v[0] ** 2) ** 1.5)])
+register_second('arccos', lambda v, a, out: [(0, 0, -v[0] / (1 - v[0] ** 2) ** 1.5)])
+register_second('arctan', lambda v, a, out: [(0, 0, -2 * v[0] / (1 + v[0] ** 2) ** 2)])
+register_second('sinh', lambda v, a, out: [(0, 0, out)])
+register_second('cosh', lambda v, a, out: [(0, 0, out)])
+register_second('tanh', lambda v, a, out: [(0, 0, -2 * out / np.cosh(v[0]) ** 2)])
+register_second('sigmoid', lambda v, a, out: [(0, 0, out * (1 - out) * (1 - 2 * out))])
+register_second('softplus', lambda v, a, out: [(0, 0, np.exp(v[0] - out) * np.exp(-out))])
+register_second('logistic_loss', lambda v, a, out: [(0, 0, np.exp(-np.abs(v[0]) - 2 * softplus_value(-np.abs(v[0]))))])
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+
+"""
+This module contains batched multi-start minimization built on the Tape.
+
+The objective is recorded once into a Tape, with one RMExpression leaf per coordinate. Since
+the recorded operations act elementwise, replaying the Tape with a vector of values for every
+coordinate evaluates the objective at all starting points at once, and one reverse sweep gives
+every gradient. Gradient descent, BFGS and Newton steps, the backtracking line search and the
+convergence checks are all NumPy operations over the starts that are still active.
+"""
+import numpy as np
+
+from .tape import trace
+
+METHODS = ('gd', 'bfgs', 'newton')
+
+class BatchObjective:
+    """An objective of n scalar coordinates, recorded once and evaluated for many points at a time."""
+
+    def __init__(self, function, x):
+        """
+        Args:
+            function: a function of n Expressions returning a scalar Expression, using elementwise operations only
+            x: array of shape (k, n), the points the function is recorded at
+        """
+        self.n = x.shape[1]
+        self.tape = trace(function, list(x.T), [f'x{i}' for i in range(self.n)])
+        self.nfev = 0
+        self.ngev = 0
+
+    def value(self, x):
+        """
+        Args:
+            x: array of shape (k, n), one point per row
+        Returns:
+            the objective at every point, shape (k,)
+        """
+        self.nfev += len(x)
+        out = self.tape.evaluate(*x.T)[0]
+        return np.broadcast_to(out, (len(x),)).astype(float)
+
+    def value_and_grad(self, x):
+        """
+        Args:
+            x: array of shape (k, n), one point per row
+        Returns:
+            a tuple (f, g) with the objective, shape (k,), and its gradient, shape (k, n)
+        """
+        self.nfev += len(x)
+        self.ngev += len(x)
+        values = self.tape.forward(list(x.T))
+        out = values[self.tape.output_index[0]]
+        adjoints = self.tape.vjp(values, [np.ones(np.shape(out))])
+
+        f = np.broadcast_to(out, (len(x),)).astype(float)
+        g = np.empty(x.shape)
+        for j, adjoint in enumerate(adjoints):
+            g[:, j] = np.broadcast_to(adjoint, (len(x),))
+        return f, g
+
+    def hessian(self, x, step = 1e-5):
+        """
+        Central differences of the gradient, evaluated for all points and coordinates in one replay
+        Args:
+            x: array of shape (k, n), one point per row
+            step: the finite difference step, relative to max(1, |x|)
+        Returns:
+            the symmetrized Hessian at every point, shape (k, n, n)
+        """
+        k, n = x.shape
+        h = step * np.maximum(1, np.abs(x))
+        shifts = h[:, :, None] * np.eye(n)
+        points = np.concatenate([(x[:, None, :] + shifts).reshape(-1, n), (x[:, None, :] - shifts).reshape(-1, n)])
+        _, g = self.value_and_grad(points)
+
+        g_plus = g[:k * n].reshape(k, n, n)
+        g_minus = g[k * n:].reshape(k, n, n)
+        H = (g_plus - g_minus) / (2 * h[:, :, None])
+        return (H + np.swapaxes(H, 1, 2)) / 2
+
+class OptimizeResult:
+    """The outcome of a batched minimization, one row per starting point."""
+
+    def __init__(self, x, fun, grad, converged, nit, nfev, ngev):
+        self.x = x
+        self.fun = fun
+        self.grad = grad
+        self.converged = converged
+        self.nit = nit
+        self.nfev = nfev
+        self.ngev = ngev
+
+    @property
+    def best(self):
+        """Index of the start with the lowest objective."""
+        return int(np.argmin(self.fun))
+
+    def __repr__(self):
+        return f'OptimizeResult(best fun={self.fun[self.best]}, converged {int(self.converged.sum())}/{len(self.converged)})'
+
+def line_search(objective, x, f, g, d, alpha0 = 1.0, c1 = 1e-4, shrink = 0.5, max_steps = 30):
+    """
+    Backtracking line search satisfying the Armijo condition, run for all points together
+    Args:
+        objective: a BatchObjective
+        x, f, g: points, objective values and gradients, shapes (k, n), (k,), (k, n)
+        d: descent directions, shape (k, n)
+        alpha0: the first step length tried
+        c1: the sufficient decrease constant
+        shrink: factor applied to the step of every point that has not found a decrease yet
+        max_steps: maximum number of step reductions
+    Returns:
+        the step lengths, shape (k,), 0 for points where no decrease was found
+    """
+    slope = np.einsum('ij,ij->i', g, d)
+    alpha = np.full(len(x), alpha0, dtype=float)
+    done = np.zeros(len(x), dtype=bool)
+
+    for _ in range(max_steps):
+        todo = np.flatnonzero(~done)
+        if (len(todo) == 0):
+            break
+        f_new = objective.value(x[todo] + alpha[todo, None] * d[todo])
+        ok = np.isfinite(f_new) & (f_new <= f[todo] + c1 * alpha[todo] * slope[todo])
+        done[todo[ok]] = True
+        alpha[todo[~ok]] *= shrink
+
+    alpha[~done] = 0
+    return alpha
+
+def minimize(function, starts, method = 'bfgs', gtol = 1e-6, xtol = 1e-12, max_iter = 200, hessian_step = 1e-5):
+    """
+    Minimizes function from every starting point at once
+    Args:
+        function: a function of n Expressions returning a scalar Expression, using elementwise operations only
+        starts: array of shape (k, n) with one starting point per row, or (n,) for a single start
+        method: 'gd' (steepest descent), 'bfgs' or 'newton' (with finite difference Hessians of the gradient)
+        gtol: a start has converged once the largest component of its gradient is below gtol
+        xtol: a start also stops once its step is shorter than xtol
+        max_iter: maximum number of iterations
+        hessian_step: relative finite difference step for method 'newton'
+    Returns:
+        an OptimizeResult
+    """
+    if (method not in METHODS):
+        raise NotImplementedError(f"Unknown method '{method}', expected one of {METHODS}.")
+
+    x = np.array(starts, dtype=float, ndmin=2)
+    k, n = x.shape
+    objective = BatchObjective(function, x)
+
+    f, g = objective.value_and_grad(x)
+    converged = np.max(np.abs(g), axis=1) < gtol
+    stopped = converged | ~np.isfinite(f)
+    nit = np.zeros(k, dtype=int)
+    if (method == 'bfgs'):
+        H_inv = np.tile(np.eye(n), (k, 1, 1))
+
+    for _ in range(max_iter):
+        active = np.flatnonzero(~stopped)
+        if (len(active) == 0):
+            break
+
+        xa, fa, ga = x[active], f[active], g[active]
+        if (method == 'gd'):
+            d = -ga
+        elif (method == 'bfgs'):
+            d = -np.einsum('kij,kj->ki', H_inv[active], ga)
+        else:
+            d = _newton_direction(objective.hessian(xa, hessian_step), ga)
+
+        # Fall back to steepest descent wherever the direction is not a descent direction
+        uphill = np.einsum('ij,ij->i', ga, d) >= 0
+        d[uphill] = -ga[uphill]
+
+        alpha = line_search(objective, xa, fa, ga, d)
+        s = alpha[:, None] * d
+        x_new = xa + s
+        f_new, g_new = objective.value_and_grad(x_new)
+
+        if (method == 'bfgs'):
+            H_inv[active] = _bfgs_update(H_inv[active], s, g_new - ga)
+
+        x[active], f[active], g[active] = x_new, f_new, g_new
+        nit[active] += 1
+
+        converged[active] = np.max(np.abs(g_new), axis=1) < gtol
+        small_step = np.max(np.abs(s), axis=1) < xtol
+        stopped[active] = converged[active] | small_step | ~np.isfinite(f_new)
+
+    return OptimizeResult(x, f, g, converged, nit, objective.nfev, objective.ngev)
+
+def _newton_direction(H, g):
+    """Solves H d = -g for every point, points with a singular Hessian get d = -g."""
+    d = -g.copy()
+    try:
+        return -np.linalg.solve(H, g[..., None])[..., 0]
+    except np.linalg.LinAlgError:
+        for i in range(len(g)):
+            try:
+                d[i] = -np.linalg.solve(H[i], g[i])
+            except np.linalg.LinAlgError:
+                pass
+        return d
+
+def _bfgs_update(H_inv, s, y, eps = 1e-10):
+    """
+    BFGS update of the inverse Hessian approximations, skipped where the curvature s.y is not positive
+    Args:
+        H_inv: shape (k, n, n)
+        s, y: the steps and gradient changes, shape (k, n)
+    Returns:
+        the updated approximations
+    """
+    sy = np.einsum('ij,ij->i', s, y)
+    ok = sy > eps * np.linalg.norm(s, axis=1) * np.linalg.norm(y, axis=1)
+    if (not np.any(ok)):
+        return H_inv
+
+    H, s, y = H_inv[ok], s[ok], y[ok]
+    rho = 1 / sy[ok]
+    Hy = np.einsum('kij,kj->ki', H, y)
+    yHy = np.einsum('ki,ki->k', y, Hy)
+    # (I - rho s y^T) H (I - rho y s^T) + rho s s^T, expanded
+    H = (H
+         - rho[:, None, None] * (s[:, :, None] * Hy[:, None, :] + Hy[:, :, None] * s[:, None, :])
+         + (rho ** 2 * yHy + rho)[:, None, None] * s[:, :, None] * s[:, None, :])
+
+    ret = H_inv.copy()
+    ret[ok] = H
+    return ret
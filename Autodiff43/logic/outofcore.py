@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+"""
+This module contains out-of-core evaluation of values and Jacobians over .npy files larger than memory.
+
+The input is opened with np.load(mmap_mode="r") and the results go into a preallocated memory
+mapped .npy file, so only one chunk of points and its intermediates is ever resident. The
+function is recorded once into a Tape (see batch.BatchEvaluator) and the chunk size is derived
+from a memory budget and the size of that Tape. After every chunk the output is flushed and
+the number of completed rows is written to a small progress file next to it, so an
+interrupted run of the same function continues from the last completed chunk when it is
+started again.
+"""
+import json
+import os
+
+import numpy as np
+
+from .batch import BatchEvaluator
+
+class OutOfCoreResult:
+    """The memory mapped results of evaluate_memmap, one row per input point."""
+
+    def __init__(self, path, m, n, complete):
+        self.path = path
+        self.m = m
+        self.n = n
+        self.complete = complete
+        self.array = np.load(path, mmap_mode='r')
+
+    @property
+    def values(self):
+        """The outputs, shape (N, m), a view of the memory mapped file."""
+        return self.array[:, :self.m]
+
+    @property
+    def jacobian(self):
+        """The Jacobians, shape (N, m, n), a view of the memory mapped file."""
+        return self.array[:, self.m:].reshape(len(self.array), self.m, self.n)
+
+    def __repr__(self):
+        return f'OutOfCoreResult({self.path}, {len(self.array)} points, complete={self.complete})'
+
+def chunk_size_for_budget(tape, n, m, memory_budget):
+    """
+    The number of points that can be evaluated at a time within a memory budget
+    Args:
+        tape: the recorded Tape of the function
+        n, m: the number of inputs and outputs
+        memory_budget: bytes available for one chunk
+    Returns:
+        the chunk size, at least 1
+    """
+    # Per point: the input row, the output row, every node value and one adjoint or tangent per node
+    per_point = 8 * (n + m + m * n + 2 * tape.size)
+    return max(1, int(memory_budget // per_point))
+
+def _progress_path(output_path):
+    return output_path + '.progress'
+
+def _read_progress(output_path, expected):
+    """The number of completed rows of a previous run with the same settings, 0 if there is none."""
+    try:
+        with open(_progress_path(output_path)) as f:
+            progress = json.load(f)
+    except (OSError, ValueError):
+        return 0
+    if (any(progress.get(key) != value for key, value in expected.items()) or not os.path.exists(output_path)):
+        return 0
+    return progress['rows']
+
+def _write_progress(output_path, progress):
+    # Written to a temporary file and renamed, so the progress file is never half written
+    tmp = _progress_path(output_path) + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(progress, f)
+    os.replace(tmp, _progress_path(output_path))
+
+def evaluate_memmap(function, input_path, output_path, mode = 'forward', memory_budget = 256 * 2 ** 20, chunk_size = None, resume = True, max_chunks = None):
+    """
+    Evaluates function and its Jacobian at every row of a .npy file, writing into a memory mapped .npy file
+    Args:
+        function: a function of n Expressions returning m Expressions (or one), elementwise
+        input_path: a .npy file of shape (N, n), or (N,) for n = 1
+        output_path: the .npy file for the results, shape (N, m + m * n): the m values then the m x n Jacobian row by row
+        mode: 'forward' or 'reverse'
+        memory_budget: bytes available for one chunk, used to choose the chunk size
+        chunk_size: the number of points evaluated at a time, overrides memory_budget
+        resume: continue a previous run of the same job from its last completed chunk, otherwise start over
+        max_chunks: stop after this many chunks (the run can be resumed later), None to run to the end
+    Returns:
+        an OutOfCoreResult
+    """
+    points = np.load(input_path, mmap_mode='r')
+    if (points.ndim == 1):
+        points = points[:, None]
+    N, n = points.shape
+    if (N == 0):
+        raise ValueError("The input has no points.")
+
+    evaluator = BatchEvaluator(function, mode)
+    m = evaluator(np.array(points[:1], dtype=float))[1].shape[1]
+    columns = m + m * n
+    if (chunk_size is None):
+        chunk_size = chunk_size_for_budget(evaluator.tape, n, m, memory_budget)
+
+    job = {'input': os.path.abspath(input_path), 'function': evaluator.identity(), 'mode': mode, 'shape': [N, columns]}
+    start = _read_progress(output_path, job) if resume else 0
+    if (start > 0):
+        out = np.load(output_path, mmap_mode='r+')
+    else:
+        out = np.lib.format.open_memmap(output_path, mode='w+', dtype=float, shape=(N, columns))
+        _write_progress(output_path, dict(job, rows=0))
+
+    chunks = 0
+    row = start
+    while (row < N and (max_chunks is None or chunks < max_chunks)):
+        stop = min(row + chunk_size, N)
+        values, J = evaluator(np.array(points[row:stop], dtype=float))
+        out[row:stop, :m] = values
+        out[row:stop, m:] = J.reshape(stop - row, m * n)
+        out.flush()
+        _write_progress(output_path, dict(job, rows=stop))
+        row = stop
+        chunks += 1
+
+    del out
+    return OutOfCoreResult(output_path, m, n, row == N)
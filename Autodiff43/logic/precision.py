@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+"""
+This module contains the precision policy, the floating point dtype of values, tangents and adjoints.
+
+Every Expression stores its value in the policy dtype (integer inputs included), FMExpression
+casts its gradient dictionaries to it and RMExpression.backward accumulates adjoints in it.
+The default is float64; float32 halves the memory of large batch jobs. The policy is set
+globally with set_precision, or for a block of code (and only the current thread or asyncio
+task) with the precision context manager.
+"""
+import contextlib
+import contextvars
+
+import numpy as np
+
+PRECISIONS = {'float32': np.dtype(np.float32), 'float64': np.dtype(np.float64)}
+
+_default = PRECISIONS['float64']
+_scoped = contextvars.ContextVar('precision', default=None)
+
+def _as_precision(dtype):
+    try:
+        ret = np.dtype(dtype)
+    except TypeError:
+        ret = None
+    # np.dtype(None) is float64 and dtypes compare equal to None, so None is checked first
+    if (dtype is None or ret is None or ret not in PRECISIONS.values()):
+        raise ValueError(f"Unsupported precision, expected one of {tuple(PRECISIONS)}.")
+    return ret
+
+def get_dtype():
+    """The dtype of the current precision policy, the innermost precision scope or else the global setting."""
+    dtype = _scoped.get()
+    return _default if dtype is None else dtype
+
+def set_precision(dtype):
+    """
+    Sets the global precision policy
+    Args:
+        dtype: 'float32' or 'float64' (or the corresponding NumPy dtype)
+    Returns:
+        None
+    """
+    global _default
+    _default = _as_precision(dtype)
+
+@contextlib.contextmanager
+def precision(dtype):
+    """
+    Uses a precision policy inside a with block, e.g. `with precision('float32'): ...`
+    Args:
+        dtype: 'float32' or 'float64' (or the corresponding NumPy dtype)
+    """
+    token = _scoped.set(_as_precision(dtype))
+    try:
+        yield get_dtype()
+    finally:
+        _scoped.reset(token)
+
+def cast(x):
+    """x as an array of the policy dtype, without copying when it already is one."""
+    return np.asarray(x, dtype=get_dtype())
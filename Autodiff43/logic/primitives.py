@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+
+"""
+This module contains user-defined primitives, operations recorded as a single opaque node.
+
+A primitive is defined by its value function and a JVP rule, a VJP rule or both. Registering
+it adds an entry to the op table in ops.py, so the primitive is replayed by Tape, compiled by
+codegen, evaluated by LazyExpression and serialized like any built-in operation. Calling the
+primitive on FMExpression, RMExpression or LazyExpression operands records one node, however
+expensive the value function is. When only one rule is given, the other is derived from it
+through the dense Jacobian of the primitive, one rule call per operand element (JVP) or per
+output element (VJP), so supplying both is faster for large operands.
+
+Every operand is differentiated. Python numbers and arrays among the operands are constants,
+recorded as leaves; other parameters (a table, a tolerance, ...) belong in the closures of the
+rules. The rules receive the operand values and the value of the primitive:
+
+    forward(*values) -> value
+    jvp(values, out, tangents) -> the tangent of the value, tangents having one entry per operand, None for operands without one
+    vjp(values, out, g) -> list with one cotangent per operand (None for zero), g being the cotangent of the value
+
+On a Tape replayed with a batch of points, the values hold the batch, so the rules should be
+vectorized like NumPy ufuncs.
+"""
+import numpy as np
+
+from .forward_mode import FMExpression
+from .lazy import LazyExpression
+from .ops import OPS, register_op
+from .reverse_mode import RMExpression
+
+# The op codes of the built-in operations, which primitives cannot replace
+BUILTIN_OPS = frozenset(OPS)
+
+def _unit(shape, k):
+    e = np.zeros(int(np.prod(shape)))
+    e[k] = 1
+    return e.reshape(shape)
+
+class Primitive:
+    """A user-defined operation with its derivative rules, callable on Expressions."""
+
+    def __init__(self, name, forward, jvp = None, vjp = None):
+        """
+        Args:
+            name: the op code stored on recorded nodes
+            forward, jvp, vjp: see the module docstring, at least one of jvp and vjp
+        """
+        if (jvp is None and vjp is None):
+            raise ValueError(f"Primitive '{name}' needs a jvp or a vjp rule.")
+        self.name = name
+        self.forward = forward
+        self.jvp_rule = jvp
+        self.vjp_rule = vjp
+
+    def __repr__(self):
+        return f'Primitive({self.name!r})'
+
+    def value(self, values):
+        """The value of the primitive at the operand values."""
+        return np.atleast_1d(np.asarray(self.forward(*values)))
+
+    def jacobians(self, values, out):
+        """
+        The dense Jacobian of the primitive with respect to every operand, from whichever rule is registered
+        Args:
+            values: the operand values
+            out: the value of the primitive
+        Returns:
+            list with one array of shape (out.size, operand size) per operand
+        """
+        sizes = [np.size(v) for v in values]
+        if (self.jvp_rule is not None):
+            ret = []
+            for i, v in enumerate(values):
+                tangents = [None] * len(values)
+                columns = []
+                for k in range(sizes[i]):
+                    tangents[i] = _unit(np.shape(v), k)
+                    columns.append(np.broadcast_to(self.jvp_rule(values, out, tangents), out.shape).ravel())
+                ret.append(np.array(columns).T.reshape(out.size, sizes[i]))
+            return ret
+
+        ret = [np.zeros((out.size, size)) for size in sizes]
+        for k in range(out.size):
+            for i, cotangent in enumerate(self.vjp_rule(values, out, _unit(out.shape, k))):
+                if (cotangent is not None):
+                    ret[i][k] = np.broadcast_to(cotangent, np.shape(values[i])).ravel()
+        return ret
+
+    def tangent(self, values, out, tangents, jacobians = None):
+        """
+        The tangent of the primitive (the JVP rule of its Op)
+        Args:
+            values: the operand values
+            out: the value of the primitive
+            tangents: list with one tangent per operand, None for operands without one
+            jacobians: the result of jacobians, used instead of a missing jvp rule when given
+        Returns:
+            the tangent of the value
+        """
+        if (self.jvp_rule is not None):
+            return self.jvp_rule(values, out, tangents)
+
+        if (jacobians is None):
+            jacobians = self.jacobians(values, out)
+        ret = np.zeros(out.size)
+        for J, v, t in zip(jacobians, values, tangents):
+            if (t is not None):
+                ret = ret + J @ np.broadcast_to(t, np.shape(v)).ravel()
+        return ret.reshape(out.shape)
+
+    def cotangents(self, values, out, g):
+        """
+        The cotangents of every operand, for a cotangent g of shape batch + out.shape
+        Args:
+            values: the operand values
+            out: the value of the primitive
+            g: the cotangent of the value, with optional leading axes of independent seeds
+        Returns:
+            list with one array of shape batch + the shape of the operand per operand
+        """
+        batch = g.shape[:g.ndim - out.ndim]
+        shapes = [np.shape(v) for v in values]
+        if (self.vjp_rule is None):
+            flat = g.reshape(-1, out.size)
+            return [(flat @ J).reshape(batch + shape) for J, shape in zip(self.jacobians(values, out), shapes)]
+
+        seeds = [g] if len(batch) == 0 else list(g.reshape((-1,) + out.shape))
+        ret = [[] for _ in values]
+        for seed in seeds:
+            for i, cotangent in enumerate(self.vjp_rule(values, out, seed)):
+                ret[i].append(np.zeros(shapes[i]) if cotangent is None else np.broadcast_to(cotangent, shapes[i]))
+        return [np.array(parts).reshape(batch + shape) for parts, shape in zip(ret, shapes)]
+
+    def partials(self, values, out):
+        """
+        Edge weights of the primitive, functions mapping the gradient of the node to the gradient of each operand.
+        The cotangents of all operands are computed together and reused by the other edges for the same gradient.
+        """
+        cache = {}
+
+        def rule(i):
+            def vjp(g):
+                if ('g' not in cache or cache['g'].shape != g.shape or not np.array_equal(cache['g'], g)):
+                    cache['cotangents'] = self.cotangents(values, out, g)
+                    cache['g'] = np.array(g) # a copy, adjoint buffers are reused by later sweeps
+                return cache['cotangents'][i]
+            return vjp
+
+        return [rule(i) for i in range(len(values))]
+
+    def __call__(self, *operands):
+        """
+        Applies the primitive, recording a single node
+        Args:
+            operands: FMExpressions, RMExpressions or LazyExpressions (of a single kind), ints, floats or arrays
+        Returns:
+            an Expression of the kind of the operands
+        """
+        kinds = set(type(x) for x in operands if isinstance(x, (FMExpression, RMExpression, LazyExpression)))
+        if (len(kinds) > 1):
+            raise TypeError(f"Primitive '{self.name}' cannot mix {', '.join(sorted(k.__name__ for k in kinds))} operands.")
+        for x in operands:
+            if (not isinstance(x, (FMExpression, RMExpression, LazyExpression, int, float, np.ndarray)) or isinstance(x, bool)):
+                raise TypeError("Needs to be type int, float, numpy array, or Expression")
+        kind = kinds.pop() if kinds else None
+
+        if (kind is LazyExpression):
+            parents = [x if isinstance(x, LazyExpression) else LazyExpression(x) for x in operands]
+            return LazyExpression(op = self.name, parents = parents)
+
+        if (kind is RMExpression):
+            parents = [x if isinstance(x, RMExpression) else RMExpression(x) for x in operands]
+            values = [x.value for x in parents]
+            new_var = RMExpression(self.value(values))
+            new_var.op = self.name
+            new_var.node_edges = list(zip(parents, self.partials(values, new_var.value)))
+            return new_var
+
+        values = [x.value if isinstance(x, FMExpression) else np.atleast_1d(np.asarray(x, dtype=float)) for x in operands]
+        new_var = FMExpression(self.value(values))
+        if (kind is None):
+            return new_var
+
+        grads = [x.grad if isinstance(x, FMExpression) else {} for x in operands]
+        jacobians = self.jacobians(values, new_var.value) if self.jvp_rule is None else None
+        new_var.grad = {}
+        for key in set(k for grad in grads for k in grad):
+            tangents = [grad.get(key) for grad in grads]
+            new_var.grad[key] = np.broadcast_to(self.tangent(values, new_var.value, tangents, jacobians), new_var.value.shape).copy()
+        return new_var
+
+def register_primitive(name, forward, jvp = None, vjp = None):
+    """
+    Defines a primitive and adds it to the op table, registering a primitive again under the same name replaces it
+    Args:
+        name: the op code of the primitive, which must not be a built-in op
+        forward: function (*values) -> value
+        jvp: function (values, out, tangents) -> tangent, optional if vjp is given
+        vjp: function (values, out, g) -> list of cotangents, optional if jvp is given
+    Returns:
+        the Primitive, to be called on Expressions
+    """
+    if (name in BUILTIN_OPS):
+        raise ValueError(f"'{name}' is a built-in op and cannot be redefined.")
+
+    primitive = Primitive(name, forward, jvp, vjp)
+    register_op(name,
+        lambda v, a: primitive.value(v),
+        lambda v, a, out: primitive.partials(v, out),
+        lambda v, a, out, t: primitive.tangent(v, out, t))
+    return primitive
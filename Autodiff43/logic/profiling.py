@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+
+"""
+This module contains an opt-in profiler for Expression operations.
+
+While a Profiler is enabled, the operation methods of Expression, FMExpression and
+RMExpression (and RMExpression.backward_scalar) are replaced with timing wrappers. The
+original methods are restored when it is disabled, so profiling costs nothing when it is off.
+"""
+import functools
+import json
+import time
+
+from .base import Expression
+from .forward_mode import FMExpression
+from .reverse_mode import RMExpression
+
+# Dunder methods that are operations, other dunders (__init__, __len__, ...) are never profiled
+OPERATOR_METHODS = {
+    '__add__', '__radd__', '__sub__', '__rsub__', '__mul__', '__rmul__',
+    '__truediv__', '__rtruediv__', '__pow__', '__rpow__', '__neg__',
+    '__matmul__', '__rmatmul__', '__getitem__',
+}
+# Public methods that are accessors rather than operations
+EXCLUDED_METHODS = {'value', 'grad', 'graph_stats', 'is_valid_scalar'}
+
+_active = None
+
+def _profiled_methods(cls):
+    """The names of the operation methods defined directly on cls."""
+    names = []
+    for name, attr in vars(cls).items():
+        if (not callable(attr) or isinstance(attr, (staticmethod, classmethod, type))):
+            continue
+        if (name in OPERATOR_METHODS or (not name.startswith('_') and name not in EXCLUDED_METHODS)):
+            names.append(name)
+    return names
+
+class Profiler:
+    """Counts calls and accumulates wall time per operation."""
+
+    def __init__(self, classes = (Expression, FMExpression, RMExpression)):
+        """
+        Args:
+            classes: the Expression classes whose operations are profiled
+        """
+        self.classes = tuple(classes)
+        self.stats = {}
+        self._originals = []
+        self._stack = []
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, *exc):
+        self.disable()
+        return False
+
+    @property
+    def enabled(self):
+        return len(self._originals) > 0
+
+    def enable(self):
+        """
+        Replaces the operation methods with timing wrappers
+        Args:
+            None
+        Returns:
+            None
+        """
+        global _active
+        if (_active is not None):
+            raise RuntimeError("Another Profiler is already enabled.")
+        _active = self
+
+        for cls in self.classes:
+            for name in _profiled_methods(cls):
+                method = vars(cls)[name]
+                self._originals.append((cls, name, method))
+                setattr(cls, name, self._wrap(f'{cls.__name__}.{name}', method))
+
+    def disable(self):
+        """
+        Restores the original methods, the collected statistics are kept
+        Args:
+            None
+        Returns:
+            None
+        """
+        global _active
+        for cls, name, method in reversed(self._originals):
+            setattr(cls, name, method)
+        self._originals = []
+        self._stack = []
+        if (_active is self):
+            _active = None
+
+    def reset(self):
+        """Clears the collected statistics."""
+        self.stats = {}
+
+    def _wrap(self, key, method):
+        stack = self._stack
+
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            stack.append(0.0)
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                child_time = stack.pop()
+                if (stack):
+                    stack[-1] += elapsed
+                self._record(key, elapsed, elapsed - child_time)
+
+        return wrapper
+
+    def _record(self, key, elapsed, self_time):
+        entry = self.stats.get(key)
+        if (entry is None):
+            entry = {'calls': 0, 'total_time': 0.0, 'self_time': 0.0, 'min_time': elapsed, 'max_time': elapsed}
+            self.stats[key] = entry
+
+        entry['calls'] += 1
+        entry['total_time'] += elapsed
+        entry['self_time'] += self_time
+        entry['min_time'] = min(entry['min_time'], elapsed)
+        entry['max_time'] = max(entry['max_time'], elapsed)
+
+    def as_dict(self):
+        """
+        Returns:
+            a dictionary mapping 'Class.method' to its call count and total, self (excluding nested
+            profiled calls), minimum and maximum wall time in seconds, sorted by self time. Each call
+            of RMExpression.backward_scalar is one reverse sweep.
+        """
+        return {k: dict(v) for k, v in sorted(self.stats.items(), key = lambda item: -item[1]['self_time'])}
+
+    def to_json(self, path = None):
+        """
+        Exports the statistics as JSON
+        Args:
+            path: optional file to write to
+        Returns:
+            the JSON string
+        """
+        ret = json.dumps(self.as_dict(), indent = 2)
+        if (path is not None):
+            with open(path, 'w') as f:
+                f.write(ret)
+        return ret
+
+def profile(classes = (Expression, FMExpression, RMExpression)):
+    """
+    Creates a Profiler for use as a context manager, e.g. `with profile() as p: ...`
+    Args:
+        classes: the Expression classes whose operations are profiled
+    Returns:
+        a new Profiler
+    """
+    return Profiler(classes)
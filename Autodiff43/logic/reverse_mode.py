@@ -6,28 +6,44 @@ This module contains our RMExpression class, which supports reverse-mode automat
 import numpy as np
 
 from .base import Expression
-from .utils import topological_sort, clear_grad
+from .ops import matmul_vjps, prod_partials, norm_partials, index_vjp, concat_vjps, softmax_vjp, log_softmax_vjp
+from .precision import get_dtype
+from .utils import AdjointPool
 
 class RMExpression(Expression):
-    def __init__(self, value, name = None, node_edges = None):
+    def __init__(self, value, name = None, node_edges = None, copy = True):
         """
-        Takes in the value of the Expression and optional name and node_edges arguments to create a RMExpression object
+        Takes in the value of the Expression and optional name and node_edges arguments to create a RMExpression object,
+        copy=False stores a numeric array without copying it
         """
-        super().__init__(value)
+        super().__init__(value, copy)
         self.name = name
         if (not node_edges):
             self.node_edges = [] # Output nodes are root
         else:
             self.node_edges = node_edges
 
-        self.grad = np.array([0] * len(self.value)) # Always initialized to 0 before backward pass.
+        self.grad = np.zeros_like(self.value) # Always initialized to 0 before backward pass.
         self.jacobian = None
+        self.jacobian_full = False # True once self.jacobian holds the Jacobian of every element
+        self._adjoint_pool = None # Adjoint buffers of backward sweeps from this node, reused by the next sweep
+
+        # Elementary operation that produced this node and its constant operands, None for leaves
+        self.op = None
+        self.op_args = ()
 
         self._valid = [int, float, RMExpression]
     
     def __str__(self):
         return f'Name: {self.name} has a real value of {self.value} and the grad values are {self.grad}. Node_edges are {self.node_edges} and leaves are {self.leaf}.'
 
+    def __reduce__(self):
+        """
+        Pickles the graph below this node through the flat format in serialization.py, so deep graphs do not hit the recursion limit
+        """
+        from .serialization import graph_to_arrays, graph_from_arrays
+        return (graph_from_arrays, (graph_to_arrays(self),))
+
     def __add__(self, var2):
         """
         Addition function for RMExpression, adds the values and updates the node_edges
@@ -40,8 +56,10 @@ class RMExpression(Expression):
             raise TypeError("Needs to be type int, float, or RMExpression")
 
         new_var = self.from_expression(super().__add__(var2))
+        new_var.op = 'add'
 
         if (type(var2) in [int, float]):
+            new_var.op_args = (var2,)
             new_var.node_edges.append((self, 1))
             return new_var
 
@@ -65,8 +83,10 @@ class RMExpression(Expression):
             raise TypeError("Needs to be type int, float, or RMExpression")
 
         new_var = self.from_expression(super().__sub__(var2))
+        new_var.op = 'sub'
 
         if (type(var2) in [int, float]):
+            new_var.op_args = (var2,)
             new_var.node_edges.append((self, 1))
             return new_var
 
@@ -87,6 +107,8 @@ class RMExpression(Expression):
             raise TypeError("Needs to be type int, float, or RMExpression")
 
         new_var = self.from_expression(super().__rsub__(var2))
+        new_var.op = 'rsub'
+        new_var.op_args = (var2,)
         new_var.node_edges.append((self, -1))
         return new_var
 
@@ -102,8 +124,10 @@ class RMExpression(Expression):
             raise TypeError("Needs to be type int, float, or RMExpression")
 
         new_var = self.from_expression(super().__mul__(var2))
+        new_var.op = 'mul'
 
         if (type(var2) in [int, float]):
+            new_var.op_args = (var2,)
             new_var.node_edges.append((self, var2))
             return new_var
 
@@ -127,8 +151,10 @@ class RMExpression(Expression):
             raise TypeError("Needs to be type int, float, or RMExpression")
 
         new_var = self.from_expression(super().__truediv__(var2))
+        new_var.op = 'truediv'
 
         if (type(var2) in [int, float]):
+            new_var.op_args = (var2,)
             new_var.node_edges.append((self, 1 / var2))
             return new_var
 
@@ -149,6 +175,8 @@ class RMExpression(Expression):
             raise TypeError("Needs to be type int, float, or FMExpression")
 
         new_var = self.from_expression(super().__rtruediv__(var2))
+        new_var.op = 'rtruediv'
+        new_var.op_args = (var2,)
         new_var.node_edges.append((self, -var2 / self.value ** 2))
         return new_var
 
@@ -164,8 +192,10 @@ class RMExpression(Expression):
             raise TypeError("Needs to be type int, float, or RMExpression")
 
         new_var = self.from_expression(super().__pow__(var2))
+        new_var.op = 'pow'
 
         if (type(var2) in [int, float]):
+            new_var.op_args = (var2,)
             new_var.node_edges.append((self, var2 * self.value ** (var2 - 1)))
             return new_var
 
@@ -174,6 +204,49 @@ class RMExpression(Expression):
 
         return new_var
 
+    def __matmul__(self, var2):
+        """
+        Matrix multiplication function for RMExpression, represents self @ var2 and updates the node_edges
+        Args:
+            var2: another variable either of type RMExpression or a constant numpy array
+        Returns:
+            a new RMExpression that represents the matrix product
+        """
+        if (not isinstance(var2, (RMExpression, np.ndarray))):
+            raise TypeError("Needs to be type numpy array or RMExpression")
+
+        new_var = self.from_expression(super().__matmul__(var2))
+        new_var.op = 'matmul'
+
+        # The edge weights are functions mapping the gradient of the product to the gradient of each operand
+        if (isinstance(var2, np.ndarray)):
+            new_var.op_args = (var2,)
+            new_var.node_edges.append((self, matmul_vjps(self.value, var2)[0]))
+            return new_var
+
+        vjp_self, vjp_var2 = matmul_vjps(self.value, var2.value)
+        new_var.node_edges.append((self, vjp_self))
+        new_var.node_edges.append((var2, vjp_var2))
+
+        return new_var
+
+    def __rmatmul__(self, var2):
+        """
+        Reverse matrix multiplication function for RMExpression, in case of constant array @ RMExpression object
+        Args:
+            var2: a constant numpy array
+        Returns:
+            a new RMExpression that represents the matrix product
+        """
+        if (not isinstance(var2, np.ndarray)):
+            raise TypeError("Needs to be type numpy array or RMExpression")
+
+        new_var = self.from_expression(super().__rmatmul__(var2))
+        new_var.op = 'rmatmul'
+        new_var.op_args = (var2,)
+        new_var.node_edges.append((self, matmul_vjps(var2, self.value)[1]))
+        return new_var
+
     def __neg__(self):
         """
         Negation function for RMExpression
@@ -183,9 +256,25 @@ class RMExpression(Expression):
             a new RMExpression that represents the negation
         """
         new_var = self.from_expression(super().__neg__())
+        new_var.op = 'neg'
         new_var.node_edges.append((self, -1))
         return new_var
 
+    def __getitem__(self, index):
+        """
+        Indexing function for RMExpression, the edge weight scatters the gradient of the selection back into self,
+        adding up the gradients of elements selected more than once
+        Args:
+            index: an integer, slice, array of indices or boolean mask, or a tuple of those
+        Returns:
+            a new RMExpression that represents the selection
+        """
+        new_var = self.from_expression(super().__getitem__(index))
+        new_var.op = 'getitem'
+        new_var.op_args = (index,)
+        new_var.node_edges.append((self, index_vjp(self.value.shape, index, new_var.value.shape)))
+        return new_var
+
     def exp(self, var2 = None):
         """
         Exponentiation function for RMExpression, exponents the values and updates the node_edges, represents var2 ** self, reverse of __pow__
@@ -196,12 +285,15 @@ class RMExpression(Expression):
         """
         if (var2 == None): # we are doing e ** self
             new_var = self.from_expression(super().exp())
+            new_var.op = 'exp'
             new_var.node_edges.append((self, np.exp(self.value)))
             return new_var
 
         new_var = self.from_expression(super().exp(var2))
+        new_var.op = 'exp'
 
         if (type(var2) in [int, float]):
+            new_var.op_args = (var2,)
             new_var.node_edges.append((self, var2 ** self.value * np.log(var2)))
             return new_var
 
@@ -219,6 +311,7 @@ class RMExpression(Expression):
             a new RMExpression that represents the sin
         """
         new_var = self.from_expression(super().sin())
+        new_var.op = 'sin'
         new_var.node_edges.append((self, np.cos(self.value)))
         return new_var
 
@@ -231,6 +324,7 @@ class RMExpression(Expression):
             a new RMExpression that represents the cos
         """
         new_var = self.from_expression(super().cos())
+        new_var.op = 'cos'
         new_var.node_edges.append((self, -np.sin(self.value)))
         return new_var
 
@@ -243,6 +337,7 @@ class RMExpression(Expression):
             a new RMExpression that represents the tan
         """
         new_var = self.from_expression(super().tan())
+        new_var.op = 'tan'
         new_var.node_edges.append((self, 1 / np.cos(self.value) ** 2))
         return new_var
 
@@ -255,6 +350,7 @@ class RMExpression(Expression):
             a new RMExpression that represents the arcsin
         """
         new_var = self.from_expression(super().arcsin())
+        new_var.op = 'arcsin'
         new_var.node_edges.append((self, 1 / (np.sqrt(1 - self.value ** 2))))
         return new_var
 
@@ -267,6 +363,7 @@ class RMExpression(Expression):
             a new RMExpression that represents the arccos
         """
         new_var = self.from_expression(super().arccos())
+        new_var.op = 'arccos'
         new_var.node_edges.append((self, -1 / (np.sqrt(1 - self.value ** 2))))
         return new_var
 
@@ -279,6 +376,7 @@ class RMExpression(Expression):
             a new RMExpression that represents the arctan
         """
         new_var = self.from_expression(super().arctan())
+        new_var.op = 'arctan'
         new_var.node_edges.append((self, 1 / (1 + self.value ** 2)))
         return new_var
 
@@ -291,6 +389,7 @@ class RMExpression(Expression):
             a new RMExpression that represents the sinh
         """
         new_var = self.from_expression(super().sinh())
+        new_var.op = 'sinh'
         new_var.node_edges.append((self, np.cosh(self.value)))
         return new_var
 
@@ -303,6 +402,7 @@ class RMExpression(Expression):
             a new RMExpression that represents the cosh
         """
         new_var = self.from_expression(super().cosh())
+        new_var.op = 'cosh'
         new_var.node_edges.append((self, np.sinh(self.value)))
         return new_var
 
@@ -315,6 +415,7 @@ class RMExpression(Expression):
             a new RMExpression that represents the tanh
         """
         new_var = self.from_expression(super().tanh())
+        new_var.op = 'tanh'
         new_var.node_edges.append((self, 1 / np.cosh(self.value) ** 2))
         return new_var
 
@@ -327,6 +428,7 @@ class RMExpression(Expression):
             a new RMExpression that represents the sigmoid expression
         """
         new_var = self.from_expression(super().sigmoid())
+        new_var.op = 'sigmoid'
         new_var.node_edges.append((self, np.exp(-self.value) / (np.exp(-self.value) + 1) ** 2))
         return new_var
 
@@ -340,12 +442,15 @@ class RMExpression(Expression):
         """
         if (not var2): # we are doing ln(self)
             new_var = self.from_expression(super().log())
+            new_var.op = 'log'
             new_var.node_edges.append((self, 1 / self.value))
             return new_var
 
         new_var = self.from_expression(super().log(var2))
+        new_var.op = 'log'
 
         if (type(var2) in [int, float]):
+            new_var.op_args = (var2,)
             new_var.node_edges.append((self, 1 / (self.value * np.log(var2))))
             return new_var
 
@@ -364,30 +469,228 @@ class RMExpression(Expression):
         """
         return self.__pow__(0.5)
 
-    def backward_scalar(self):
+    def sum(self):
         """
-        Computes the partial derivative of self (parent node) with respect to each leaf node by updating the gradient at every node.
-        Proceeds in order of topological sort, updating the .grad attribute at each point, and updating self.jacobian when a variable RMExpression is reached
+        Sum function for RMExpression, a single node whose edge weight is 1 for every element
+        Args:
+            None
+        Returns:
+            a new RMExpression that represents the sum
+        """
+        new_var = self.from_expression(super().sum())
+        new_var.op = 'sum'
+        new_var.node_edges.append((self, 1))
+        return new_var
+
+    def mean(self):
+        """
+        Mean function for RMExpression, a single node whose edge weight is 1 / n for every element
+        Args:
+            None
+        Returns:
+            a new RMExpression that represents the mean
+        """
+        new_var = self.from_expression(super().mean())
+        new_var.op = 'mean'
+        new_var.node_edges.append((self, 1 / self.value.size))
+        return new_var
+
+    def prod(self):
+        """
+        Product function for RMExpression, the edge weight of each element is the product of all the others
+        Args:
+            None
+        Returns:
+            a new RMExpression that represents the product
+        """
+        new_var = self.from_expression(super().prod())
+        new_var.op = 'prod'
+        new_var.node_edges.append((self, prod_partials(self.value)))
+        return new_var
+
+    def norm(self):
+        """
+        Euclidean norm function for RMExpression, the edge weights are self / norm (0 where the norm is 0)
+        Args:
+            None
+        Returns:
+            a new RMExpression that represents the norm
+        """
+        new_var = self.from_expression(super().norm())
+        new_var.op = 'norm'
+        new_var.node_edges.append((self, norm_partials(self.value, new_var.value)))
+        return new_var
+
+    def dot(self, var2):
+        """
+        Dot product function for RMExpression, a single node whose edge weights are the other operand
+        Args:
+            var2: another variable either of type RMExpression or a constant numpy array
+        Returns:
+            a new RMExpression that represents the dot product
+        """
+        if (not isinstance(var2, (RMExpression, np.ndarray))):
+            raise TypeError("Needs to be type numpy array or RMExpression")
+
+        new_var = self.from_expression(super().dot(var2))
+        new_var.op = 'dot'
+
+        if (isinstance(var2, np.ndarray)):
+            new_var.op_args = (var2,)
+            new_var.node_edges.append((self, var2))
+            return new_var
+
+        new_var.node_edges.append((self, var2.value))
+        new_var.node_edges.append((var2, self.value))
+
+        return new_var
+
+    def logsumexp(self):
+        """
+        Logsumexp function for RMExpression, a single node whose edge weights are the softmax of self
         Args:
             None
         Returns:
+            a new RMExpression that represents the logsumexp
+        """
+        new_var = self.from_expression(super().logsumexp())
+        new_var.op = 'logsumexp'
+        new_var.node_edges.append((self, np.exp(self.value - new_var.value)))
+        return new_var
+
+    def softmax(self):
+        """
+        Softmax function for RMExpression, the edge weight maps the gradient g to s * (g - sum(g * s)) where s is the softmax
+        Args:
             None
+        Returns:
+            a new RMExpression that represents the softmax
         """
-        self.jacobian = dict()
+        new_var = self.from_expression(super().softmax())
+        new_var.op = 'softmax'
+        new_var.node_edges.append((self, softmax_vjp(new_var.value)))
+        return new_var
 
-        # clears all gradients
-        clear_grad(self)
-        self.grad = 1
+    def log_softmax(self):
+        """
+        Log-softmax function for RMExpression, the edge weight maps the gradient g to g - s * sum(g) where s is the softmax
+        Args:
+            None
+        Returns:
+            a new RMExpression that represents the log-softmax
+        """
+        new_var = self.from_expression(super().log_softmax())
+        new_var.op = 'log_softmax'
+        new_var.node_edges.append((self, log_softmax_vjp(new_var.value)))
+        return new_var
 
-        topo_sort = topological_sort(self)
-        for node in topo_sort:
+    def softplus(self):
+        """
+        Softplus function for RMExpression, the edge weights are sigmoid(self) = exp(self - softplus(self))
+        Args:
+            None
+        Returns:
+            a new RMExpression that represents the softplus
+        """
+        new_var = self.from_expression(super().softplus())
+        new_var.op = 'softplus'
+        new_var.node_edges.append((self, np.exp(self.value - new_var.value)))
+        return new_var
 
+    def logistic_loss(self, labels):
+        """
+        Logistic loss function for RMExpression, the edge weights are sigmoid(self) - labels
+        Args:
+            labels: int, float or numpy array of targets in [0, 1], broadcastable to the shape of self
+        Returns:
+            a new RMExpression that represents the elementwise loss
+        """
+        new_var = self.from_expression(super().logistic_loss(labels))
+        new_var.op = 'logistic_loss'
+        new_var.op_args = (labels,)
+        new_var.node_edges.append((self, np.exp(self.value - new_var.value - labels * self.value) - labels))
+        return new_var
+
+    def squared_norm(self):
+        """
+        Squared norm function for RMExpression, a single node whose edge weights are 2 * self
+        Args:
+            None
+        Returns:
+            a new RMExpression that represents the squared norm
+        """
+        new_var = self.from_expression(super().squared_norm())
+        new_var.op = 'squared_norm'
+        new_var.node_edges.append((self, 2 * self.value))
+        return new_var
+
+    def backward(self, seed = None):
+        """
+        Propagates seed from self (parent node) to every node of the graph in a single reverse sweep, in order of topological sort,
+        updating the .grad attribute at each point
+        Args:
+            seed: the gradient of self, of shape self.value.shape or batch + self.value.shape, where each index of the
+            leading batch axes is an independent seed. Defaults to ones, the gradient of the sum of the elements of self
+        Returns:
+            a dictionary mapping the name of each leaf node to its gradient, of shape batch + the shape of the leaf
+        """
+        dtype = get_dtype()
+        if (seed is None):
+            seed = np.ones(self.value.shape, dtype=dtype)
+        else:
+            seed = np.array(seed, dtype=dtype) # a copy, gradient arrays on the graph are reused as adjoint buffers
+        nbatch = seed.ndim - self.value.ndim
+        if (nbatch < 0 or seed.shape[nbatch:] != self.value.shape):
+            raise ValueError("The seed must end with the shape of the RMExpression.")
+
+        # Buffers from the previous sweep are reused when the batch axes and dtype match
+        key = (seed.shape[:nbatch], dtype)
+        pool = self._adjoint_pool
+        if (pool is None or pool.key != key):
+            pool = self._adjoint_pool = AdjointPool(self, *key)
+        pool.reset()
+        self.grad = seed
+
+        ret = dict()
+        for node in pool.order:
             if (len(node.node_edges) == 0):
-                name = node.name
-                self.jacobian[name] = node.grad
+                # Leaf gradients are copied out, the buffers are overwritten by the next sweep
+                ret[node.name] = node.grad.copy()
 
             for (child, edge_weight) in node.node_edges:
-                child.grad = child.grad + edge_weight * node.grad
+                pool.accumulate(child, edge_weight, node.grad, nbatch)
+
+        return ret
+
+    def backward_scalar(self):
+        """
+        Computes the partial derivative of self (parent node) with respect to each leaf node by updating the gradient at every node.
+        Proceeds in order of topological sort, updating the .grad attribute at each point, and updating self.jacobian when a variable RMExpression is reached.
+        For a vector self this is the gradient of the sum of its elements, which is the elementwise derivative when every operation is elementwise
+        Args:
+            None
+        Returns:
+            None
+        """
+        self.jacobian = self.backward()
+        self.jacobian_full = False
+
+    def backward_vector(self):
+        """
+        Computes the Jacobian of every element of self with respect to each leaf node in a single reverse sweep, seeding
+        each element with a unit vector along a leading batch axis. Updates self.jacobian with arrays of shape
+        self.value.shape + the shape of the leaf. This needs O(n^2) memory for n elements
+        Args:
+            None
+        Returns:
+            None
+        """
+        n = self.value.size
+        jacobian = self.backward(np.eye(n).reshape((n,) + self.value.shape))
+        self.jacobian = {k: v.reshape(self.value.shape + v.shape[1:]) for k, v in jacobian.items()}
+        self.jacobian_full = True
+        # The buffers of an n x n sweep are not kept for the next one
+        self._adjoint_pool = None
 
     def value(self, *args):
         """
@@ -398,60 +701,62 @@ class RMExpression(Expression):
             the value or an array with the values of the RMExpression object
         """
         if (len(args) == 0):
-            if (len(self) == 1):
-                return self.value[0]
+            if (self.value.size == 1):
+                return self.value.ravel()[0]
             else:
-                ret = []
-                for i in range(len(self)):
-                    ret.append(self[i].value[0])
-                return ret
+                return list(self.value.ravel())
         if (len(args) == 1):
-            return self[args[0]].value[0]
+            return self.value.ravel()[args[0]]
 
     def grad(self, *args):
         """
-        Gets the gradient of a RMExpression object
+        Gets the gradient of a RMExpression object from a single reverse sweep
         Args:
             either a variable name or a function number and variable name
         Returns:
-            the gradient or an array with all the gradients of the RMExpression object
+            the gradient or an array with all the gradients of the RMExpression object. For a vector RMExpression this is
+            the gradient of the sum of its elements (see backward_scalar), or of element i when a function number is given,
+            the full Jacobian is left to backward_vector
         """
         if (len(args) == 1 and isinstance(args[0], str)):
-            if (len(self) > 1):
-                for i in range(len(self)):
-                    if (self[i].jacobian == None):
-                        self[i].backward_scalar()
-
-                ret = np.array([])
-                for i in range(len(self)):
-                    ret = np.concatenate([ret, [self[i].jacobian[args[0]]]])
-
-                return ret
-
-            if (self.jacobian == None):
+            if (self.jacobian is None or self.jacobian_full):
                 self.backward_scalar()
             return self.jacobian[args[0]]
 
         if (len(args) == 2 and isinstance(args[0], int) and isinstance(args[1], str)):
-            for i in range(len(self)):
-                if (i == args[0]):
-                    if (self[i].jacobian == None):
-                        self[i].backward_scalar()
-                    return self[i].jacobian[args[1]]
+            if (self.value.size == 1):
+                return RMExpression.grad(self, args[1])
+            seed = np.zeros(self.value.size, dtype=get_dtype())
+            seed[args[0]] = 1
+            return self.backward(seed.reshape(self.value.shape))[args[1]]
+
+    def graph_stats(self):
+        """
+        Describes the size and estimated cost of the graph ending at this RMExpression
+        Args:
+            None
+        Returns:
+            a dictionary of graph statistics, see introspection.graph_stats
+        """
+        from .introspection import graph_stats
+        return graph_stats(self)
 
     @staticmethod
     def vec(*args):
         """
         Combines different RMExpressions into a vector to represent vector functions
         Args:
-            a list of RMExpressions to be combined into a vector
+            a list of RMExpressions (or int, float) to be combined into a vector
         Returns:
-            A vector of RMExpressions
+            A new RMExpression concatenating the flattened values, whose edge weights select each part of the gradient
         """
-        exprs = []
-        for func in args:
-            exprs.append(func)
-        return exprs
+        parts = [x if isinstance(x, RMExpression) else RMExpression(x) for x in args]
+
+        new_var = RMExpression(np.concatenate([x.value.ravel() for x in parts]))
+        new_var.op = 'concat'
+        for (x, vjp) in zip(parts, concat_vjps([x.value.shape for x in parts])):
+            new_var.node_edges.append((x, vjp))
+        return new_var
 
     @classmethod
     def from_expression(cls, expr):
@@ -462,4 +767,4 @@ class RMExpression(Expression):
         Returns:
             RMExpression variable of Expression object
         """
-        return RMExpression(expr.value)
+        return RMExpression(expr.value, copy=False)
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+
+"""
+This module contains a Newton root solver for systems F(x) = 0 that reuses its Jacobian.
+
+The system is recorded once into a Tape. The solver computes a Jacobian with the Tape, inverts
+it, and keeps using that inverse while the residual keeps shrinking fast enough, applying a
+rank-one Broyden update after every step (a Sherman-Morrison update of the inverse, O(n^2)).
+A fresh Jacobian is only computed when convergence stalls, so slowly varying systems need far
+fewer Jacobian evaluations than a full Newton iteration.
+"""
+import numpy as np
+
+from . import core
+from .tape import trace
+
+class System:
+    """A function of n scalar coordinates returning m outputs, recorded once into a Tape."""
+
+    def __init__(self, function, x, mode = None):
+        """
+        Args:
+            function: a function of n Expressions returning an Expression or a list of Expressions
+            x: the point the function is recorded at, shape (n,)
+            mode: 'forward' or 'reverse' for the Jacobian sweeps, defaults to core.AD_MODE
+        """
+        self.n = len(x)
+        self.tape = trace(function, list(x), [f'x{i}' for i in range(self.n)])
+        ad_mode = core.ADMode.from_str(mode) if mode is not None else core.AD_MODE
+        self.mode = 'forward' if ad_mode == core.ADMode.FORWARD else 'reverse'
+        self.nfev = 0
+        self.njev = 0
+
+    def value(self, x):
+        """
+        Args:
+            x: the point, shape (n,)
+        Returns:
+            the outputs concatenated, shape (m,)
+        """
+        self.nfev += 1
+        return np.concatenate([np.ravel(out) for out in self.tape.evaluate(*x)]).astype(float)
+
+    def jacobian(self, x):
+        """
+        Args:
+            x: the point, shape (n,)
+        Returns:
+            a tuple (F, J) with the outputs, shape (m,), and the Jacobian, shape (m, n)
+        """
+        self.nfev += 1
+        self.njev += 1
+        values = self.tape.forward(list(x))
+        outputs = [values[i] for i in self.tape.output_index]
+        sizes = [np.size(out) for out in outputs]
+        F = np.concatenate([np.ravel(out) for out in outputs]).astype(float)
+        J = np.empty((len(F), self.n))
+
+        if (self.mode == 'forward'):
+            # One tangent sweep per input gives a column
+            for j in range(self.n):
+                tangents = [None] * self.n
+                tangents[j] = np.ones(())
+                column = self.tape.jvp(values, tangents)
+                J[:, j] = np.concatenate([np.broadcast_to(np.ravel(t), (size,)) for t, size in zip(column, sizes)])
+        else:
+            # One reverse sweep per output element gives a row
+            row = 0
+            for i, out in enumerate(outputs):
+                for e in range(sizes[i]):
+                    seeds = [None] * len(outputs)
+                    seeds[i] = np.zeros(np.shape(out))
+                    seeds[i].flat[e] = 1
+                    J[row] = [np.sum(a) for a in self.tape.vjp(values, seeds)]
+                    row += 1
+
+        return F, J
+
+class RootResult:
+    """The outcome of a root solve."""
+
+    def __init__(self, x, fun, converged, nit, nfev, njev):
+        self.x = x
+        self.fun = fun
+        self.converged = converged
+        self.nit = nit
+        self.nfev = nfev
+        self.njev = njev
+
+    def __repr__(self):
+        return f'RootResult(converged={self.converged}, |F|={np.linalg.norm(self.fun)}, nit={self.nit}, njev={self.njev})'
+
+def _inverse(J):
+    """The inverse of J, or its pseudo-inverse when J is singular."""
+    try:
+        return np.linalg.inv(J)
+    except np.linalg.LinAlgError:
+        return np.linalg.pinv(J)
+
+def broyden_update(J_inv, s, y):
+    """
+    Broyden's ("good") rank-one update, applied to the inverse Jacobian with the Sherman-Morrison formula
+    Args:
+        J_inv: the current inverse Jacobian approximation, shape (n, n)
+        s: the step x_new - x
+        y: the change of the outputs F(x_new) - F(x)
+    Returns:
+        the updated inverse, unchanged if the update is numerically singular
+    """
+    J_inv_y = J_inv @ y
+    denom = s @ J_inv_y
+    if (abs(denom) <= 1e-14 * np.linalg.norm(s) * np.linalg.norm(J_inv_y)):
+        return J_inv
+    return J_inv + np.outer((s - J_inv_y) / denom, s @ J_inv)
+
+def root(function, x0, tol = 1e-10, max_iter = 100, mode = None, broyden = True, stall = 0.5, max_backtracks = 20):
+    """
+    Solves F(x) = 0 with Newton steps on a reused, Broyden-updated Jacobian
+    Args:
+        function: a function of n Expressions returning n outputs (an Expression or a list of Expressions)
+        x0: the starting point, shape (n,)
+        tol: the solve has converged once the Euclidean norm of F is below tol
+        max_iter: maximum number of iterations
+        mode: 'forward' or 'reverse' for the Jacobian sweeps, defaults to core.AD_MODE
+        broyden: apply rank-one Broyden updates between Jacobian evaluations, otherwise the Jacobian is kept as it is (chord method)
+        stall: a step that does not reduce the norm of F by at least this factor counts as stalled and triggers a fresh Jacobian
+        max_backtracks: maximum number of step halvings when a step with a fresh Jacobian does not reduce the norm of F
+    Returns:
+        a RootResult
+    """
+    x = np.array(x0, dtype=float).ravel()
+    system = System(function, x, mode)
+
+    F, J = system.jacobian(x)
+    if (J.shape[0] != J.shape[1]):
+        raise ValueError("The system must have as many outputs as inputs.")
+    J_inv = _inverse(J)
+    fresh = True
+
+    converged = False
+    nit = 0
+    norm = np.linalg.norm(F)
+    while (nit < max_iter):
+        if (norm < tol):
+            converged = True
+            break
+        nit += 1
+
+        dx = -J_inv @ F
+        x_new = x + dx
+        F_new = system.value(x_new)
+        norm_new = np.linalg.norm(F_new)
+
+        if (not np.isfinite(norm_new) or norm_new > stall * norm):
+            if (not fresh):
+                F, J = system.jacobian(x)
+                J_inv = _inverse(J)
+                fresh = True
+                continue
+
+            # Even the fresh Jacobian overshoots, damp the step until the norm of F decreases
+            t = 1.0
+            for _ in range(max_backtracks):
+                if (np.isfinite(norm_new) and norm_new < (1 - 1e-4 * t) * norm):
+                    break
+                t /= 2
+                x_new = x + t * dx
+                F_new = system.value(x_new)
+                norm_new = np.linalg.norm(F_new)
+            else:
+                break
+
+        if (broyden):
+            J_inv = broyden_update(J_inv, x_new - x, F_new - F)
+        fresh = False
+
+        x, F, norm = x_new, F_new, norm_new
+
+    if (norm < tol):
+        converged = True
+
+    return RootResult(x, F, converged, nit, system.nfev, system.njev)
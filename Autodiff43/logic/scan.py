@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+
+"""
+This module contains scan, a loop primitive that records its body once, however many steps it runs.
+
+scan(body, init, xs) computes carry_{t+1}, y_t = body(carry_t, xs[t]) for every t and returns
+the last carry and the stacked y_t. The body is traced once into a Tape and replayed for every
+step without creating Expression objects. The whole loop is recorded as a single 'scan' node
+(plus the two selections of its outputs), so the size of the graph does not depend on the number
+of steps. Its edge weights are VJPs that replay the adjoint of the body in reverse, step by step.
+Only the carries are kept as checkpoints, and the values inside a step are recomputed when the
+reverse sweep reaches it. Tangents go through the loop the same way, forward.
+
+RMExpressions the body depends on other than the carry and the step input must be passed in
+params, as extra arguments of body, so that their gradients are propagated; the body must not
+capture them in a closure.
+"""
+import numpy as np
+
+from .forward_mode import FMExpression
+from .ops import register_op
+from .primitives import Primitive
+from .reverse_mode import RMExpression
+from .tape import Tape
+from .utils import topological_order
+
+class ScanBody:
+    """The body of a scan traced into a Tape, with the rules of the loop it runs."""
+
+    def __init__(self, body, carry, x, params):
+        """
+        Args:
+            body: function (carry, x, *params) -> (new carry, y) of RMExpressions
+            carry, x, params: the values of the initial carry, the first step input and the parameters
+        """
+        leaves = [RMExpression(carry, 'carry'), RMExpression(x, 'x')] + [RMExpression(p, f'p{i}') for i, p in enumerate(params)]
+        out = body(*leaves)
+        if (not isinstance(out, (list, tuple)) or len(out) != 2):
+            raise TypeError("The body of a scan must return a tuple (carry, y).")
+        new_carry, y = [o if isinstance(o, RMExpression) else RMExpression(o) for o in out]
+        if (new_carry.value.shape != leaves[0].value.shape):
+            raise ValueError(f"The body changes the shape of the carry from {leaves[0].value.shape} to {new_carry.value.shape}.")
+
+        for node in topological_order([new_carry, y]):
+            if (len(node.node_edges) == 0 and node.name is not None and not any(node is leaf for leaf in leaves)):
+                raise ValueError(f"The body of a scan uses the RMExpression '{node.name}', pass it in params instead.")
+
+        self.tape = Tape([new_carry, y], leaves)
+        self.carry_shape = leaves[0].value.shape
+        self.x_shape = leaves[1].value.shape
+        self.y_shape = y.value.shape
+        # Bound methods rather than closures, so that graphs holding a scan can be pickled and saved
+        self.primitive = Primitive('scan', self._forward, self.jvp, self.vjp)
+        self._checkpoints = None
+
+    def __repr__(self):
+        return f'ScanBody({self.tape.size} nodes)'
+
+    def __getstate__(self):
+        # The checkpoints of the last run are recomputed when needed
+        state = self.__dict__.copy()
+        state['_checkpoints'] = None
+        return state
+
+    def _forward(self, *values):
+        return self.value(values)
+
+    def _x(self, xs, t):
+        return np.reshape(xs[t], self.x_shape)
+
+    def run(self, values):
+        """
+        Runs the loop
+        Args:
+            values: the initial carry, the stacked step inputs and the parameters
+        Returns:
+            a tuple (carries, ys) with the carry before every step and after the last, and the stacked y
+        """
+        carry, xs, params = values[0], values[1], list(values[2:])
+        carries = [carry]
+        ys = []
+        for t in range(len(xs)):
+            carry, y = self.tape.evaluate(carry, self._x(xs, t), *params)
+            carries.append(np.reshape(carry, self.carry_shape))
+            ys.append(np.reshape(y, self.y_shape))
+            carry = carries[-1]
+        self._checkpoints = (values, carries)
+        return carries, np.array(ys).reshape((len(xs),) + self.y_shape)
+
+    def _carries(self, values):
+        """The carries of the loop at values, reused from the last run when it was at the same values."""
+        if (self._checkpoints is not None and len(self._checkpoints[0]) == len(values)
+                and all(a is b for a, b in zip(self._checkpoints[0], values))):
+            return self._checkpoints[1]
+        return self.run(values)[0]
+
+    def value(self, values):
+        """The value of the scan node, the last carry and the stacked y, flattened and concatenated."""
+        carries, ys = self.run(values)
+        return np.concatenate([np.ravel(carries[-1]), np.ravel(ys)])
+
+    def vjp(self, values, out, g):
+        """
+        The reverse sweep of the loop, one reverse sweep of the body per step from the last one
+        Args:
+            values: the initial carry, the stacked step inputs and the parameters
+            out: the value of the scan node
+            g: the gradient of the scan node
+        Returns:
+            list with the gradient of every operand
+        """
+        carries = self._carries(values)
+        xs, params = values[1], list(values[2:])
+        size = int(np.prod(self.carry_shape))
+        g_carry = np.reshape(g[:size], self.carry_shape)
+        g_ys = np.reshape(g[size:], (len(xs),) + self.y_shape)
+
+        g_xs = np.zeros(np.shape(xs))
+        g_params = [np.zeros(np.shape(p)) for p in params]
+        for t in reversed(range(len(xs))):
+            step_values = self.tape.forward([carries[t], self._x(xs, t)] + params)
+            adjoints = self.tape.vjp(step_values, [g_carry, g_ys[t]])
+            g_carry = np.broadcast_to(adjoints[0], self.carry_shape)
+            g_xs[t] = np.reshape(np.broadcast_to(adjoints[1], self.x_shape), np.shape(g_xs[t]))
+            for g_p, adjoint in zip(g_params, adjoints[2:]):
+                g_p += adjoint
+        return [g_carry, g_xs] + g_params
+
+    def jvp(self, values, out, tangents):
+        """
+        The tangent sweep of the loop, one tangent sweep of the body per step
+        Args:
+            values: the initial carry, the stacked step inputs and the parameters
+            out: the value of the scan node
+            tangents: list with one tangent per operand, None for operands without one
+        Returns:
+            the tangent of the scan node
+        """
+        carries = self._carries(values)
+        xs, params = values[1], list(values[2:])
+        t_carry, t_xs, t_params = tangents[0], tangents[1], list(tangents[2:])
+        if (t_xs is not None):
+            t_xs = np.broadcast_to(t_xs, np.shape(xs))
+
+        t_ys = []
+        for t in range(len(xs)):
+            step_values = self.tape.forward([carries[t], self._x(xs, t)] + params)
+            t_x = None if t_xs is None else self._x(t_xs, t)
+            t_carry, t_y = self.tape.jvp(step_values, [t_carry, t_x] + t_params)
+            t_carry = np.broadcast_to(t_carry, self.carry_shape)
+            t_ys.append(np.broadcast_to(t_y, self.y_shape))
+        return np.concatenate([np.ravel(t_carry)] + [np.ravel(t_y) for t_y in t_ys])
+
+register_op('scan',
+    lambda v, a: a[0].primitive.value(v),
+    lambda v, a, out: a[0].primitive.partials(v, out),
+    lambda v, a, out, t: a[0].primitive.tangent(v, out, t))
+
+def scan(body, init, xs, params = ()):
+    """
+    Runs carry, y = body(carry, xs[t], *params) over the steps t of xs, recording a single node
+    Args:
+        body: function (carry, x, *params) -> (new carry, y) of Expressions, traced once with RMExpressions
+        init: the initial carry, an FMExpression, RMExpression, int, float or numpy array
+        xs: the step inputs stacked along the first axis, an Expression or numpy array
+        params: Expressions or constants passed to every step, e.g. the parameters of an ODE right-hand side
+    Returns:
+        a tuple (carry, ys) with the last carry and the y of every step stacked along a new first axis,
+        of the kind of the Expression operands
+    """
+    operands = [init, xs] + list(params)
+    kinds = set(type(x) for x in operands if isinstance(x, (FMExpression, RMExpression)))
+    if (len(kinds) > 1):
+        raise TypeError("A scan cannot mix FMExpression and RMExpression operands.")
+    kind = kinds.pop() if kinds else RMExpression
+
+    values = [x.value if isinstance(x, (FMExpression, RMExpression)) else kind(x).value for x in operands]
+    if (len(values[1]) == 0):
+        raise ValueError("A scan needs at least one step.")
+    scan_body = ScanBody(body, values[0], values[1][0], values[2:])
+    steps = len(values[1])
+
+    if (kind is RMExpression):
+        parents = [x if isinstance(x, RMExpression) else RMExpression(x) for x in operands]
+        values = [x.value for x in parents]
+        node = RMExpression(scan_body.value(values))
+        node.op = 'scan'
+        node.op_args = (scan_body,)
+        node.node_edges = list(zip(parents, scan_body.primitive.partials(values, node.value)))
+    else:
+        grads = [x.grad if isinstance(x, FMExpression) else {} for x in operands]
+        node = FMExpression(scan_body.value(values))
+        node.grad = {}
+        for key in set(k for grad in grads for k in grad):
+            node.grad[key] = scan_body.jvp(values, node.value, [grad.get(key) for grad in grads])
+
+    # The two outputs are selections of the flat value of the node
+    size = int(np.prod(scan_body.carry_shape))
+    carry = node[np.arange(size).reshape(scan_body.carry_shape)]
+    ys = node[size + np.arange(node.value.size - size).reshape((steps,) + scan_body.y_shape)]
+    return carry, ys
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+
+"""
+This module contains a flat, non-recursive serialization format for RMExpression graphs.
+
+A graph is stored as a dictionary of NumPy arrays, with nodes numbered in topological
+order (inputs before the nodes that use them). Ragged per-node data such as values and
+edge weights is stored as one flat array plus offsets, so saving and loading are both
+linear in the size of the graph and never recurse. Edge weights that are functions (for
+example those of matmul) are not stored; they are rebuilt from the op rules in ops.py.
+Constant operands that are not numeric (the traced body of a scan) are pickled together
+into a single byte array.
+"""
+import pickle
+
+import numpy as np
+
+from .ops import get_op
+from .reverse_mode import RMExpression
+from .utils import topological_sort
+
+FORMAT_VERSION = 3
+
+def _stored_op(node):
+    """
+    The op code and constant operands written for node. An index of a getitem node can hold
+    slices, so it is stored as the flat positions it selects, a 'take' node.
+    """
+    if (node.op == 'getitem'):
+        parent = node.node_edges[0][0].value
+        positions = np.arange(parent.size).reshape(parent.shape)[node.op_args[0]]
+        return 'take', (positions,)
+    return node.op, node.op_args
+
+def _pack(arrays):
+    """
+    Packs a list of arrays of any shape into flat storage
+    Args:
+        arrays: list of array-likes
+    Returns:
+        a tuple (flat, ptr, ndim, dims) where array i is flat[ptr[i]:ptr[i + 1]] reshaped to dims[sum(ndim[:i]):sum(ndim[:i + 1])]
+    """
+    arrays = [np.asarray(a) for a in arrays]
+    sizes = [a.size for a in arrays]
+    ptr = np.zeros(len(arrays) + 1, dtype=np.int64)
+    np.cumsum(sizes, out=ptr[1:])
+    ndim = np.array([a.ndim for a in arrays], dtype=np.int64)
+    dims = np.array([d for a in arrays for d in a.shape], dtype=np.int64)
+
+    if (len(arrays) == 0):
+        flat = np.array([])
+    else:
+        flat = np.concatenate([a.ravel() for a in arrays])
+
+    return flat, ptr, ndim, dims
+
+def _unpack(flat, ptr, ndim, dims):
+    """
+    Inverse of _pack
+    Args:
+        the four arrays returned by _pack
+    Returns:
+        a list of arrays
+    """
+    arrays = []
+    dim_ptr = 0
+    for i in range(len(ndim)):
+        shape = tuple(dims[dim_ptr:dim_ptr + ndim[i]])
+        dim_ptr += ndim[i]
+        arrays.append(flat[ptr[i]:ptr[i + 1]].reshape(shape))
+    return arrays
+
+def graph_to_arrays(root):
+    """
+    Flattens the graph below root into NumPy arrays
+    Args:
+        root: the RMExpression at the end of the graph
+    Returns:
+        a dictionary of NumPy arrays describing the graph, the root is the last node
+    """
+    nodes = list(topological_sort(root))[::-1]
+    index = {node: i for i, node in enumerate(nodes)}
+    stored = [_stored_op(node) for node in nodes]
+
+    op_names = sorted(set(op for (op, _) in stored if op is not None))
+    op_index = {op: i for i, op in enumerate(op_names)}
+
+    edge_ptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+    edge_parents = []
+    weights = []
+    weight_rules = []
+    for i, node in enumerate(nodes):
+        for (child, edge_weight) in node.node_edges:
+            edge_parents.append(index[child])
+            weight_rules.append(callable(edge_weight))
+            weights.append(np.array([]) if callable(edge_weight) else edge_weight)
+        edge_ptr[i + 1] = len(edge_parents)
+
+    # Numeric operands are packed as arrays, the others are pickled
+    op_args = [np.array(args) for (_, args) in stored]
+    object_args = np.array([args.dtype == object for args in op_args], dtype=bool)
+    objects = [args for (_, args), is_object in zip(stored, object_args) if is_object]
+    op_args = [np.array([]) if is_object else args for args, is_object in zip(op_args, object_args)]
+
+    arrays = {
+        'version': np.array(FORMAT_VERSION),
+        'op_names': np.array(op_names, dtype=str),
+        'op_codes': np.array([op_index[op] if op is not None else -1 for (op, _) in stored], dtype=np.int32),
+        'names': np.array(['' if node.name is None else str(node.name) for node in nodes], dtype=str),
+        'named': np.array([node.name is not None for node in nodes], dtype=bool),
+        'edge_ptr': edge_ptr,
+        'edge_parents': np.array(edge_parents, dtype=np.int64),
+        'weight_rules': np.array(weight_rules, dtype=bool),
+        'object_args': object_args,
+        'objects': np.frombuffer(pickle.dumps(objects), dtype=np.uint8),
+    }
+
+    for key, data in [('values', [node.value for node in nodes]), ('weights', weights), ('op_args', op_args)]:
+        flat, ptr, ndim, dims = _pack(data)
+        arrays[key] = flat
+        arrays[key + '_ptr'] = ptr
+        arrays[key + '_ndim'] = ndim
+        arrays[key + '_dims'] = dims
+
+    return arrays
+
+def graph_from_arrays(arrays):
+    """
+    Rebuilds an RMExpression graph from the arrays produced by graph_to_arrays
+    Args:
+        arrays: a dictionary (or NpzFile) of NumPy arrays
+    Returns:
+        the root RMExpression of the rebuilt graph
+    """
+    if (int(arrays['version']) not in (1, 2, FORMAT_VERSION)):
+        raise ValueError(f"Unsupported graph format version {int(arrays['version'])}.")
+
+    unpacked = {}
+    for key in ['values', 'weights', 'op_args']:
+        unpacked[key] = _unpack(arrays[key], arrays[key + '_ptr'], arrays[key + '_ndim'], arrays[key + '_dims'])
+
+    op_names = [str(op) for op in arrays['op_names']]
+    op_codes = arrays['op_codes']
+    names = arrays['names']
+    named = arrays['named']
+    edge_ptr = arrays['edge_ptr']
+    edge_parents = arrays['edge_parents']
+    # Version 1 files have no function edge weights
+    weight_rules = arrays['weight_rules'] if 'weight_rules' in arrays else np.zeros(len(edge_parents), dtype=bool)
+    # Version 1 and 2 files have only numeric operands
+    object_args = arrays['object_args'] if 'object_args' in arrays else np.zeros(len(op_codes), dtype=bool)
+    objects = iter(pickle.loads(arrays['objects'].tobytes()) if 'objects' in arrays else [])
+
+    nodes = []
+    for i in range(len(op_codes)):
+        node = RMExpression(unpacked['values'][i], str(names[i]) if named[i] else None)
+        if (op_codes[i] >= 0):
+            node.op = op_names[op_codes[i]]
+            if (object_args[i]):
+                node.op_args = tuple(next(objects))
+            else:
+                node.op_args = tuple(arg.item() if arg.ndim == 0 else arg for arg in unpacked['op_args'][i])
+
+        rules = None
+        for e in range(edge_ptr[i], edge_ptr[i + 1]):
+            edge_weight = unpacked['weights'][e]
+            if (weight_rules[e]):
+                if (rules is None):
+                    parent_values = [nodes[p].value for p in edge_parents[edge_ptr[i]:edge_ptr[i + 1]]]
+                    rules = get_op(node.op).partials(parent_values, node.op_args, node.value)
+                edge_weight = rules[e - edge_ptr[i]]
+            elif (edge_weight.ndim == 0):
+                edge_weight = edge_weight.item()
+            node.node_edges.append((nodes[edge_parents[e]], edge_weight))
+
+        nodes.append(node)
+
+    return nodes[-1]
+
+def save_graph(root, file):
+    """
+    Saves the graph below root to an uncompressed .npz file
+    Args:
+        root: the RMExpression at the end of the graph
+        file: file name or file-like object, as accepted by np.savez
+    Returns:
+        None
+    """
+    np.savez(file, **graph_to_arrays(root))
+
+def load_graph(file):
+    """
+    Loads a graph saved with save_graph
+    Args:
+        file: file name or file-like object, as accepted by np.load
+    Returns:
+        the root RMExpression of the loaded graph
+    """
+    with np.load(file) as arrays:
+        return graph_from_arrays(arrays)
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+"""
+This module contains an asyncio gradient service that micro-batches concurrent requests.
+
+Requests for the same function that arrive within a short window are coalesced into one batched
+evaluation of the function's recorded Tape (see optimize.BatchObjective), which runs in an
+executor so the event loop stays responsive. Each request's future is resolved with its own row
+of the result. max_batch_size and max_wait bound the latency a request can be held back.
+"""
+import asyncio
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from .optimize import BatchObjective
+
+class GradientScheduler:
+    """Coalesces concurrent gradient requests per function into batched evaluations."""
+
+    def __init__(self, max_batch_size = 64, max_wait = 0.002, executor = None, maxsize = 128):
+        """
+        Args:
+            max_batch_size: a batch is dispatched as soon as it holds this many requests
+            max_wait: seconds the first request of a batch waits for others to join
+            executor: the concurrent.futures executor batches run in, None for the event loop's default
+            maxsize: maximum number of recorded objectives kept, least recently used first out, None for no limit
+        """
+        if (max_batch_size < 1):
+            raise ValueError("max_batch_size must be at least 1.")
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.executor = executor
+        self.maxsize = maxsize
+        self._objectives = OrderedDict()
+        self._lock = threading.Lock() # batches are evaluated in executor threads
+        self._pending = {}
+        self._timers = {}
+        self.batches = 0
+        self.requests = 0
+
+    def _objective(self, function, points):
+        """
+        The recorded objective for function and this number of coordinates, recorded on first use at the first point
+        alone, so that the recording does not depend on the other requests of the batch
+        """
+        key = (function, points.shape[1])
+        with self._lock:
+            objective = self._objectives.get(key)
+            if (objective is not None):
+                self._objectives.move_to_end(key)
+                return objective
+
+            objective = BatchObjective(function, points[:1])
+            self._objectives[key] = objective
+            while (self.maxsize is not None and len(self._objectives) > self.maxsize):
+                self._objectives.popitem(last = False)
+        return objective
+
+    def _evaluate(self, function, points):
+        return self._objective(function, points).value_and_grad(points)
+
+    async def grad(self, function, x):
+        """
+        Evaluates function and its gradient at x, batched with concurrent requests for the same function
+        Args:
+            function: a function of n Expressions returning a scalar Expression, using elementwise operations only
+            x: the point, n numbers
+        Returns:
+            a tuple (value, grad) with the value as a float and the gradient as an array of shape (n,)
+        """
+        point = np.array(x, dtype=float).ravel()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        key = (function, point.size)
+
+        self.requests += 1
+        pending = self._pending.setdefault(key, [])
+        pending.append((point, future))
+        if (len(pending) >= self.max_batch_size):
+            self._dispatch(key)
+        elif (len(pending) == 1):
+            self._timers[key] = loop.call_later(self.max_wait, self._dispatch, key)
+
+        return await future
+
+    def _dispatch(self, key):
+        """Starts the evaluation of the requests pending for key."""
+        timer = self._timers.pop(key, None)
+        if (timer is not None):
+            timer.cancel()
+        batch = self._pending.pop(key, [])
+        if (len(batch) == 0):
+            return
+
+        self.batches += 1
+        asyncio.ensure_future(self._run(key[0], batch))
+
+    async def _run(self, function, batch):
+        points = np.stack([point for (point, _) in batch])
+        loop = asyncio.get_running_loop()
+        try:
+            f, g = await loop.run_in_executor(self.executor, self._evaluate, function, points)
+        except Exception as e:
+            if (len(batch) == 1):
+                if (not batch[0][1].done()):
+                    batch[0][1].set_exception(e)
+                return
+            # The requests are evaluated one by one, so that the error only reaches the requests that raise it
+            await asyncio.gather(*[self._run(function, [request]) for request in batch])
+            return
+
+        for i, (_, future) in enumerate(batch):
+            if (not future.done()):
+                future.set_result((float(f[i]), g[i]))
+
+    def info(self):
+        """
+        Returns:
+            a dictionary with the number of requests served, batches run and functions recorded
+        """
+        return {'requests': self.requests, 'batches': self.batches, 'functions': len(self._objectives)}
+
+_default = None
+
+def default_scheduler():
+    """The GradientScheduler used by agrad, one per event loop."""
+    global _default
+    loop = asyncio.get_running_loop()
+    if (_default is None or _default[0] is not loop):
+        _default = (loop, GradientScheduler())
+    return _default[1]
+
+async def agrad(function, x, scheduler = None):
+    """
+    Awaitable value and gradient of function at x, e.g. `value, grad = await agrad(f, [1.0, 2.0])`
+    Args:
+        function: a function of n Expressions returning a scalar Expression, using elementwise operations only
+        x: the point, n numbers
+        scheduler: the GradientScheduler to batch with, defaults to the one of the running event loop
+    Returns:
+        a tuple (value, grad) with the value as a float and the gradient as an array of shape (n,)
+    """
+    if (scheduler is None):
+        scheduler = default_scheduler()
+    return await scheduler.grad(function, x)
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+
+"""
+This module contains our Tape class, a flat, replayable recording of an RMExpression graph.
+
+A Tape is built once from a recorded graph and can then be re-evaluated and differentiated
+for new input values without creating any Expression objects, using the rules in ops.py.
+"""
+import numpy as np
+
+from .ops import get_op
+from .reverse_mode import RMExpression
+from .utils import topological_order, push_adjoint
+
+class Tape:
+    def __init__(self, outputs, inputs):
+        """
+        Records the graph below outputs, treating inputs as the replaceable leaves
+        Args:
+            outputs: list of RMExpression nodes to replay
+            inputs: list of leaf RMExpression nodes whose values are supplied on every replay
+        """
+        nodes = topological_order(outputs)
+        index = {node: i for i, node in enumerate(nodes)}
+
+        self.size = len(nodes)
+        self.ops = [node.op for node in nodes]
+        self.args = [node.op_args for node in nodes]
+        self.parents = [tuple(index[child] for (child, _) in node.node_edges) for node in nodes]
+        self.input_index = [index.get(node, -1) for node in inputs]
+        self.output_index = [index[node] for node in outputs]
+
+        # Leaves that are not inputs keep the value they had when recorded
+        input_ids = set(id(node) for node in inputs)
+        self.constants = {}
+        for i, node in enumerate(nodes):
+            if (node.op is None and id(node) not in input_ids):
+                if (len(node.node_edges) > 0):
+                    raise ValueError("Only graphs recorded with RMExpression operations can be replayed.")
+                self.constants[i] = node.value
+
+    @property
+    def nbytes(self):
+        """Approximate number of bytes held by the tape."""
+        ret = sum(value.nbytes for value in self.constants.values())
+        ret += 8 * (3 * self.size + sum(len(p) for p in self.parents) + sum(len(a) for a in self.args))
+        return ret
+
+    def forward(self, input_values):
+        """
+        Recomputes the value of every node on the tape
+        Args:
+            input_values: list with one value per input
+        Returns:
+            list with the value of every node, in tape order
+        """
+        values = [None] * self.size
+        for i, value in self.constants.items():
+            values[i] = value
+        for i, value in zip(self.input_index, input_values):
+            if (i >= 0):
+                values[i] = np.asarray(value)
+
+        for i in range(self.size):
+            if (values[i] is None):
+                values[i] = get_op(self.ops[i]).forward([values[p] for p in self.parents[i]], self.args[i])
+
+        return values
+
+    def evaluate(self, *input_values):
+        """
+        Evaluates the recorded outputs at new input values
+        Args:
+            one value per input
+        Returns:
+            list with the value of every output
+        """
+        values = self.forward(input_values)
+        return [values[i] for i in self.output_index]
+
+    def vjp(self, values, seeds):
+        """
+        Reverse sweep over the tape
+        Args:
+            values: node values returned by forward
+            seeds: list with one adjoint per output, None for outputs that are not seeded
+        Returns:
+            list with the adjoint of every input (0 for inputs the outputs do not depend on)
+        """
+        adjoints = [None] * self.size
+        for i, seed in zip(self.output_index, seeds):
+            if (seed is not None):
+                adjoints[i] = seed if adjoints[i] is None else adjoints[i] + seed
+
+        for i in reversed(range(self.size)):
+            if (len(self.parents[i]) == 0 or adjoints[i] is None):
+                continue
+
+            parent_values = [values[p] for p in self.parents[i]]
+            edge_weights = get_op(self.ops[i]).partials(parent_values, self.args[i], values[i])
+            for p, edge_weight in zip(self.parents[i], edge_weights):
+                contribution = push_adjoint(edge_weight, adjoints[i], np.shape(values[p]))
+                adjoints[p] = contribution if adjoints[p] is None else adjoints[p] + contribution
+
+        return [adjoints[i] if i >= 0 and adjoints[i] is not None else 0 for i in self.input_index]
+
+    def jvp(self, values, tangents):
+        """
+        Forward tangent sweep over the tape
+        Args:
+            values: node values returned by forward
+            tangents: list with one tangent per input, None for inputs that are not seeded
+        Returns:
+            list with the tangent of every output (0 for outputs that do not depend on the seeds)
+        """
+        node_tangents = [None] * self.size
+        for i, tangent in zip(self.input_index, tangents):
+            if (i >= 0):
+                node_tangents[i] = tangent
+
+        for i in range(self.size):
+            if (len(self.parents[i]) == 0):
+                continue
+
+            parent_tangents = [node_tangents[p] for p in self.parents[i]]
+            if (all(t is None for t in parent_tangents)):
+                continue
+
+            parent_values = [values[p] for p in self.parents[i]]
+            node_tangents[i] = get_op(self.ops[i]).jvp(parent_values, self.args[i], values[i], parent_tangents)
+
+        return [node_tangents[i] if node_tangents[i] is not None else 0 for i in self.output_index]
+
+    def jacobian(self, input_values, mode = 'forward'):
+        """
+        Evaluates the outputs and their derivatives with respect to every input
+        Args:
+            input_values: list with one value per input
+            mode: 'forward' seeds one tangent sweep per input, 'reverse' runs one reverse sweep per output
+        Returns:
+            a tuple (outputs, jac) where jac[i][j] is the derivative of output i with respect to input j
+        """
+        values = self.forward(input_values)
+        outputs = [values[i] for i in self.output_index]
+
+        if (mode == 'forward'):
+            columns = []
+            for j in range(len(self.input_index)):
+                tangents = [None] * len(self.input_index)
+                tangents[j] = np.ones(np.shape(values[self.input_index[j]]) if self.input_index[j] >= 0 else ())
+                columns.append(self.jvp(values, tangents))
+            jac = [[columns[j][i] for j in range(len(columns))] for i in range(len(outputs))]
+        elif (mode == 'reverse'):
+            jac = []
+            for i in range(len(outputs)):
+                seeds = [None] * len(outputs)
+                seeds[i] = np.ones(np.shape(outputs[i]))
+                jac.append(self.vjp(values, seeds))
+        else:
+            raise NotImplementedError
+
+        return outputs, jac
+
+def trace(function, args, names):
+    """
+    Records function into a Tape by calling it once with RMExpression leaves
+    Args:
+        function: a function of len(args) Expressions returning an RMExpression or a list of them
+        args: the values to record the function at
+        names: one leaf name per argument
+    Returns:
+        the recorded Tape
+    """
+    inputs = [RMExpression(arg, name) for arg, name in zip(args, names)]
+    outputs = function(*inputs)
+    if (not isinstance(outputs, (list, tuple))):
+        outputs = [outputs]
+
+    outputs = [out if isinstance(out, RMExpression) else RMExpression(out) for out in outputs]
+    return Tape(outputs, inputs)
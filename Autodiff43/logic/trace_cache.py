@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+
+"""
+This module contains the differentiable decorator, which records a function into a Tape
+the first time it is called with a given input shape and AD mode, and replays the Tape on
+later calls instead of rebuilding the Expression graph.
+"""
+import functools
+import inspect
+from collections import OrderedDict
+
+import numpy as np
+
+from . import core
+from .tape import trace
+
+class TraceCache:
+    """LRU cache of recorded Tapes, bounded by number of entries and by bytes."""
+
+    def __init__(self, maxsize = 128, max_bytes = None):
+        """
+        Args:
+            maxsize: maximum number of Tapes kept, None for no limit
+            max_bytes: maximum total Tape.nbytes kept, None for no limit
+        """
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self._tapes = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._tapes)
+
+    def get(self, key):
+        """
+        Looks up a Tape and marks it as most recently used
+        Args:
+            key: the cache key
+        Returns:
+            the Tape, or None on a miss
+        """
+        tape = self._tapes.get(key)
+        if (tape is None):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._tapes.move_to_end(key)
+        return tape
+
+    def put(self, key, tape):
+        """
+        Adds a Tape, evicting least recently used Tapes until the limits hold
+        Args:
+            key: the cache key
+            tape: the Tape to store
+        Returns:
+            None
+        """
+        if (key in self._tapes):
+            self.nbytes -= self._tapes.pop(key).nbytes
+
+        self._tapes[key] = tape
+        self.nbytes += tape.nbytes
+
+        while (len(self._tapes) > 0 and self._over_limit()):
+            _, evicted = self._tapes.popitem(last = False)
+            self.nbytes -= evicted.nbytes
+            self.evictions += 1
+
+    def _over_limit(self):
+        if (self.maxsize is not None and len(self._tapes) > self.maxsize):
+            return True
+        return self.max_bytes is not None and self.nbytes > self.max_bytes
+
+    def clear(self):
+        """Removes every Tape, the counters are kept."""
+        self._tapes.clear()
+        self.nbytes = 0
+
+    def info(self):
+        """
+        Returns:
+            a dictionary with the hit, miss and eviction counters and the current size of the cache
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self._tapes),
+            'nbytes': self.nbytes,
+            'maxsize': self.maxsize,
+            'max_bytes': self.max_bytes,
+        }
+
+def _arg_names(function, nargs):
+    """Leaf names for the arguments of function, its parameter names where possible."""
+    try:
+        params = [p for p in inspect.signature(function).parameters.values() if p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD)]
+    except (TypeError, ValueError):
+        params = []
+
+    return [params[i].name if i < len(params) else f'x{i}' for i in range(nargs)]
+
+def differentiable(function = None, *, mode = None, maxsize = 128, max_bytes = None):
+    """
+    Decorator that records function into a replayable Tape per input shape and AD mode.
+
+    The decorated function is called with plain numbers or NumPy arrays and returns a tuple
+    (value, grad), where value holds the outputs concatenated together and grad maps each
+    argument name to the derivatives of those outputs. In forward mode grad is laid out like an
+    FMExpression: for every output, the derivative of each of its elements along all the
+    elements of the argument (J @ 1), in the shape of the output. In reverse mode it holds, for
+    every output, the gradient of the sum of its elements (J^T @ 1), in the shape of the
+    argument, as RMExpression.backward does. The outputs are concatenated in both modes, and
+    the two agree for elementwise functions. Because a
+    Tape replays the operations recorded on the first call, functions whose control flow
+    depends on input values should not be decorated.
+
+    Args:
+        function: the function to decorate, written with Expression operations
+        mode: 'forward' or 'reverse', defaults to core.AD_MODE at call time
+        maxsize: maximum number of Tapes kept in the cache
+        max_bytes: maximum total size of the Tapes kept in the cache
+    Returns:
+        the decorated function, with a .cache TraceCache and a .cache_info() method
+    """
+    if (function is None):
+        return functools.partial(differentiable, mode = mode, maxsize = maxsize, max_bytes = max_bytes)
+
+    cache = TraceCache(maxsize, max_bytes)
+
+    @functools.wraps(function)
+    def wrapper(*args):
+        ad_mode = core.ADMode.from_str(mode) if mode is not None else core.AD_MODE
+        key = (ad_mode, tuple(np.shape(arg) for arg in args))
+        names = _arg_names(function, len(args))
+
+        tape = cache.get(key)
+        if (tape is None):
+            tape = trace(function, args, names)
+            cache.put(key, tape)
+
+        forward = ad_mode == core.ADMode.FORWARD
+        outputs, jac = tape.jacobian(args, 'forward' if forward else 'reverse')
+
+        value = np.concatenate([np.atleast_1d(out) for out in outputs])
+        grad = {}
+        for j, name in enumerate(names):
+            # Tangents have the shape of the output, gradients the shape of the argument
+            shapes = [np.shape(np.atleast_1d(out if forward else args[j])) for out in outputs]
+            grad[name] = np.concatenate([np.broadcast_to(jac[i][j], shapes[i]) for i in range(len(outputs))])
+
+        return value, grad
+
+    wrapper.cache = cache
+    wrapper.cache_info = cache.info
+    return wrapper
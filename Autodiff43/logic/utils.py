@@ -1,30 +1,50 @@
 """
 Utility functions
 """
+import numpy as np
 
-def topological_sort(root_node):
+
+def topological_order(root_nodes, stop = None):
     """
-    Finds the topological sort of a graph given the root node
+    Finds a topological order of the graph below several root nodes
     Args:
-        The root node that should be the end of the topological sort
+        A list of root nodes, and optionally a function of a node, the children of nodes for which it is true are not visited
     Returns:
-        Because we are reversing, it returns a list with the reverse topological sort (the root note is first)
+        A list of every node reachable from the roots, where each node comes after all of its node_edges children (leaves first)
     """
     visited = set()
+    topo_sort = []
 
-    def dfs(node, topo_sort):
-        nonlocal visited
+    # Iterative post-order DFS, so deep graphs do not hit the recursion limit
+    stack = [(root_node, False) for root_node in reversed(root_nodes)]
+    while stack:
+        node, expanded = stack.pop()
+        if (expanded):
+            topo_sort.append(node)
+            continue
 
         if (node in visited):
-            return topo_sort
+            continue
         visited.add(node)
 
-        for (nei, _) in node.node_edges:
-            topo_sort = dfs(nei, topo_sort)
-        
-        return topo_sort + [node]
+        stack.append((node, True))
+        if (stop is not None and stop(node)):
+            continue
+        for (nei, _) in reversed(node.node_edges):
+            if (nei not in visited):
+                stack.append((nei, False))
 
-    return reversed(dfs(root_node, []))
+    return topo_sort
+
+def topological_sort(root_node):
+    """
+    Finds the topological sort of a graph given the root node
+    Args:
+        The root node that should be the end of the topological sort
+    Returns:
+        Because we are reversing, it returns a list with the reverse topological sort (the root note is first)
+    """
+    return reversed(topological_order([root_node]))
 
 def clear_grad(root_node):
     """
@@ -34,18 +54,137 @@ def clear_grad(root_node):
     Returns:
         None
     """
-    visited = set()
-
-    def dfs(node):
-        nonlocal visited
-
-        if (node in visited):
-            return
-        visited.add(node)
+    visited = set([root_node])
 
+    stack = [root_node]
+    while stack:
+        node = stack.pop()
         node.grad = 0
 
         for (child, _) in node.node_edges:
-            dfs(child)
+            if (child not in visited):
+                visited.add(child)
+                stack.append(child)
+
+def unbroadcast(grad, shape, nbatch = 0):
+    """
+    Sums a gradient over the axes that NumPy broadcasting added, so it matches the shape of the operand.
+    A gradient smaller than the operand (e.g. that of a reduction) is broadcast up to its shape.
+    Args:
+        grad: the gradient with respect to a broadcast result
+        shape: the shape of the operand
+        nbatch: number of leading axes of grad that index independent seeds and are kept as they are
+    Returns:
+        the gradient with respect to the operand, of shape grad.shape[:nbatch] + shape
+    """
+    grad = np.asarray(grad)
+    shape = tuple(shape)
+    batch = grad.shape[:nbatch]
+    if (grad.shape[nbatch:] == shape):
+        return grad
+
+    extra = grad.ndim - nbatch - len(shape)
+    if (extra > 0):
+        grad = grad.sum(axis = tuple(range(nbatch, nbatch + extra)))
+
+    # Align the remaining axes with shape from the right, as broadcasting does
+    core = grad.shape[nbatch:]
+    offset = len(shape) - len(core)
+    axes = tuple(nbatch + i - offset for i, d in enumerate(shape) if d == 1 and i >= offset and core[i - offset] != 1)
+    if (axes):
+        grad = grad.sum(axis = axes, keepdims = True)
+
+    if (grad.shape[nbatch:] != shape):
+        grad = np.broadcast_to(grad.reshape(batch + (1,) * offset + grad.shape[nbatch:]), batch + shape)
+    return grad
+
+def push_adjoint(edge_weight, grad, shape, nbatch = 0):
+    """
+    Computes the contribution of a node's gradient to one of its children
+    Args:
+        edge_weight: the elementwise partial derivative stored in node_edges, or a function mapping the node's gradient to the child's
+        grad: the gradient of the node
+        shape: the shape of the child's value
+        nbatch: number of leading axes of grad that index independent seeds
+    Returns:
+        the contribution to the child's gradient
+    """
+    if (callable(edge_weight)):
+        return unbroadcast(edge_weight(grad), shape, nbatch)
+
+    # Line the seed axes up in front of the weight, e.g. for the weights of a reduction
+    missing = np.ndim(edge_weight) - (grad.ndim - nbatch)
+    if (nbatch and missing > 0):
+        grad = grad.reshape(grad.shape[:nbatch] + (1,) * missing + grad.shape[nbatch:])
+    return unbroadcast(edge_weight * grad, shape, nbatch)
+
+class AdjointPool:
+    """
+    The adjoint buffers of the reverse sweeps from one root, allocated once from the graph and reused by every later sweep.
+    The first contribution to a buffer overwrites it and later ones are accumulated in place, through one scratch buffer
+    per shape for weighted edges, so a sweep over edges with elementwise weights allocates nothing.
+    """
+
+    def __init__(self, root, batch, dtype):
+        """
+        Args:
+            root: the node the sweeps start from
+            batch: the leading batch axes of the seeds
+            dtype: the dtype of the adjoints
+        """
+        self.key = (batch, dtype)
+        self.order = list(topological_sort(root)) # the root comes first
+        self.buffers = [self._buffer(node, batch + node.value.shape, dtype) for node in self.order[1:]]
+        self.scratch = {}
+        self.written = set()
+        self.sweeps = 0
+
+    @staticmethod
+    def _buffer(node, shape, dtype):
+        # The array a node already holds (its initial zeros, or a buffer of another sweep) is taken over when it fits,
+        # which saves allocating and first touching fresh memory
+        grad = node.grad
+        if (isinstance(grad, np.ndarray) and grad.shape == shape and grad.dtype == dtype and grad.flags.writeable and grad.base is None):
+            return grad
+        return np.empty(shape, dtype = dtype)
+
+    def reset(self):
+        """Attaches the buffers to the nodes as their .grad, ready for a sweep."""
+        for node, buffer in zip(self.order[1:], self.buffers):
+            node.grad = buffer
+        # Every node below the root is some node's child, so each buffer is written before it is read
+        self.written = set()
+        self.sweeps += 1
+
+    def accumulate(self, child, edge_weight, grad, nbatch = 0):
+        """
+        Adds the contribution of a node's gradient to the adjoint of one of its children, in place
+        Args:
+            child: the child node, whose .grad is a buffer of this pool
+            edge_weight, grad, nbatch: as for push_adjoint
+        """
+        target = child.grad
+        first = child not in self.written
+        if (first):
+            self.written.add(child)
 
-    dfs(root_node)
\ No newline at end of file
+        if (callable(edge_weight) or grad.shape != target.shape or np.ndim(edge_weight) > grad.ndim - nbatch
+                or np.broadcast_shapes(np.shape(edge_weight), grad.shape) != target.shape):
+            contribution = push_adjoint(edge_weight, grad, child.value.shape, nbatch)
+            if (first):
+                np.copyto(target, contribution, casting = 'same_kind')
+            else:
+                np.add(target, contribution, out = target, casting = 'same_kind')
+        elif (np.ndim(edge_weight) == 0 and edge_weight == 1):
+            if (first):
+                np.copyto(target, grad, casting = 'same_kind')
+            else:
+                np.add(target, grad, out = target, casting = 'same_kind')
+        elif (first):
+            np.multiply(edge_weight, grad, out = target, casting = 'same_kind')
+        else:
+            scratch = self.scratch.get(target.shape)
+            if (scratch is None):
+                scratch = self.scratch[target.shape] = np.empty(target.shape, dtype = target.dtype)
+            np.multiply(edge_weight, grad, out = scratch, casting = 'same_kind')
+            np.add(target, scratch, out = target)
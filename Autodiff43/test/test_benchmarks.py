@@ -0,0 +1,44 @@
+import importlib.util
+import os
+
+import pytest
+import numpy as np
+
+PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'benchmarks', 'run_benchmarks.py')
+spec = importlib.util.spec_from_file_location('run_benchmarks', PATH)
+run_benchmarks = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(run_benchmarks)
+
+def result(**metrics):
+    return dict({'scenario': 'deep_chain', 'engine': 'reverse', 'size': 100}, **metrics)
+
+class TestBenchmarks:
+
+    def test_compare(self):
+        baseline = {'results': [result(build_time=0.1, grad_time=0.2, regrad_time=0.1, peak_bytes=1000)]}
+        current = {'results': [result(build_time=0.1, grad_time=0.5, regrad_time=0.1, peak_bytes=1000)]}
+        regressions = run_benchmarks.compare(current, baseline)
+        assert [r['metric'] for r in regressions] == ['grad_time']
+        assert regressions[0]['ratio'] == pytest.approx(2.5)
+
+        # Timings below min_time in both runs are ignored
+        fast = {'results': [result(build_time=1e-5, grad_time=5e-4, regrad_time=1e-5, peak_bytes=1000)]}
+        assert run_benchmarks.compare(fast, {'results': [result(build_time=1e-5, grad_time=1e-4, regrad_time=1e-5, peak_bytes=1000)]}) == []
+
+    def test_compare_older_baseline(self):
+        # A baseline written before regrad_time was measured
+        baseline = {'results': [result(build_time=0.1, grad_time=0.2, peak_bytes=1000)]}
+        current = {'results': [result(build_time=0.1, grad_time=0.2, regrad_time=0.3, peak_bytes=4000)]}
+        regressions = run_benchmarks.compare(current, baseline)
+        assert [r['metric'] for r in regressions] == ['peak_bytes']
+        assert np.isclose(regressions[0]['ratio'], 4.0)
+
+    def test_allocations(self):
+        result = run_benchmarks.run_case('wide_vector', 'reverse', 20, 1)
+        # The repeated sweep reuses the adjoint buffers of the first one
+        assert result['regrad_blocks'] < result['grad_blocks']
+
+        baseline = {'results': [dict(result, grad_blocks=100)]}
+        current = {'results': [dict(result, grad_blocks=200)]}
+        assert [r['metric'] for r in run_benchmarks.compare(current, baseline, min_time=10)] == ['grad_blocks']
+        assert run_benchmarks.compare(current, baseline, min_time=10, min_blocks=1000) == []
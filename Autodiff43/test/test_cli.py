@@ -0,0 +1,68 @@
+import gc
+import io
+import warnings
+
+import pytest
+import numpy as np
+from Autodiff43.logic.cli import main, run, load_function, count_points, read_points
+
+def model(x, y):
+    return [x * y.sin(), (x + y).exp() / (y * y + 1)]
+
+def reference(x, y):
+    values = [x * np.sin(y), np.exp(x + y) / (y * y + 1)]
+    d = np.exp(x + y) / (y * y + 1)
+    jac = [np.sin(y), x * np.cos(y), d, d - 2 * y * np.exp(x + y) / (y * y + 1) ** 2]
+    return np.array(values + jac)
+
+class TestCLI:
+
+    def test_csv(self, tmp_path):
+        points = np.random.default_rng(0).normal(size=(10, 2))
+        source = tmp_path / "points.csv"
+        source.write_text("x,y\n" + "\n".join(f"{a},{b}" for a, b in points) + "\n")
+        out = tmp_path / "out.csv"
+
+        for mode in ["forward", "reverse"]:
+            assert main(["Autodiff43.test.test_cli:model", str(source), "-o", str(out), "--mode", mode, "--chunk-size", "3", "--quiet"]) == 0
+            lines = out.read_text().splitlines()
+            assert lines[0] == "f0,f1,df0/dx,df0/dy,df1/dx,df1/dy"
+            results = np.loadtxt(lines[1:], delimiter=",")
+            assert np.allclose(results, [reference(a, b) for a, b in points])
+
+    def test_read_points(self, tmp_path):
+        source = tmp_path / "points.csv"
+        source.write_text("x,y\n1,2\n\n3,4\n5,6\n")
+        names, rows, chunks = read_points(str(source), 2)
+        assert names == ["x", "y"] and rows is None
+        assert [chunk.tolist() for chunk in chunks] == [[[1, 2], [3, 4]], [[5, 6]]]
+
+        # A reader that is dropped without being consumed leaves no file open
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always", ResourceWarning)
+            names, rows, chunks = read_points(str(source), 2)
+            del chunks
+            gc.collect()
+        assert not any(issubclass(w.category, ResourceWarning) for w in caught)
+
+    def test_npy(self, tmp_path):
+        points = np.random.default_rng(1).normal(size=(7, 2))
+        np.save(tmp_path / "points.npy", points)
+        log = io.StringIO()
+        stats = run(model, str(tmp_path / "points.npy"), str(tmp_path / "out.npy"), chunk_size=2, report_every=0, log=log)
+        assert stats["points"] == 7 and stats["chunks"] == 4
+        assert "points/s" in log.getvalue()
+        assert np.allclose(np.load(tmp_path / "out.npy"), [reference(a, b) for a, b in points])
+
+        # CSV input without header to a .npy output, sized by counting the rows first
+        (tmp_path / "points.csv").write_text("\n".join(f"{a},{b}" for a, b in points) + "\n\n")
+        assert count_points(str(tmp_path / "points.csv")) == 7
+        run(model, str(tmp_path / "points.csv"), str(tmp_path / "out2.npy"), mode="reverse")
+        assert np.allclose(np.load(tmp_path / "out2.npy"), np.load(tmp_path / "out.npy"))
+
+    def test_errors(self):
+        assert load_function("Autodiff43.test.test_cli:model") is model
+        with pytest.raises(ValueError):
+            load_function("model")
+        with pytest.raises(SystemExit):
+            main(["Autodiff43.test.test_cli:missing", "points.csv"])
@@ -273,6 +273,11 @@ class TestExpression:
         assert e1.value == np.log(2) / np.log(10)
         assert FMExpression.grad(e1,"x") == 1 / (2 * np.log(10))
 
+        # natural logarithm
+        e1 = FMExpression.log(e0)
+        assert e1.value == np.log(2)
+        assert FMExpression.grad(e1,"x") == 1 / 2
+
     def test_sigmoid_FM(self):
         e0 = FMExpression(2,"x")
         e1 = FMExpression.sigmoid(e0)
@@ -596,3 +601,384 @@ class TestExpression:
         assert e3[1].value == 1
         assert RMExpression.grad(e3, 0, "x") == 2
         assert RMExpression.grad(e3, 1, "x") == 1
+
+    def test_graph_stats(self):
+        x = RMExpression(np.array([1.0, 2.0]), "x")
+        y = RMExpression(np.array([3.0, 4.0]), "y")
+        s = x * y
+        f = s.sin() + s
+
+        stats = RMExpression.graph_stats(f)
+        assert stats['node_count'] == 5
+        assert stats['edge_count'] == 5
+        assert stats['leaf_count'] == 2
+        assert stats['depth'] == 3
+        assert stats['max_fan_in'] == 2
+        assert stats['max_fan_out'] == 2
+        assert stats['value_bytes'] == 5 * 2 * 8
+        assert stats['edge_weight_bytes'] == 3 * 2 * 8 + 2 * np.asarray(1).nbytes
+        assert stats['backward_flops'] == 5 * 2 * 2
+        assert stats['forward_flops'] > 0
+
+        e = FMExpression(2, "x") * FMExpression(3, "y")
+        stats = FMExpression.graph_stats(e)
+        assert stats['tangent_directions'] == 2
+        assert stats['grad_bytes'] == 2 * 8
+
+    def test_matrix_broadcasting(self):
+        # Nodes keep the shape of numpy arrays and follow broadcasting rules
+        a = RMExpression(np.array([[1.0, 2.0], [3.0, 4.0]]), "a")
+        b = RMExpression(np.array([10.0, 20.0]), "b")
+        c = RMExpression(2.0, "c")
+        f = a * b + c
+        assert f.value.shape == (2, 2)
+        assert np.allclose(f.value, [[12, 42], [32, 82]])
+
+        f.backward_scalar()
+        assert np.allclose(f.jacobian["a"], [[10, 20], [10, 20]])
+        assert np.allclose(f.jacobian["b"], [4, 6])
+        assert np.allclose(f.jacobian["c"], [4])
+
+        with pytest.raises(ValueError):
+            a + RMExpression(np.array([1.0, 2.0, 3.0]), "d")
+
+        x = FMExpression(np.array([1.0, 2.0]), "x")
+        e = FMExpression(np.ones((3, 2)), "z") * 0 + x * 3
+        assert e.value.shape == (3, 2)
+        assert np.allclose(FMExpression.grad(e, "x"), 3)
+
+    def test_matmul(self):
+        W0 = np.array([[1.0, 2.0, 3.0], [4.0, 5.0, 6.0]])
+        x0 = np.array([0.5, -1.0, 2.0])
+        b0 = np.array([0.1, 0.2])
+
+        # A dense layer is a single matmul node in reverse mode
+        W = RMExpression(W0, "W")
+        x = RMExpression(x0, "x")
+        b = RMExpression(b0, "b")
+        f = (W @ x + b).tanh()
+        assert f.value == pytest.approx(np.tanh(W0 @ x0 + b0))
+        assert RMExpression.graph_stats(f)['node_count'] == 6
+
+        f.backward_scalar()
+        d = 1 / np.cosh(W0 @ x0 + b0) ** 2
+        assert np.allclose(f.jacobian["W"], np.outer(d, x0))
+        assert np.allclose(f.jacobian["x"], W0.T @ d)
+        assert np.allclose(f.jacobian["b"], d)
+
+        # Constant matrices on either side
+        g = W0 @ x
+        g.backward_scalar()
+        assert np.allclose(g.jacobian["x"], W0.sum(axis=0))
+        g = (x @ W0.T).sin()
+        g.backward_scalar()
+        assert np.allclose(g.jacobian["x"], W0.T @ np.cos(W0 @ x0))
+
+        # Matrix @ matrix, and forward mode along the all-ones direction
+        A = RMExpression(W0, "A")
+        B = RMExpression(W0.T, "B")
+        h = A @ B
+        h.backward_scalar()
+        assert np.allclose(h.jacobian["A"], np.ones((2, 2)) @ W0)
+        assert np.allclose(h.jacobian["B"], W0.T @ np.ones((2, 2)))
+
+        xf = FMExpression(x0, "x")
+        e = W0 @ xf + FMExpression(b0, "b")
+        assert np.allclose(e.value, W0 @ x0 + b0)
+        assert np.allclose(FMExpression.grad(e, "x"), W0 @ np.ones(3))
+        assert np.allclose(FMExpression.grad(e, "b"), 1)
+
+        with pytest.raises(TypeError):
+            W @ 2
+
+    def test_reductions_RM(self):
+        x0 = np.array([1.0, -2.0, 3.0, 0.5])
+        y0 = np.array([0.5, 1.5, -1.0, 2.0])
+
+        x = RMExpression(x0, "x")
+        f = x.sum()
+        f.backward_scalar()
+        assert f.value == pytest.approx(np.sum(x0))
+        assert np.allclose(f.jacobian["x"], 1)
+
+        f = x.mean()
+        f.backward_scalar()
+        assert f.value == pytest.approx(np.mean(x0))
+        assert np.allclose(f.jacobian["x"], 0.25)
+
+        f = x.prod()
+        f.backward_scalar()
+        assert f.value == pytest.approx(np.prod(x0))
+        assert np.allclose(f.jacobian["x"], np.prod(x0) / x0)
+
+        f = x.norm()
+        f.backward_scalar()
+        assert f.value == pytest.approx(np.linalg.norm(x0))
+        assert np.allclose(f.jacobian["x"], x0 / np.linalg.norm(x0))
+
+        y = RMExpression(y0, "y")
+        f = x.dot(y)
+        f.backward_scalar()
+        assert f.value == pytest.approx(x0 @ y0)
+        assert np.allclose(f.jacobian["x"], y0)
+        assert np.allclose(f.jacobian["y"], x0)
+
+        f = x.dot(y0)
+        f.backward_scalar()
+        assert np.allclose(f.jacobian["x"], y0)
+
+        # Zeros are handled exactly, without dividing by the product
+        z = RMExpression(np.array([2.0, 0.0, 4.0]), "z")
+        f = z.prod()
+        f.backward_scalar()
+        assert np.allclose(f.jacobian["z"], [0.0, 8.0, 0.0])
+        f = RMExpression(np.zeros(3), "z").norm()
+        f.backward_scalar()
+        assert np.allclose(f.jacobian["z"], 0)
+
+        # A loss over many elements is a handful of nodes
+        n = 10 ** 6
+        w = RMExpression(np.linspace(-1, 1, n), "w")
+        loss = ((w - 0.5) * (w - 0.5)).mean()
+        assert RMExpression.graph_stats(loss)['node_count'] == 5
+        loss.backward_scalar()
+        assert np.allclose(loss.jacobian["w"], 2 * (np.linspace(-1, 1, n) - 0.5) / n)
+
+        with pytest.raises(TypeError):
+            x.dot(2)
+        with pytest.raises(ValueError):
+            x.dot(RMExpression(np.ones(3), "y"))
+
+    def test_reductions_FM(self):
+        x0 = np.array([1.0, -2.0, 3.0, 0.5])
+        y0 = np.array([0.5, 1.5, -1.0, 2.0])
+        x = FMExpression(x0, "x")
+
+        # Forward mode propagates the all-ones direction
+        assert np.allclose(FMExpression.grad(x.sum(), "x"), 4)
+        assert np.allclose(FMExpression.grad(x.mean(), "x"), 1)
+        assert np.allclose(FMExpression.grad(x.prod(), "x"), np.sum(np.prod(x0) / x0))
+        assert np.allclose(FMExpression.grad(x.norm(), "x"), np.sum(x0) / np.linalg.norm(x0))
+
+        y = FMExpression(y0, "y")
+        f = x.dot(y)
+        assert f.value == pytest.approx(x0 @ y0)
+        assert np.allclose(FMExpression.grad(f, "x"), np.sum(y0))
+        assert np.allclose(FMExpression.grad(f, "y"), np.sum(x0))
+        assert np.allclose(FMExpression.grad(x.dot(y0), "x"), np.sum(y0))
+
+    def test_fused_RM(self):
+        x0 = np.array([1.0, -2.0, 3.0, 0.5])
+        labels = np.array([1.0, 0.0, 0.0, 1.0])
+        x = RMExpression(x0, "x")
+        s = np.exp(x0) / np.sum(np.exp(x0))
+        sig = 1 / (1 + np.exp(-x0))
+
+        f = x.logsumexp()
+        f.backward_scalar()
+        assert f.value == pytest.approx(np.log(np.sum(np.exp(x0))))
+        assert np.allclose(f.jacobian["x"], s)
+
+        f = x.softmax()
+        f.backward_vector()
+        assert np.allclose(f.value, s)
+        assert np.allclose(f.jacobian["x"], np.diag(s) - np.outer(s, s))
+
+        f = x.log_softmax()
+        f.backward_vector()
+        assert np.allclose(f.value, np.log(s))
+        assert np.allclose(f.jacobian["x"], np.eye(4) - s)
+
+        f = x.softplus()
+        assert np.allclose(f.value, np.log1p(np.exp(x0)))
+        assert np.allclose(RMExpression.grad(f, "x"), sig)
+
+        f = x.logistic_loss(labels)
+        assert np.allclose(f.value, np.log1p(np.exp(x0)) - labels * x0)
+        assert np.allclose(RMExpression.grad(f, "x"), sig - labels)
+
+        f = x.squared_norm()
+        f.backward_scalar()
+        assert f.value == pytest.approx(np.sum(x0 ** 2))
+        assert np.allclose(f.jacobian["x"], 2 * x0)
+
+        # Large inputs do not overflow
+        big = RMExpression(np.array([1000.0, 0.0]), "big")
+        assert big.logsumexp().value == pytest.approx(1000.0)
+        assert np.allclose(big.softplus().value, [1000.0, np.log(2)])
+
+    def test_fused_FM(self):
+        x0 = np.array([1.0, -2.0, 3.0, 0.5])
+        labels = np.array([1.0, 0.0, 0.0, 1.0])
+        x = FMExpression(x0, "x")
+        s = np.exp(x0) / np.sum(np.exp(x0))
+        sig = 1 / (1 + np.exp(-x0))
+
+        # Forward mode propagates the all-ones direction
+        f = x.logsumexp()
+        assert f.value == pytest.approx(np.log(np.sum(np.exp(x0))))
+        assert np.allclose(FMExpression.grad(f, "x"), 1)
+        assert np.allclose(FMExpression.grad(x.softmax(), "x"), 0)
+        assert np.allclose(FMExpression.grad(x.log_softmax(), "x"), 0)
+        assert np.allclose(x.softmax().value, s)
+
+        y = FMExpression(x0, "y")
+        f = (x * y).log_softmax()
+        assert np.allclose(FMExpression.grad(f, "x"), x0 - np.sum(np.exp(f.value) * x0))
+        assert np.allclose(FMExpression.grad(x.softplus(), "x"), sig)
+        assert np.allclose(FMExpression.grad(x.logistic_loss(labels), "x"), sig - labels)
+        assert np.allclose(FMExpression.grad(x.squared_norm(), "x"), 2 * np.sum(x0))
+
+        # Both modes agree: forward mode gives J @ 1, for a scalar the sum of the gradient
+        for name in ["softmax", "log_softmax", "softplus"]:
+            fm = getattr((x * 2.0).sin(), name)()
+            rm = getattr((RMExpression(x0, "x") * 2.0).sin(), name)()
+            assert np.allclose(fm.value, rm.value)
+            rm.backward_vector()
+            assert np.allclose(FMExpression.grad(fm, "x"), rm.jacobian["x"] @ np.ones(4))
+        for name in ["logsumexp", "squared_norm"]:
+            fm = getattr((x * 2.0).sin(), name)()
+            rm = getattr((RMExpression(x0, "x") * 2.0).sin(), name)()
+            assert FMExpression.grad(fm, "x") == pytest.approx(np.sum(RMExpression.grad(rm, "x")))
+
+    def test_broadcast_then_reduce(self):
+        w0 = 2.0
+        x0 = np.array([0.5, -1.0, 2.0])
+        z0 = np.arange(6.0).reshape(2, 3)
+
+        def function(w, x, z):
+            return (w + x).sum() + (x + z).sum() - (z - w).sum() + (x - w * z).sum()
+
+        f = function(RMExpression(w0, "w"), RMExpression(x0, "x"), RMExpression(z0, "z"))
+        grads = f.backward()
+        g = function(FMExpression(w0, "w"), FMExpression(x0, "x"), FMExpression(z0, "z"))
+        assert g.value == pytest.approx(f.value[0])
+
+        # Forward mode propagates the all-ones direction, the sum of the reverse mode gradient
+        for name in ["w", "x", "z"]:
+            assert FMExpression.grad(g, name) == pytest.approx(np.sum(grads[name]))
+        assert FMExpression.grad((FMExpression(w0, "w") + FMExpression(x0, "x")).sum(), "w") == pytest.approx(3)
+
+    def test_builtin_sum(self):
+        # sum() starts from 0, which goes through __radd__
+        xs = [RMExpression(float(i), f"x{i}") for i in range(4)]
+        f = sum(x * x for x in xs)
+        f.backward_scalar()
+        assert f.value == pytest.approx(14)
+        assert f.jacobian["x3"] == pytest.approx(6)
+        assert (2 * xs[1]).value == pytest.approx(2)
+
+        xs = [FMExpression(float(i), f"x{i}") for i in range(4)]
+        f = sum(x * x for x in xs)
+        assert FMExpression.grad(f, "x2") == pytest.approx(4)
+
+    def test_getitem_RM(self):
+        x0 = np.array([1.0, 2.0, 3.0, 4.0])
+        x = RMExpression(x0, "x")
+
+        e = x[1]
+        assert e.value == 2
+        e.backward_scalar()
+        assert np.allclose(e.jacobian["x"], [0, 1, 0, 0])
+
+        # Repeated indices accumulate
+        e = (x[[0, 0, 3]] * x[1:3].sum()).sum()
+        e.backward_scalar()
+        assert e.value == pytest.approx((1 + 1 + 4) * 5)
+        assert np.allclose(e.jacobian["x"], [10, 6, 6, 5])
+
+        W = RMExpression(np.arange(6.0).reshape(2, 3), "W")
+        e = W[:, 1:] * W[0, 1:]
+        e = e[W.value[:, 1:] > 1]
+        assert np.allclose(e.value, [2 * 2, 4 * 1, 5 * 2])
+        e.sum().backward_scalar()
+        assert np.allclose(W.grad, [[0, 4, 9], [0, 1, 2]])
+
+        with pytest.raises(IndexError):
+            x[4]
+
+    def test_vector_RM(self):
+        x0 = np.array([0.5, -1.0, 2.0])
+        x = RMExpression(x0, "x")
+        y = RMExpression(3.0, "y")
+
+        # Elementwise graphs keep a single node per operation, one reverse sweep gives every element
+        f = (x * y).sin()
+        assert np.allclose(RMExpression.grad(f, "x"), 3 * np.cos(3 * x0))
+        assert np.allclose(RMExpression.grad(f, "y"), np.sum(x0 * np.cos(3 * x0)))
+        assert np.allclose(RMExpression.grad(f, 2, "x"), [0, 0, 3 * np.cos(6)])
+        f.backward_vector()
+        assert np.allclose(f.jacobian["x"], np.diag(3 * np.cos(3 * x0)))
+        assert f._adjoint_pool is None
+        assert np.allclose(RMExpression.grad(f, "x"), 3 * np.cos(3 * x0))
+
+        # grad is the reverse sweep of backward, it does not form the Jacobian
+        n = 3000
+        xs = np.linspace(-1.0, 1.0, n)
+        f_rm = (RMExpression(xs, "x") * 2.0).exp()
+        f_fm = (FMExpression(xs, "x") * 2.0).exp()
+        assert RMExpression.grad(f_rm, "x").shape == (n,)
+        assert np.allclose(RMExpression.grad(f_rm, "x"), FMExpression.grad(f_fm, "x"))
+        assert not f_rm.jacobian_full
+        with pytest.raises(KeyError):
+            RMExpression.grad(f_rm, "z")
+
+        A = np.array([[1.0, 2.0, 0.0], [3.0, 4.0, 5.0]])
+        h = A @ x
+        assert np.allclose(RMExpression.grad(h, "x"), h.backward()["x"])
+        assert np.allclose(RMExpression.grad(h, "x"), [4, 6, 5])
+
+        # Nodes built with explicit node_edges have no op
+        e = RMExpression(2 * x0, node_edges = [(x, 2.0)])
+        assert np.allclose(RMExpression.grad(e, "x"), 2)
+        assert np.allclose(RMExpression.grad(e, 1, "x"), [0, 2, 0])
+
+        # Elements that mix through slicing
+        g = RMExpression.vec(x[1:] * x[:-1], x.sum(), 1.0)
+        assert np.allclose(g.value, [-0.5, -2.0, 1.5, 1.0])
+        assert np.allclose(RMExpression.grad(g, "x"), [0, 3.5, 0])
+        g.backward_vector()
+        assert np.allclose(g.jacobian["x"], [[-1.0, 0.5, 0], [0, 2.0, -1.0], [1, 1, 1], [0, 0, 0]])
+        assert RMExpression.value(g) == [-0.5, -2.0, 1.5, 1.0]
+        assert RMExpression.value(g, 2) == 1.5
+
+        seeds = np.array([[1.0, 0, 0, 0], [0, 1.0, 1.0, 0]])
+        grads = g.backward(seeds)
+        assert np.allclose(grads["x"], [[-1.0, 0.5, 0], [1, 3.0, 0]])
+        with pytest.raises(ValueError):
+            g.backward(np.ones(3))
+
+    def test_getitem_FM(self):
+        x = FMExpression(np.array([1.0, 2.0, 3.0]), "x")
+        e = (x * x)[1:]
+        assert np.allclose(e.value, [4, 9])
+        assert np.allclose(FMExpression.grad(e, "x"), [4, 6])
+        assert FMExpression.grad(x.sin()[0], "x") == pytest.approx(np.cos(1))
+
+    def test_backward_buffers_RM(self):
+        x0 = np.linspace(0.1, 1.0, 5)
+        x = RMExpression(x0, "x")
+        h = x.sin() * x
+        f = h * 2 + h.exp() + x
+
+        first = f.backward()
+        pool = f._adjoint_pool
+        buffers = [id(b) for b in pool.buffers]
+        expected = (2 + np.exp(np.sin(x0) * x0)) * (np.cos(x0) * x0 + np.sin(x0)) + 1
+        assert np.allclose(first["x"], expected)
+
+        # A second sweep reuses the buffers and leaves the earlier result alone
+        seed = np.full(5, 2.0)
+        second = f.backward(seed)
+        assert f._adjoint_pool is pool and [id(b) for b in pool.buffers] == buffers
+        assert np.allclose(second["x"], 2 * expected) and np.allclose(first["x"], expected)
+        assert np.all(seed == 2)
+
+        # Another root over the same nodes, then the first root again
+        g = h.sum()
+        assert np.allclose(g.backward()["x"], np.cos(x0) * x0 + np.sin(x0))
+        assert np.allclose(f.backward()["x"], expected)
+
+        # A batch of seeds needs other buffers
+        assert np.allclose(f.backward(np.eye(5))["x"], np.diag(expected))
+        assert f._adjoint_pool is not pool
@@ -0,0 +1,88 @@
+import pytest
+import numpy as np
+from Autodiff43.logic.forward_mode import FMExpression
+from Autodiff43.logic.reverse_mode import RMExpression
+from Autodiff43.logic.lazy import LazyExpression
+from Autodiff43.logic.tape import trace
+from Autodiff43.logic.codegen import compile_function
+from Autodiff43.logic.hessian import hessian
+from Autodiff43.logic.utils import topological_order
+
+X = np.array([[1.0, -2.0, 0.5], [0.3, 0.8, -1.5], [-1.2, 0.1, 2.0], [0.7, 0.7, 0.7]])
+Y = np.array([1.0, 0.0, 1.0, 0.0])
+W = np.array([0.5, -1.0, 2.0])
+
+def numeric_grad(f, x0, eps = 1e-6):
+    ret = np.zeros_like(x0)
+    for i in range(x0.size):
+        e = np.zeros_like(x0)
+        e[i] = eps
+        ret[i] = (f(x0 + e) - f(x0 - e)) / (2 * eps)
+    return ret
+
+def objective(w):
+    return (X @ w).logistic_loss(Y).mean() + 0.1 * w.squared_norm() + (X @ w).log_softmax().dot(Y) + (X @ w).softmax().dot(Y)
+
+class TestFused:
+
+    def test_derivatives(self):
+        x0 = np.array([0.3, -1.2, 2.0, 0.1])
+        for name in ["logsumexp", "softmax", "log_softmax", "softplus", "squared_norm"]:
+            # Weighted, so that the derivative of every output element counts
+            c = np.array([2.0]) if name in ["logsumexp", "squared_norm"] else np.arange(1.0, 5.0)
+            f = lambda x: getattr(x, name)().dot(c)
+            expected = numeric_grad(lambda x: f(RMExpression(x)).value[0], x0)
+
+            assert np.allclose(f(RMExpression(x0, "x")).backward()["x"], expected)
+            assert np.allclose(f(LazyExpression(x0, "x")).grad("x"), expected)
+
+            # A tangent along each axis gives the same derivative in forward mode
+            for i in range(4):
+                assert np.allclose(f(FMExpression(x0, {"x": np.eye(4)[i]})).grad["x"], expected[i])
+
+    def test_large_inputs(self):
+        x0 = np.array([1000.0, 999.0, -5.0])
+        x = RMExpression(x0, "x")
+        lse = x.logsumexp()
+        assert np.allclose(lse.value, 1000 + np.log(1 + np.exp(-1) + np.exp(-1005)))
+        assert np.allclose(RMExpression.grad(lse, "x"), np.exp(x0 - lse.value))
+        assert np.all(np.isfinite(x.log_softmax().value)) and np.allclose(x.softmax().value.sum(), 1)
+
+        loss = FMExpression(np.array([800.0, -800.0]), "z").logistic_loss(np.array([0.0, 0.0]))
+        assert np.allclose(loss.value, [800.0, 0.0])
+        assert np.allclose(loss.grad["z"], [1.0, 0.0])
+
+        # One node per kernel, instead of exp, sum and log nodes
+        assert len(topological_order([lse])) == 2
+
+    def test_engines_agree(self):
+        w = RMExpression(W, "w")
+        f = objective(w)
+        expected = numeric_grad(lambda v: objective(RMExpression(v)).value[0], W)
+        assert np.allclose(f.backward()["w"], expected)
+
+        tape = trace(objective, [W], ["w"])
+        outputs, jac = tape.jacobian([W], "reverse")
+        assert np.allclose(outputs[0], f.value)
+        assert np.allclose(jac[0][0], expected)
+
+        value, grads = compile_function(objective, [W], ["w"])(W)
+        assert np.allclose(value, f.value)
+        assert np.allclose(grads["w"], expected)
+
+    def test_hessian(self):
+        def loss(a, b):
+            return a.softplus() * b + (a - b).logistic_loss(1.0) + (a * b).logistic_loss(0.25)
+
+        x0 = np.array([0.7, -0.4])
+        leaves = [RMExpression(x0[0], "a"), RMExpression(x0[1], "b")]
+        H = hessian(loss(*leaves), leaves).toarray()
+        g = lambda x: numeric_grad(lambda y: loss(RMExpression(y[0]), RMExpression(y[1])).value[0], x, 1e-5)
+        expected = np.array([numeric_grad(lambda y: g(y)[i], x0, 1e-4) for i in range(2)])
+        assert np.allclose(H, expected, atol=1e-5)
+
+    def test_labels(self):
+        with pytest.raises(ValueError):
+            RMExpression(np.zeros(3), "x").logistic_loss(np.zeros(4))
+        with pytest.raises(TypeError):
+            RMExpression(np.zeros(3), "x").logistic_loss("1")
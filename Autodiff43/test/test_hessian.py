@@ -0,0 +1,75 @@
+import pytest
+import numpy as np
+from Autodiff43.logic.reverse_mode import RMExpression
+from Autodiff43.logic.hessian import hessian
+
+def rosenbrock(x):
+    f = 0
+    for i in range(len(x) - 1):
+        f = 100 * (x[i + 1] - x[i] ** 2) ** 2 + (1 - x[i]) ** 2 + f
+    return f
+
+def rosenbrock_hessian(x):
+    n = len(x)
+    H = np.zeros((n, n))
+    for i in range(n - 1):
+        H[i, i] += 1200 * x[i] ** 2 - 400 * x[i + 1] + 2
+        H[i + 1, i + 1] += 200
+        H[i, i + 1] += -400 * x[i]
+        H[i + 1, i] += -400 * x[i]
+    return H
+
+def numeric_hessian(function, x0, step = 1e-5):
+    """Central differences of the reverse mode gradient."""
+    def grad(x):
+        leaves = [RMExpression(float(v), f"x{i}") for i, v in enumerate(x)]
+        grads = function(*leaves).backward()
+        return np.array([grads[f"x{i}"][0] for i in range(len(x))])
+    H = np.array([(grad(x0 + step * e) - grad(x0 - step * e)) / (2 * step) for e in np.eye(len(x0))])
+    return (H + H.T) / 2
+
+class TestHessian:
+
+    def test_rosenbrock(self):
+        x0 = np.linspace(-1.0, 1.5, 300)
+        leaves = [RMExpression(float(v), f"x{i}") for i, v in enumerate(x0)]
+        H = hessian(rosenbrock(leaves), leaves)
+        assert H.nnz == 2 * 300 - 1
+        assert np.all(H.rows >= H.cols)
+        assert np.allclose(H.toarray(), rosenbrock_hessian(x0))
+
+        # A vector input used through indexing
+        x = RMExpression(x0[:5], "x")
+        H = hessian(rosenbrock([x[i] for i in range(5)]), ["x"])
+        assert np.allclose(H.toarray(), rosenbrock_hessian(x0[:5]))
+        assert np.allclose(H.grad, RMExpression.backward(rosenbrock([x[i] for i in range(5)]))["x"])
+
+    def test_ops(self):
+        def f(a, b, c):
+            return ((a * b).sin() + (a / c).exp() * b.cos() - c.log() * a.tanh() + (b ** c) / (1 + a * a)
+                    + a.exp(2.0) * b.sigmoid() + (c * 0.3).arctan() + b.log(3.0) * (a - c).sinh() + (a * a) / b)
+
+        x0 = np.array([0.7, 1.3, 2.1])
+        leaves = [RMExpression(float(v), name) for v, name in zip(x0, "abc")]
+        H = hessian(f(*leaves), leaves)
+        assert np.allclose(H.toarray(), numeric_hessian(f, x0), atol=1e-5)
+        grads = f(*leaves).backward()
+        assert np.allclose(H.grad, [grads[name][0] for name in "abc"])
+
+        # Bases that are nodes themselves
+        def g(a, b):
+            return a.exp(b) + a.log(b) + (a * b).arcsin() + (a * 0.5).arccos() + b.tan() + b.cosh()
+
+        leaves = [RMExpression(0.6, "a"), RMExpression(1.4, "b")]
+        assert np.allclose(hessian(g(*leaves), leaves).toarray(), numeric_hessian(g, np.array([0.6, 1.4])), atol=1e-5)
+
+    def test_errors(self):
+        x = RMExpression(np.array([1.0, 2.0]), "x")
+        with pytest.raises(NotImplementedError):
+            hessian((x * x).sum(), [x])
+        with pytest.raises(NotImplementedError):
+            hessian(x.prod(), [x])
+        with pytest.raises(ValueError):
+            hessian(x * 2, [x])
+        with pytest.raises(ValueError):
+            hessian(x[0] * 2, ["y"])
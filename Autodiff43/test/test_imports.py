@@ -0,0 +1,60 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Seconds allowed for a cold `import Autodiff43`, the best of several fresh interpreters, loading NumPy alone takes longer
+IMPORT_BUDGET = 0.05
+IMPORT_RUNS = 5
+
+def run(code, options = ()):
+    """Runs code in a fresh interpreter (cold imports) and returns its stdout and stderr."""
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    result = subprocess.run([sys.executable, *options, '-c', code], env=env, capture_output=True, text=True, check=True)
+    return result.stdout, result.stderr
+
+def import_time():
+    """The cumulative time of `import Autodiff43` in seconds, as reported by -X importtime in a fresh interpreter."""
+    _, report = run("import Autodiff43", ['-X', 'importtime'])
+    for line in report.splitlines():
+        fields = [field.strip() for field in line.split('|')]
+        if (len(fields) == 3 and fields[2] == 'Autodiff43'):
+            return int(fields[1]) * 1e-6
+    raise AssertionError("Autodiff43 is missing from the -X importtime report.")
+
+class TestImports:
+
+    def test_cold_import(self):
+        # A cold `import Autodiff43` must not pull in NumPy, the logic modules or the tests
+        out, _ = run(
+            "import sys\n"
+            "import Autodiff43\n"
+            "print('numpy' in sys.modules)\n"
+            "print(' '.join(sorted(m for m in sys.modules if m.startswith(('Autodiff43', 'numpy', 'pytest')))))\n"
+        )
+        numpy_loaded, modules = out.splitlines()
+        assert numpy_loaded == 'False'
+        assert modules.split() == ['Autodiff43']
+
+    def test_import_budget(self):
+        # The best of several runs, so a busy machine does not fail the test
+        assert min(import_time() for _ in range(IMPORT_RUNS)) < IMPORT_BUDGET
+
+    def test_lazy_attributes(self):
+        out, _ = run(
+            "import sys\n"
+            "import Autodiff43 as ad\n"
+            "x = ad.FMExpression(2.0, 'x')\n"
+            "print(type(x.sin()).__name__, ad.core.ADMode is ad.ADMode, 'Autodiff43.logic.reverse_mode' in sys.modules)\n"
+            "print('Autodiff43.test' in sys.modules, 'pytest' in sys.modules)\n"
+        )
+        assert out.split() == ['FMExpression', 'True', 'True', 'False', 'False']
+
+        import Autodiff43
+        from Autodiff43.logic.reverse_mode import RMExpression
+        assert Autodiff43.RMExpression is RMExpression
+        assert set(Autodiff43.__all__) <= set(dir(Autodiff43))
+        with pytest.raises(AttributeError):
+            Autodiff43.missing
@@ -0,0 +1,67 @@
+import pytest
+import numpy as np
+from Autodiff43.logic.reverse_mode import RMExpression
+from Autodiff43.logic.incremental import IncrementalGraph
+
+def build(values, x0 = np.linspace(0, 1, 4)):
+    leaves = [RMExpression(v, f"p{i}") for i, v in enumerate(values)]
+    x = RMExpression(x0, "x")
+    terms = [(x * p).sin() * p for p in leaves]
+    return RMExpression.vec(*[t.sum() for t in terms]).sum() + x.dot(np.ones(4)), leaves, x
+
+def reference(values, x0 = np.linspace(0, 1, 4)):
+    f, _, _ = build(values, x0)
+    f.backward_scalar()
+    return f.value, f.jacobian
+
+class TestIncremental:
+
+    def test_matches_rebuild(self):
+        values = list(np.linspace(0.5, 2.0, 20))
+        f, leaves, x = build(values)
+        graph = IncrementalGraph(f)
+        grads = graph.gradients()
+        _, expected = reference(values)
+        assert all(np.allclose(grads[k], expected[k]) for k in expected)
+
+        for i, v in [(3, -1.0), (3, 0.25), (17, 4.0)]:
+            values[i] = v
+            graph.set_value(f"p{i}", v)
+            grads = graph.gradients()
+            value, expected = reference(values)
+            assert np.allclose(f.value, value)
+            assert all(np.allclose(grads[k], expected[k]) for k in expected)
+
+        # Changing a shared leaf touches everything, and still matches
+        graph.set_value(x, np.linspace(1, 2, 4))
+        grads = graph.gradients()
+        value, expected = reference(values, np.linspace(1, 2, 4))
+        assert np.allclose(f.value, value)
+        assert all(np.allclose(grads[k], expected[k]) for k in expected)
+
+    def test_affected_subgraph(self):
+        values = list(np.linspace(0.5, 2.0, 50))
+        f, leaves, x = build(values)
+        graph = IncrementalGraph(f)
+        graph.gradients()
+        full = graph.info["pushed"]
+
+        graph.set_value(leaves[10], 3.0)
+        graph.evaluate()
+        assert graph.info["recomputed"] == 7 # p * x, sin, * p, sum, concat, sum, + dot
+        graph.gradients()
+        assert graph.info["pushed"] < 10 < full
+
+        # The RMExpression graph itself is kept up to date
+        f.backward_scalar()
+        assert np.allclose(f.jacobian["p10"], graph.gradients()["p10"])
+
+    def test_errors(self):
+        f, leaves, x = build([1.0, 2.0])
+        graph = IncrementalGraph(f)
+        with pytest.raises(KeyError):
+            graph.set_value("missing", 1.0)
+        with pytest.raises(KeyError):
+            graph.set_value(f, 1.0)
+        with pytest.raises(ValueError):
+            graph.set_value("x", [1.0, 2.0])
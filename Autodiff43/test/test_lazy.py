@@ -0,0 +1,74 @@
+import pytest
+import numpy as np
+from Autodiff43.logic.lazy import LazyExpression, evaluate
+from Autodiff43.logic.reverse_mode import RMExpression
+from Autodiff43.logic.precision import precision
+
+def model(x, y):
+    return ((x * y).sin() * x + 1).exp() / (x + 1) - x.log() * (x * y).sin() + x.cos().exp(2)
+
+class TestLazy:
+
+    def test_matches_reverse_mode(self):
+        x0 = np.linspace(0.1, 1, 50)
+        f = model(LazyExpression(x0, "x"), LazyExpression(2.0, "y"))
+        g = model(RMExpression(x0, "x"), RMExpression(2.0, "y"))
+        g.backward_scalar()
+
+        assert np.allclose(f.evaluate(), g.value)
+        assert np.allclose(f.grad("x"), g.jacobian["x"])
+        assert np.allclose(f.grad("y"), g.jacobian["y"])
+        assert f.grad("z") == 0
+
+    def test_deferred(self):
+        x = LazyExpression(np.array([1.0, -1.0]), "x")
+        f = x.log()      # would be nan for the second element
+        g = (x * x).sum()
+        assert g.op == 'sum'
+        assert g.value == pytest.approx(2)
+        # Only the ancestors of g were computed
+        assert f._value is None
+
+        # Repeated subexpressions are computed once, elementwise chains reuse buffers
+        x = LazyExpression(np.linspace(0, 1, 1000), "x")
+        f = ((x * 2).sin() + (x * 2).sin()).exp() * 3 - 1
+        info = {}
+        value, = evaluate(f, info=info)
+        assert np.allclose(value, np.exp(2 * np.sin(2 * x.value)) * 3 - 1)
+        assert info['computed'] == 6
+        assert info['allocated'] == 1
+        assert info['reused'] == 5
+        assert info['peak_bytes'] == 8000
+
+        # The same under the float32 policy, with buffers of half the size
+        with precision("float32"):
+            x32 = LazyExpression(np.linspace(0, 1, 1000), "x")
+            f32 = ((x32 * 2).sin() + (x32 * 2).sin()).exp() * 3 - 1
+            info = {}
+            value, = evaluate(f32, info=info)
+        assert value.dtype == np.float32
+        assert np.allclose(value, np.exp(2 * np.sin(2 * x.value)) * 3 - 1, rtol=1e-5)
+        assert info['allocated'] == 1 and info['reused'] == 5
+        assert info['peak_bytes'] == 4000
+
+        # Values are kept on the roots, a second evaluation computes nothing
+        info = {}
+        evaluate(f, info=info)
+        assert info['computed'] == 0
+
+    def test_views_and_shared_roots(self):
+        x = LazyExpression(np.arange(6.0), "x")
+        a = x * 1.0
+        b = a[1:3]       # a view of a's buffer
+        c = a.exp()      # a dies here, it must not be overwritten while b uses it
+        d = b + c[:2]
+        e, s = evaluate(d, a)
+        assert np.allclose(e, [1, 2] + np.exp([0, 1]))
+        assert np.allclose(s, np.arange(6.0))
+
+        v = LazyExpression.vec(x[0], 2.0, x[5] * x[4])
+        assert np.allclose(v.evaluate(), [0, 2, 20])
+        assert np.allclose(v.grad("x"), [1, 0, 0, 0, 5, 4])
+
+        with pytest.raises(TypeError):
+            x + "a"
@@ -0,0 +1,61 @@
+import pytest
+import numpy as np
+from Autodiff43.logic.ode import integrate
+
+def decay(t, y, p):
+    return -(p[0] * y) + p[1]
+
+def lotka_volterra(t, y, p):
+    return [p[0] * y[0] - p[1] * y[0] * y[1], p[3] * y[0] * y[1] - p[2] * y[1]]
+
+LV_PARAMS = np.array([1.5, 1.0, 3.0, 1.0])
+
+class TestODE:
+
+    @pytest.mark.parametrize("method, options, tol", [("rk4", {"h": 0.01}, 1e-9), ("rk45", {}, 1e-5)])
+    def test_linear_decay(self, method, options, tol):
+        a, b, y0 = 0.8, 0.3, 2.0
+        T = np.array([0.5, 1.0, 3.0])
+        result = integrate(decay, [y0], (0, 3), [a, b], method, t_eval=T, **options)
+        assert result.success and np.allclose(result.t, T)
+
+        c = b / a
+        assert np.allclose(result.y[:, 0], c + (y0 - c) * np.exp(-a * T), atol=tol)
+        assert np.allclose(result.sensitivities[:, 0, 0], -b / a ** 2 * (1 - np.exp(-a * T)) - (y0 - c) * T * np.exp(-a * T), atol=tol)
+        assert np.allclose(result.sensitivities[:, 0, 1], (1 - np.exp(-a * T)) / a, atol=tol)
+
+    def test_matches_finite_differences(self):
+        y0 = [1.0, 1.0]
+        result = integrate(lotka_volterra, y0, (0, 2), LV_PARAMS, rtol=1e-8, atol=1e-10)
+        assert result.sensitivities.shape == (1, 2, 4)
+        assert result.nrejected + result.nsteps < 1000
+
+        expected = np.zeros((2, 4))
+        for k in range(4):
+            e = np.zeros(4)
+            e[k] = 1e-5
+            plus = integrate(lotka_volterra, y0, (0, 2), LV_PARAMS + e, rtol=1e-9, atol=1e-11).y[-1]
+            minus = integrate(lotka_volterra, y0, (0, 2), LV_PARAMS - e, rtol=1e-9, atol=1e-11).y[-1]
+            expected[:, k] = (plus - minus) / 2e-5
+        assert np.allclose(result.sensitivities[-1], expected, rtol=1e-4, atol=1e-4)
+
+        # The same sensitivities from fixed RK4 steps
+        rk4 = integrate(lotka_volterra, y0, (0, 2), LV_PARAMS, "rk4", h=0.01)
+        assert np.allclose(rk4.sensitivities[-1], expected, rtol=1e-4, atol=1e-4)
+
+    def test_initial_sensitivities(self):
+        # With y0 = p[0], S0 = dy0/dp and y(t) = p[0] * exp(-t) in the backward direction as well
+        result = integrate(lambda t, y, p: -y, [2.0], (0, 1), [2.0], S0=[[1.0]])
+        assert np.allclose(result.sensitivities[-1], np.exp(-1))
+        back = integrate(lambda t, y, p: -y, result.y[-1], (1, 0), [2.0], S0=result.sensitivities[-1], t_eval=[0.5, 0.0])
+        assert np.allclose(back.y[:, 0], [2 * np.exp(-0.5), 2.0]) and np.allclose(back.sensitivities[-1], 1.0)
+
+    def test_errors(self):
+        with pytest.raises(ValueError):
+            integrate(decay, [1.0], (0, 1), [1.0, 0.0], "rk4")
+        with pytest.raises(ValueError):
+            integrate(decay, [1.0], (0, 1), [1.0, 0.0], t_eval=[0.5, 0.2])
+        with pytest.raises(NotImplementedError):
+            integrate(decay, [1.0], (0, 1), [1.0, 0.0], "euler")
+        with pytest.raises(ValueError):
+            integrate(lambda t, y, p: p * 1.0, [1.0], (0, 1), [1.0, 0.0])
@@ -0,0 +1,56 @@
+import pytest
+import numpy as np
+from Autodiff43.logic.optimize import minimize, line_search, BatchObjective
+
+def rosenbrock(x, y):
+    return (1 - x) ** 2 + 100 * (y - x * x) ** 2
+
+class TestOptimize:
+
+    def test_bfgs_and_newton(self):
+        starts = np.random.default_rng(0).uniform(-2, 2, (100, 2))
+        for method in ['bfgs', 'newton']:
+            result = minimize(rosenbrock, starts, method=method)
+            assert result.converged.all()
+            assert np.allclose(result.x, 1, atol=1e-5)
+            assert result.fun[result.best] == pytest.approx(0, abs=1e-12)
+
+    def test_graph_recorded_once(self):
+        calls = []
+        def quadratic(x, y):
+            calls.append(1)
+            return (x - 3) ** 2 + 2 * (y + 1) ** 2 + x * y
+
+        starts = np.random.default_rng(1).normal(size=(50, 2))
+        result = minimize(quadratic, starts, method='gd', gtol=1e-8, max_iter=1000)
+        assert len(calls) == 1
+        assert result.converged.all()
+        # the minimum solves [[2, 1], [1, 4]] x = [6, -4]
+        assert np.allclose(result.x, np.linalg.solve([[2, 1], [1, 4]], [6, -4]), atol=1e-6)
+
+    def test_convergence_masks(self):
+        # Starts at the minimum stop immediately, the others keep iterating
+        starts = np.array([[1.0, 1.0], [-1.5, 2.0], [1.0, 1.0]])
+        result = minimize(rosenbrock, starts)
+        assert list(result.nit[[0, 2]]) == [0, 0]
+        assert result.nit[1] > 0
+        assert result.converged.all()
+
+        # A single start can be given as a vector
+        result = minimize(lambda x: (x - 2).cosh(), np.array([0.5]), method='newton')
+        assert result.x.shape == (1, 1)
+        assert result.x[0, 0] == pytest.approx(2)
+
+        with pytest.raises(NotImplementedError):
+            minimize(rosenbrock, starts, method='cg')
+
+    def test_line_search(self):
+        x = np.array([[0.0], [0.0]])
+        objective = BatchObjective(lambda x: x * x - 2 * x, x)
+        f, g = objective.value_and_grad(x)
+        assert np.allclose(g, [[-2], [-2]])
+
+        # The second direction points uphill, no step length gives a decrease
+        alpha = line_search(objective, x, f, g, np.array([[4.0], [-1.0]]))
+        assert alpha[0] == pytest.approx(0.25)
+        assert alpha[1] == 0
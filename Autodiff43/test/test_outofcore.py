@@ -0,0 +1,60 @@
+import os
+
+import pytest
+import numpy as np
+from Autodiff43.logic.outofcore import evaluate_memmap, chunk_size_for_budget
+
+def model(x, y, z):
+    return [(x * y).sin() + z, (x + z).exp() * y]
+
+class TestOutOfCore:
+
+    def test_evaluate(self, tmp_path):
+        points = np.random.default_rng(0).normal(size=(50, 3))
+        np.save(tmp_path / "in.npy", points)
+
+        result = evaluate_memmap(model, str(tmp_path / "in.npy"), str(tmp_path / "out.npy"), chunk_size=7)
+        assert result.complete
+        x, y, z = points.T
+        assert np.allclose(result.values, np.stack([np.sin(x * y) + z, np.exp(x + z) * y], axis=1))
+        assert np.allclose(result.jacobian[:, 0], np.stack([y * np.cos(x * y), x * np.cos(x * y), np.ones(50)], axis=1))
+        assert np.allclose(result.jacobian[:, 1], np.stack([np.exp(x + z) * y, np.exp(x + z), np.exp(x + z) * y], axis=1))
+
+        reverse = evaluate_memmap(model, str(tmp_path / "in.npy"), str(tmp_path / "rev.npy"), mode="reverse", memory_budget=4096)
+        assert np.allclose(reverse.array, result.array)
+
+    def test_resume(self, tmp_path):
+        points = np.random.default_rng(1).normal(size=(20, 3))
+        np.save(tmp_path / "in.npy", points)
+
+        partial = evaluate_memmap(model, str(tmp_path / "in.npy"), str(tmp_path / "out.npy"), chunk_size=6, max_chunks=2)
+        assert not partial.complete
+        assert np.all(partial.array[12:] == 0)
+
+        # Only the remaining rows are evaluated, the first 12 are kept
+        resumed = evaluate_memmap(model, str(tmp_path / "in.npy"), str(tmp_path / "out.npy"), chunk_size=6)
+        fresh = evaluate_memmap(model, str(tmp_path / "in.npy"), str(tmp_path / "fresh.npy"))
+        assert resumed.complete
+        assert np.allclose(resumed.array, fresh.array)
+
+        # A different job in the same place starts over
+        restarted = evaluate_memmap(model, str(tmp_path / "in.npy"), str(tmp_path / "out.npy"), mode="reverse", max_chunks=0)
+        assert not restarted.complete and np.all(restarted.array == 0)
+
+        # So does another function with the same number of outputs
+        evaluate_memmap(model, str(tmp_path / "in.npy"), str(tmp_path / "other.npy"), chunk_size=6, max_chunks=2)
+        other = evaluate_memmap(lambda x, y, z: [x * y, y + z], str(tmp_path / "in.npy"), str(tmp_path / "other.npy"), chunk_size=6)
+        x, y, z = points.T
+        assert other.complete and np.allclose(other.values, np.stack([x * y, y + z], axis=1))
+
+    def test_chunk_size(self, tmp_path):
+        np.save(tmp_path / "in.npy", np.ones((4, 3)))
+        result = evaluate_memmap(model, str(tmp_path / "in.npy"), str(tmp_path / "out.npy"), memory_budget=1)
+        assert result.complete and os.path.exists(str(tmp_path / "out.npy") + ".progress")
+        from Autodiff43.logic.tape import trace
+        tape = trace(model, [1.0, 1.0, 1.0], ["x", "y", "z"])
+        assert chunk_size_for_budget(tape, 3, 2, 1) == 1
+        assert chunk_size_for_budget(tape, 3, 2, 2 ** 20) == 2 ** 20 // (8 * (3 + 2 + 6 + 2 * tape.size))
+        np.save(tmp_path / "empty.npy", np.ones((0, 3)))
+        with pytest.raises(ValueError):
+            evaluate_memmap(model, str(tmp_path / "empty.npy"), str(tmp_path / "out.npy"))
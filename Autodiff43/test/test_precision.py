@@ -0,0 +1,69 @@
+import pytest
+import numpy as np
+from Autodiff43.logic.forward_mode import FMExpression
+from Autodiff43.logic.reverse_mode import RMExpression
+from Autodiff43.logic.precision import precision, set_precision, get_dtype
+
+def function(x, y):
+    return (x * y).sin() + x.exp(2) / y - x.log(10)
+
+class TestPrecision:
+
+    def test_integer_inputs(self):
+        x = FMExpression(3, "x")
+        assert x.value.dtype == np.float64 and x.grad["x"].dtype == np.float64
+
+        x = RMExpression(3, "x")
+        y = RMExpression([1, 2], "y")
+        assert x.grad.dtype == np.float64 and y.value.dtype == np.float64
+        f = x * y
+        f.backward_scalar()
+        assert f.jacobian["x"].dtype == np.float64
+        assert np.allclose(f.jacobian["x"], 3)
+
+        # Arrays are copied, also when they already have the policy dtype
+        x0 = np.array([1.0, 2.0])
+        x = RMExpression(x0, "x")
+        x0[0] = 5.0
+        assert np.allclose(x.value, [1.0, 2.0])
+        assert RMExpression(np.array(2.0), "x").value.shape == (1,)
+        # Results of operations are stored without another copy
+        values = np.array([3.0, 4.0])
+        assert RMExpression(values, copy=False).value is values
+        assert FMExpression.from_expression(FMExpression(values, copy=False)).value is values
+
+    def test_float32_scope(self):
+        with precision("float32") as dtype:
+            assert dtype == np.float32
+            f = function(FMExpression(1.5, "x"), FMExpression(2, "y"))
+            assert f.value.dtype == np.float32
+            assert all(v.dtype == np.float32 for v in f.grad.values())
+
+            g = function(RMExpression(1.5, "x"), RMExpression(2, "y"))
+            grads = g.backward()
+            assert g.value.dtype == np.float32
+            assert all(v.dtype == np.float32 for v in grads.values())
+            assert np.allclose(grads["x"], f.grad["x"]) and np.allclose(grads["y"], f.grad["y"])
+
+        assert get_dtype() == np.float64
+        assert function(FMExpression(1.5, "x"), FMExpression(2, "y")).value.dtype == np.float64
+
+    def test_global(self):
+        try:
+            set_precision("float32")
+            assert RMExpression(1, "x").value.dtype == np.float32
+            with precision(np.float64):
+                assert RMExpression(1, "x").value.dtype == np.float64
+            assert get_dtype() == np.float32
+        finally:
+            set_precision("float64")
+
+        with pytest.raises(ValueError):
+            set_precision("float16")
+        with pytest.raises(ValueError):
+            with precision("int64"):
+                pass
+        with pytest.raises(ValueError):
+            set_precision("not a dtype")
+        with pytest.raises(ValueError):
+            set_precision(None)
@@ -0,0 +1,42 @@
+import json
+
+import pytest
+import numpy as np
+from Autodiff43.logic.forward_mode import FMExpression
+from Autodiff43.logic.reverse_mode import RMExpression
+from Autodiff43.logic.profiling import Profiler, profile
+
+class TestProfiling:
+
+    def test_counts(self):
+        with profile() as p:
+            x = RMExpression(2.0, "x")
+            f = x ** 3 + x.sin()
+            RMExpression.grad(f, "x")
+            y = FMExpression(1.0, "y")
+            (y * y).exp()
+
+        stats = p.as_dict()
+        assert stats['RMExpression.__pow__']['calls'] == 1
+        assert stats['Expression.__pow__']['calls'] == 1
+        assert stats['RMExpression.sin']['calls'] == 1
+        assert stats['RMExpression.backward_scalar']['calls'] == 1
+        assert stats['FMExpression.__mul__']['calls'] == 1
+        assert stats['FMExpression.exp']['calls'] == 1
+        for entry in stats.values():
+            assert 0 <= entry['self_time'] <= entry['total_time'] + 1e-9
+
+        assert json.loads(p.to_json()) == stats
+
+    def test_disable_restores_methods(self):
+        add = RMExpression.__add__
+        p = Profiler()
+        p.enable()
+        assert RMExpression.__add__ is not add
+        with pytest.raises(RuntimeError):
+            Profiler().enable()
+        p.disable()
+        assert RMExpression.__add__ is add
+
+        RMExpression(1, "x") + 1
+        assert p.as_dict() == {}
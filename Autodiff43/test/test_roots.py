@@ -0,0 +1,51 @@
+import pytest
+import numpy as np
+from Autodiff43.logic.reverse_mode import RMExpression
+from Autodiff43.logic.roots import root, broyden_update, System
+
+N = 12
+A = np.eye(N) * 4 + np.random.default_rng(0).normal(size=(N, N)) * 0.3
+B = np.random.default_rng(1).normal(size=N)
+
+def slowly_varying(*x):
+    return [sum(float(A[i, j]) * x[j] for j in range(N)) + 0.2 * x[i].sin() - float(B[i]) for i in range(N)]
+
+def circle_exp(x, y):
+    return RMExpression.vec(x * x + y * y - 4, x.exp() + y - 1)
+
+class TestRoots:
+
+    def test_jacobian_reuse(self):
+        result = root(slowly_varying, np.zeros(N))
+        assert result.converged
+        assert np.linalg.norm(A @ result.x + 0.2 * np.sin(result.x) - B) < 1e-10
+
+        # stall = 0 refreshes the Jacobian on every iteration, a plain Newton iteration
+        newton = root(slowly_varying, np.zeros(N), stall=0)
+        assert newton.converged
+        assert np.allclose(newton.x, result.x)
+        assert result.njev == 1
+        assert newton.njev >= 3
+
+    def test_modes_agree(self):
+        x = np.array([1.0, -1.0])
+        F_forward, J_forward = System(circle_exp, x, 'forward').jacobian(x)
+        F_reverse, J_reverse = System(circle_exp, x, 'reverse').jacobian(x)
+        assert np.allclose(F_forward, [-2, np.e - 2])
+        assert np.allclose(J_forward, [[2, -2], [np.e, 1]])
+        assert np.allclose(J_reverse, J_forward)
+
+        for mode in ['forward', 'reverse']:
+            result = root(circle_exp, x, mode=mode)
+            assert result.converged
+            assert np.allclose(circle_exp(*[RMExpression(v) for v in result.x]).value, 0, atol=1e-10)
+
+    def test_broyden_update(self):
+        # The updated inverse maps y to s (the secant condition)
+        J_inv = np.linalg.inv(np.array([[2.0, 1.0], [0.5, 3.0]]))
+        s = np.array([0.1, -0.2])
+        y = np.array([0.3, 0.05])
+        assert np.allclose(broyden_update(J_inv, s, y) @ y, s)
+
+        with pytest.raises(ValueError):
+            root(lambda x, y: x * y, [1.0, 2.0])
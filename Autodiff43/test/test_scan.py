@@ -0,0 +1,103 @@
+import io
+import pickle
+
+import pytest
+import numpy as np
+from Autodiff43.logic.forward_mode import FMExpression
+from Autodiff43.logic.reverse_mode import RMExpression
+from Autodiff43.logic.tape import trace
+from Autodiff43.logic.utils import topological_order
+from Autodiff43.logic.scan import scan
+from Autodiff43.logic.serialization import save_graph, load_graph
+
+DT = 0.01
+U = np.sin(0.1 * np.arange(100.0)).reshape(50, 2)
+X0 = np.array([1.0, -0.5])
+
+def body(x, u, k):
+    # One explicit Euler step of dx/dt = -k x + sin(x) + u, and the energy of the new state
+    new = x + DT * (-(k * x) + x.sin() + u)
+    return new, new.squared_norm()
+
+def unrolled(x, us, k):
+    ys = []
+    for t in range(len(U)):
+        x, y = body(x, us[t], k)
+        ys.append(y)
+    return x, ys
+
+class TestScan:
+
+    def test_matches_unrolled_loop(self):
+        x0, us, k = RMExpression(X0, "x0"), RMExpression(U, "us"), RMExpression(0.7, "k")
+        carry, ys = scan(body, x0, us, [k])
+        f = carry.sum() + ys.sum()
+        grads = f.backward()
+
+        x0, us, k = RMExpression(X0, "x0"), RMExpression(U, "us"), RMExpression(0.7, "k")
+        carry2, ys2 = unrolled(x0, us, k)
+        f2 = carry2.sum()
+        for y in ys2:
+            f2 = f2 + y
+        expected = f2.backward()
+
+        assert np.allclose(carry.value, carry2.value)
+        assert ys.value.shape == (50, 1)
+        assert np.allclose(f.value, f2.value)
+        for name in ["x0", "us", "k"]:
+            assert np.allclose(grads[name], expected[name])
+
+        # The graph does not grow with the number of steps
+        assert len(topological_order([f])) < 12 < len(topological_order([f2]))
+
+        # A second sweep, and one seed per element of the carry
+        assert np.allclose(f.backward()["k"], expected["k"])
+        carry.backward_vector()
+        assert np.allclose(carry.jacobian["x0"], [[RMExpression.grad(carry2[i], "x0")[j] for j in range(2)] for i in range(2)])
+
+    def test_forward_mode_and_tape(self):
+        carry, ys = scan(body, RMExpression(X0, "x0"), U, [RMExpression(0.7, "k")])
+        f = carry.sum() + ys.sum()
+        grads = f.backward()
+
+        carry_fm, ys_fm = scan(body, FMExpression(X0, "x0"), U, [FMExpression(0.7, "k")])
+        f_fm = carry_fm.sum() + ys_fm.sum()
+        assert np.allclose(f_fm.value, f.value)
+        assert np.allclose(f_fm.grad["k"], grads["k"])
+        assert np.allclose(f_fm.grad["x0"], np.sum(grads["x0"]))
+
+        def objective(x0, k):
+            carry, ys = scan(body, x0, U, [k])
+            return carry.sum() + ys.sum()
+
+        tape = trace(objective, [X0, 0.7], ["x0", "k"])
+        for mode in ["forward", "reverse"]:
+            outputs, jac = tape.jacobian([X0 + 0.1, 0.9], mode)
+            g = objective(RMExpression(X0 + 0.1, "x0"), RMExpression(0.9, "k"))
+            assert np.allclose(outputs[0], g.value)
+            assert np.allclose(jac[0][1], g.backward()["k"])
+
+    def test_pickle_and_save(self):
+        carry, ys = scan(body, RMExpression(X0, "x0"), RMExpression(U, "us"), [RMExpression(0.7, "k")])
+        f = carry.sum() + ys.sum()
+        expected = f.backward()
+
+        buffer = io.BytesIO()
+        save_graph(f, buffer)
+        buffer.seek(0)
+        for restored in [pickle.loads(pickle.dumps(f)), load_graph(buffer)]:
+            assert np.allclose(restored.value, f.value)
+            grads = restored.backward()
+            for name in ["x0", "us", "k"]:
+                assert np.allclose(grads[name], expected[name])
+
+    def test_errors(self):
+        k = RMExpression(0.7, "k")
+        with pytest.raises(ValueError):
+            scan(lambda x, u: body(x, u, k), RMExpression(X0, "x0"), U)
+        with pytest.raises(ValueError):
+            scan(lambda x, u: (x.sum(), x), RMExpression(X0, "x0"), U)
+        with pytest.raises(TypeError):
+            scan(lambda x, u: x + u, RMExpression(X0, "x0"), U)
+        with pytest.raises(TypeError):
+            scan(body, FMExpression(X0, "x0"), U, [k])
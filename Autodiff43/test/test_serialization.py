@@ -0,0 +1,75 @@
+import io
+import pickle
+
+import pytest
+import numpy as np
+from Autodiff43.logic.reverse_mode import RMExpression
+from Autodiff43.logic.serialization import save_graph, load_graph, graph_to_arrays, graph_from_arrays
+
+class TestSerialization:
+
+    def test_roundtrip_npz(self):
+        x = RMExpression(2, "x")
+        y = RMExpression(3, "y")
+        f = RMExpression.sin(x * y) + RMExpression.log(y, 2) - 1 / x
+
+        buffer = io.BytesIO()
+        save_graph(f, buffer)
+        buffer.seek(0)
+        g = load_graph(buffer)
+
+        assert g.value == pytest.approx(f.value)
+        assert g.op == f.op
+        assert RMExpression.grad(g, "x") == pytest.approx(RMExpression.grad(f, "x"))
+        assert RMExpression.grad(g, "y") == pytest.approx(RMExpression.grad(f, "y"))
+
+    def test_shared_nodes(self):
+        x = RMExpression(1.5, "x")
+        s = x * x
+        f = s + s.exp()
+
+        arrays = graph_to_arrays(f)
+        assert len(arrays['op_codes']) == 4
+        assert len(arrays['edge_parents']) == 5
+
+        g = graph_from_arrays(arrays)
+        assert RMExpression.grad(g, "x") == pytest.approx(2 * 1.5 + 2 * 1.5 * np.exp(1.5 ** 2))
+
+    def test_pickle_deep_graph(self):
+        x = RMExpression(0.5, "x")
+        f = x
+        for _ in range(20000):
+            f = f * 1.0001 + 0.0
+
+        g = pickle.loads(pickle.dumps(f))
+        assert g.value == pytest.approx(f.value)
+        assert RMExpression.grad(g, "x") == pytest.approx(1.0001 ** 20000)
+
+    def test_bad_version(self):
+        arrays = graph_to_arrays(RMExpression(1, "x") + 1)
+        arrays['version'] = np.array(-1)
+        with pytest.raises(ValueError):
+            graph_from_arrays(arrays)
+
+    def test_matmul_edges(self):
+        W = RMExpression(np.arange(6.0).reshape(2, 3), "W")
+        x = RMExpression(np.array([1.0, -1.0, 0.5]), "x")
+        f = (W @ x).sin() + np.ones((2, 2)) @ (W @ x)
+
+        g = pickle.loads(pickle.dumps(f))
+        f.backward_scalar()
+        g.backward_scalar()
+        assert np.allclose(g.value, f.value)
+        assert np.allclose(g.jacobian["W"], f.jacobian["W"])
+        assert np.allclose(g.jacobian["x"], f.jacobian["x"])
+
+    def test_slicing_edges(self):
+        x = RMExpression(np.arange(1.0, 7.0).reshape(2, 3), "x")
+        f = RMExpression.vec(x[0, 1:], x[:, [0, 0]].sin(), x[1, 2] * 2)
+
+        buffer = io.BytesIO()
+        save_graph(f, buffer)
+        buffer.seek(0)
+        g = load_graph(buffer)
+        assert np.allclose(g.value, f.value)
+        assert np.allclose(RMExpression.grad(g, "x"), RMExpression.grad(f, "x"))
@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+import numpy as np
+from Autodiff43.logic.reverse_mode import RMExpression
+from Autodiff43.logic.service import GradientScheduler, agrad
+
+def model(x, y):
+    return (x * y).sin() + x.exp() / (y * y + 1)
+
+def reference(x, y):
+    f = model(RMExpression(x, "x"), RMExpression(y, "y"))
+    f.backward_scalar()
+    return f.value[0], np.array([f.jacobian["x"][0], f.jacobian["y"][0]])
+
+class TestService:
+
+    def test_coalescing(self):
+        points = np.random.default_rng(0).normal(size=(10, 2))
+        scheduler = GradientScheduler(max_batch_size=64, max_wait=0.01)
+
+        async def main():
+            return await asyncio.gather(*[scheduler.grad(model, p) for p in points])
+
+        results = asyncio.run(main())
+        assert scheduler.info() == {'requests': 10, 'batches': 1, 'functions': 1}
+        for (value, grad), p in zip(results, points):
+            ref_value, ref_grad = reference(*p)
+            assert value == pytest.approx(ref_value)
+            assert np.allclose(grad, ref_grad)
+
+    def test_max_batch_size(self):
+        scheduler = GradientScheduler(max_batch_size=4, max_wait=10)
+
+        async def main():
+            # A full batch is dispatched at once, the last partial one waits out max_wait (cut short here)
+            tasks = [asyncio.ensure_future(scheduler.grad(model, [0.1 * i, 1.0])) for i in range(9)]
+            await asyncio.sleep(0)
+            scheduler._dispatch((model, 2))
+            return await asyncio.gather(*tasks)
+
+        results = asyncio.run(main())
+        assert scheduler.batches == 3
+        assert results[8][0] == pytest.approx(reference(0.8, 1.0)[0])
+
+        with pytest.raises(ValueError):
+            GradientScheduler(max_batch_size=0)
+
+    def test_failing_request(self):
+        def ratio(x, y):
+            return x / y
+
+        async def main(scheduler, points):
+            return await asyncio.gather(*[scheduler.grad(ratio, p) for p in points], return_exceptions=True)
+
+        # A zero divisor in one request does not fail the requests batched with it
+        good, bad = asyncio.run(main(GradientScheduler(max_wait=0.01), [[1.0, 2.0], [1.0, 0.0]]))
+        assert good[0] == pytest.approx(0.5) and np.allclose(good[1], [0.5, -0.25])
+        assert bad[0] == np.inf
+
+        scheduler = GradientScheduler(max_wait=0.01)
+        bad, good = asyncio.run(main(scheduler, [[1.0, 0.0], [1.0, 2.0]]))
+        assert isinstance(bad, ZeroDivisionError)
+        assert good[0] == pytest.approx(0.5) and np.allclose(good[1], [0.5, -0.25])
+        assert scheduler.info() == {'requests': 2, 'batches': 1, 'functions': 1}
+
+    def test_maxsize(self):
+        scheduler = GradientScheduler(max_wait=0, maxsize=2)
+        functions = [lambda x, k=k: (x * k).sin() for k in range(1, 4)]
+
+        async def main():
+            for f in functions + functions[2:]:
+                await scheduler.grad(f, [0.5])
+
+        asyncio.run(main())
+        # The least recently used objective is dropped, the most recent one is reused
+        assert scheduler.info() == {'requests': 4, 'batches': 4, 'functions': 2}
+        assert [key[0] for key in scheduler._objectives] == functions[1:]
+
+    def test_agrad(self):
+        async def main():
+            return await asyncio.gather(agrad(model, [0.5, 2.0]), agrad(lambda x: x.log(), [0.0]), return_exceptions=True)
+
+        (value, grad), (log_value, log_grad) = asyncio.run(main())
+        assert value == pytest.approx(reference(0.5, 2.0)[0])
+        assert log_value == -np.inf
+
+        def broken(x):
+            raise RuntimeError("bad model")
+
+        async def failing():
+            return await agrad(broken, [1.0])
+
+        with pytest.raises(RuntimeError):
+            asyncio.run(failing())
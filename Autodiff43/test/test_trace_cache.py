@@ -0,0 +1,112 @@
+import pytest
+import numpy as np
+from Autodiff43.logic.forward_mode import FMExpression
+from Autodiff43.logic.reverse_mode import RMExpression
+from Autodiff43.logic.tape import trace
+from Autodiff43.logic.trace_cache import differentiable, TraceCache
+
+def model(x, y):
+    a = x * y + x.sin() - y / x + x.exp(2)
+    b = (x ** 2).exp(3) + y.log() + y.log(2) + x.tanh() * y.arctan()
+    c = 1 - x.sigmoid() + 3 / y + x ** y + y.sqrt() + x.cosh() - x.sinh()
+    return a + b * c - x.cos() * y.tan() + (x / 3).arcsin() + (y / 4).arccos()
+
+class TestTraceCache:
+
+    def test_tape_matches_reverse_mode(self):
+        x = RMExpression(0.7, "x")
+        y = RMExpression(1.3, "y")
+        f = model(x, y)
+
+        tape = trace(model, [0.7, 1.3], ["x", "y"])
+        outputs, jac = tape.jacobian([0.7, 1.3], 'reverse')
+        assert outputs[0] == pytest.approx(f.value)
+        assert jac[0][0] == pytest.approx(RMExpression.grad(f, "x"))
+        assert jac[0][1] == pytest.approx(RMExpression.grad(f, "y"))
+
+        # Replaying at a new point matches a freshly built graph
+        f = model(RMExpression(0.2, "x"), RMExpression(2.5, "y"))
+        outputs, jac = tape.jacobian([0.2, 2.5], 'forward')
+        assert outputs[0] == pytest.approx(f.value)
+        assert jac[0][0] == pytest.approx(RMExpression.grad(f, "x"))
+        assert jac[0][1] == pytest.approx(RMExpression.grad(f, "y"))
+
+    def test_decorator(self):
+        @differentiable(mode = 'forward')
+        def f(x, y):
+            return [x * y, x + y.sin()]
+
+        value, grad = f(2.0, 3.0)
+        e = FMExpression.vec(FMExpression(2.0, "x") * FMExpression(3.0, "y"), FMExpression(2.0, "x") + FMExpression(3.0, "y").sin())
+        assert value == pytest.approx(e.value)
+        assert grad["x"] == pytest.approx(FMExpression.grad(e, "x"))
+        assert grad["y"] == pytest.approx(FMExpression.grad(e, "y"))
+
+        f(5.0, 1.0)
+        f(np.array([1.0, 2.0]), np.array([3.0, 4.0]))
+        info = f.cache_info()
+        assert info['hits'] == 1
+        assert info['misses'] == 2
+        assert info['size'] == 2
+
+        value, grad = f(np.array([1.0, 2.0]), np.array([3.0, 4.0]))
+        assert value == pytest.approx([3.0, 8.0, 1.0 + np.sin(3.0), 2.0 + np.sin(4.0)])
+        assert grad["y"] == pytest.approx([1.0, 2.0, np.cos(3.0), np.cos(4.0)])
+
+    def test_modes_agree(self):
+        @differentiable(mode = 'reverse')
+        def g(x, y):
+            return x.exp() * y - x / y
+
+        @differentiable(mode = 'forward')
+        def h(x, y):
+            return x.exp() * y - x / y
+
+        x = np.linspace(0.1, 1.0, 5)
+        y = np.linspace(1.0, 2.0, 5)
+        value_g, grad_g = g(x, y)
+        value_h, grad_h = h(x, y)
+        assert value_g == pytest.approx(value_h)
+        assert grad_g["x"] == pytest.approx(grad_h["x"])
+        assert grad_g["y"] == pytest.approx(grad_h["y"])
+
+    def test_modes_with_reductions(self):
+        def f(x, w):
+            return [(x * x).sum() + x.dot(w), x[1:].norm()]
+
+        x = np.array([1.0, 2.0, 3.0])
+        w = np.array([0.5, -1.0, 2.0])
+        forward = differentiable(f, mode = 'forward')
+        reverse = differentiable(f, mode = 'reverse')
+        value_f, grad_f = forward(x, w)
+        value_r, grad_r = reverse(x, w)
+        assert value_f == pytest.approx(value_r)
+
+        # Reverse mode gives the gradient of each output, forward mode its derivative along all ones
+        expected = [2 * x + w, np.array([0.0, 2.0, 3.0]) / np.sqrt(13)]
+        assert grad_r["x"] == pytest.approx(np.concatenate(expected))
+        assert grad_r["w"] == pytest.approx(np.concatenate([x, np.zeros(3)]))
+        assert grad_f["x"] == pytest.approx([np.sum(g) for g in expected])
+        assert grad_f["w"] == pytest.approx([np.sum(x), 0.0])
+
+    def test_eviction(self):
+        @differentiable(maxsize = 2)
+        def f(x):
+            return x * x
+
+        for n in [1, 2, 3, 1]:
+            f(np.ones(n))
+        info = f.cache_info()
+        assert info['size'] == 2
+        assert info['evictions'] == 2
+        assert info['misses'] == 4
+
+    def test_byte_limit(self):
+        tape = trace(lambda x: x * RMExpression(np.ones(100)), [np.ones(100)], ["x"])
+        cache = TraceCache(maxsize = None, max_bytes = tape.nbytes + 10)
+        cache.put("a", tape)
+        cache.put("b", tape)
+        assert len(cache) == 1
+        assert cache.get("a") is None
+        assert cache.get("b") is tape
+        assert cache.info()['evictions'] == 1
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark suite for FMExpression and RMExpression.
+
+Generates synthetic graphs (deep chains, wide fan-in sums, DAGs with heavy sharing, long
+vector inputs and many vector nodes), times graph construction, gradient extraction and a
+repeated gradient extraction on the same graph in both modes across sizes, measures peak
+memory and the number of memory blocks each gradient extraction leaves allocated with
+tracemalloc, and writes the results as JSON. A run can be compared against a stored
+baseline, flagging metrics that regressed by more than a threshold.
+
+Usage:
+    python benchmarks/run_benchmarks.py --output results.json
+    python benchmarks/run_benchmarks.py --baseline baseline.json --threshold 0.25
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from Autodiff43.logic.forward_mode import FMExpression
+from Autodiff43.logic.reverse_mode import RMExpression
+
+ENGINES = {'forward': FMExpression, 'reverse': RMExpression}
+
+def deep_chain(cls, n):
+    """A chain of n nodes depending on a single scalar leaf."""
+    x = cls(0.5, "x")
+    f = x
+    for _ in range(n):
+        f = (f * 0.999).sin() + 0.001
+    return f, ["x"]
+
+def wide_fan_in(cls, n):
+    """The sum of a nonlinear function of n distinct scalar leaves."""
+    names = [f"x{i}" for i in range(n)]
+    f = 0
+    for i, name in enumerate(names):
+        f = cls(0.1 * i, name).tanh() + f
+    return f, names
+
+def shared_dag(cls, n):
+    """n layers of two nodes, each reusing both nodes of the layer before."""
+    a = cls(0.3, "a")
+    b = cls(0.7, "b")
+    for _ in range(n):
+        a, b = (a * b).sin(), (a + b) * 0.5
+    return a + b, ["a", "b"]
+
+def long_vector(cls, n):
+    """A few elementwise ops on a single vector leaf of length n."""
+    x = cls(np.linspace(0.1, 1.0, n), "x")
+    f = (x * x).exp() / (x + 1) + x.sin() * x.cos() - x.log()
+    return f, ["x"]
+
+def wide_vector(cls, n):
+    """The sum of n elementwise functions of one vector leaf of length 10000."""
+    x = cls(np.linspace(0.1, 1.0, 10000), "x")
+    f = 0
+    for i in range(n):
+        f = (x * (1 + 0.001 * i)).sin() * 0.5 + f
+    return f, ["x"]
+
+SCENARIOS = {
+    'deep_chain': deep_chain,
+    'wide_fan_in': wide_fan_in,
+    'shared_dag': shared_dag,
+    'long_vector': long_vector,
+    'wide_vector': wide_vector,
+}
+
+DEFAULT_SIZES = {
+    'deep_chain': [100, 1000, 5000],
+    'wide_fan_in': [100, 500, 1000],
+    'shared_dag': [100, 1000, 5000],
+    'long_vector': [1000, 10000, 100000],
+    'wide_vector': [10, 50, 200],
+}
+
+def extract_gradient(engine, f, names):
+    """Reads the derivative of f with respect to every name."""
+    if (engine == 'forward'):
+        return [FMExpression.grad(f, name) for name in names]
+
+    f.backward_scalar()
+    return [f.jacobian[name] for name in names]
+
+def _new_blocks(before, after):
+    """The number of memory blocks allocated between two tracemalloc snapshots and still held at the second."""
+    ignore = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    stats = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), 'lineno')
+    return sum(max(stat.count_diff, 0) for stat in stats)
+
+def run_case(scenario, engine, n, repeat):
+    """
+    Benchmarks one scenario, engine and size
+    Returns:
+        a result dictionary with the best build, gradient and repeated gradient times over repeat runs, the peak memory,
+        and the blocks allocated by the first and the repeated gradient extraction
+    """
+    build = SCENARIOS[scenario]
+    cls = ENGINES[engine]
+
+    build_times = []
+    grad_times = []
+    regrad_times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        f, names = build(cls, n)
+        middle = time.perf_counter()
+        extract_gradient(engine, f, names)
+        end = time.perf_counter()
+        # The same graph again, e.g. reusing the adjoint buffers of the first reverse sweep
+        extract_gradient(engine, f, names)
+        build_times.append(middle - start)
+        grad_times.append(end - middle)
+        regrad_times.append(time.perf_counter() - end)
+        del f
+
+    tracemalloc.start()
+    f, names = build(cls, n)
+    extract_gradient(engine, f, names)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del f
+
+    # Snapshots allocate memory themselves, so blocks are counted in a separate run
+    tracemalloc.start()
+    f, names = build(cls, n)
+    before = tracemalloc.take_snapshot()
+    extract_gradient(engine, f, names)
+    middle = tracemalloc.take_snapshot()
+    extract_gradient(engine, f, names)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    return {
+        'scenario': scenario,
+        'engine': engine,
+        'size': n,
+        'build_time': min(build_times),
+        'grad_time': min(grad_times),
+        'regrad_time': min(regrad_times),
+        'peak_bytes': peak,
+        'grad_blocks': _new_blocks(before, middle),
+        'regrad_blocks': _new_blocks(middle, after),
+    }
+
+def run(scenarios, engines, sizes = None, repeat = 3, log = None):
+    """
+    Runs every combination of scenario, engine and size
+    Returns:
+        the results document, ready to be written as JSON
+    """
+    results = []
+    for scenario in scenarios:
+        for n in (sizes or DEFAULT_SIZES[scenario]):
+            for engine in engines:
+                result = run_case(scenario, engine, n, repeat)
+                results.append(result)
+                if (log is not None):
+                    log(f"{scenario:12s} {engine:8s} n={n:<8d} build={result['build_time']:.4f}s grad={result['grad_time']:.4f}s regrad={result['regrad_time']:.4f}s peak={result['peak_bytes'] / 1e6:.1f}MB blocks={result['grad_blocks']}/{result['regrad_blocks']}")
+
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'repeat': repeat,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+
+def compare(current, baseline, threshold = 0.25, min_time = 1e-3, min_blocks = 20,
+            metrics = ('build_time', 'grad_time', 'regrad_time', 'peak_bytes', 'grad_blocks', 'regrad_blocks')):
+    """
+    Compares a run against a baseline
+    Args:
+        current, baseline: results documents produced by run
+        threshold: relative increase above which a metric counts as a regression
+        min_time: timings below this many seconds in both runs are too noisy to compare
+        min_blocks: block counts below this in both runs are too small to compare
+        metrics: the result fields to compare
+    Returns:
+        a list of regressions, each a dictionary with the case, metric, baseline and current values
+    """
+    def key(result):
+        return (result['scenario'], result['engine'], result['size'])
+
+    base = {key(r): r for r in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        old = base.get(key(result))
+        if (old is None):
+            continue
+        for metric in metrics:
+            # Baselines written before a metric was added do not have it
+            if (metric not in old or metric not in result):
+                continue
+            if (metric.endswith('_time') and max(old[metric], result[metric]) < min_time):
+                continue
+            if (metric.endswith('_blocks') and max(old[metric], result[metric]) < min_blocks):
+                continue
+            if (old[metric] > 0 and result[metric] > old[metric] * (1 + threshold)):
+                regressions.append({
+                    'scenario': result['scenario'],
+                    'engine': result['engine'],
+                    'size': result['size'],
+                    'metric': metric,
+                    'baseline': old[metric],
+                    'current': result[metric],
+                    'ratio': result[metric] / old[metric],
+                })
+    return regressions
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = __doc__.strip().splitlines()[0])
+    parser.add_argument('--scenarios', nargs = '+', choices = sorted(SCENARIOS), default = sorted(SCENARIOS))
+    parser.add_argument('--engines', nargs = '+', choices = sorted(ENGINES), default = sorted(ENGINES))
+    parser.add_argument('--sizes', nargs = '+', type = int, help = 'sizes to run for every scenario (default: per-scenario sizes)')
+    parser.add_argument('--repeat', type = int, default = 3, help = 'runs per case, the best time is kept')
+    parser.add_argument('--output', help = 'write the results as JSON to this file')
+    parser.add_argument('--baseline', help = 'compare against a results file written by an earlier run')
+    parser.add_argument('--threshold', type = float, default = 0.25, help = 'relative slowdown that counts as a regression')
+    parser.add_argument('--min-time', type = float, default = 1e-3, help = 'ignore timings below this many seconds when comparing')
+    parser.add_argument('--min-blocks', type = int, default = 20, help = 'ignore block counts below this when comparing')
+    args = parser.parse_args(argv)
+
+    results = run(args.scenarios, args.engines, args.sizes, args.repeat, log = print)
+
+    if (args.output):
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent = 2)
+
+    if (args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, args.min_time, args.min_blocks)
+        for r in regressions:
+            print(f"REGRESSION {r['scenario']} {r['engine']} n={r['size']} {r['metric']}: {r['baseline']:.4g} -> {r['current']:.4g} ({r['ratio']:.2f}x)")
+        if (regressions):
+            return 1
+        print("No regressions.")
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())